@@ -1,291 +1,1112 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 import requests
 import json
+import os
 import time
+import atexit
+import sqlite3
 import random
 import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, FIRST_COMPLETED, wait
 from datetime import datetime
+from urllib.parse import urlencode, urlsplit
 from user_agents import get_random_user_agent
 from proxy_manager import proxy_manager
+from session_pool import session_pool
+from rate_limiter import rate_limiter, DIRECT
+from poll_scheduler import poll_scheduler
+from change_tracker import change_tracker, ChangeEvent
+from stock_stream import stock_stream
+from stream_server import StreamServer
+from response_cache import stock_cache, PageCache
+from static_assets import static_assets
+from history_store import HistoryStore
+from state_store import state_store, model_flights, StockSnapshot
+from async_checker import AsyncStockChecker, QueryJob, httpx
+from sku_registry import SkuRegistry, round_robin
+from pickup_parser import pickup_parser
+from notifier import notifier
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from structured_log import configure_logging, get_logger, LEVELS as LOG_LEVELS
+from shared_state import SnapshotWriter, SnapshotFollower
+from stock_matrix import StockMatrixWriter
+from retry_policy import retry_policy, classify_failure, retry_after_seconds
+from stock_index import stock_index
+from hedging import hedge_policy
+from sweep import sweep_manager, CANCELLED
+from cluster import ClusterCoordinator, default_node_id
 
-app = Flask(__name__)
+# 静态文件由 /assets/ 提供（带内容指纹与预压缩版本），不使用 Flask 默认的 /static/
+app = Flask(__name__, static_folder=None)
+app.jinja_env.globals['asset_url'] = static_assets.url
 
 # 添加自定义模板过滤器
 @app.template_filter('to_json')
 def to_json(value):
     return json.dumps(value)
 
-# Apple 库存查询 API 端点
-API_ENDPOINT = "https://www.apple.com/hk/shop/pickup-message-recommendations"
-
-# iPhone 17 Pro Max 的产品型号代码
-IPHONE_17_PRO_MAX_MODELS = {
-    "iPhone 17 Pro Max 256GB - 宇宙橙": "MFYN4ZA/A",
-    "iPhone 17 Pro Max 512GB - 宇宙橙": "MFYT4ZA/A",
-    "iPhone 17 Pro Max   1TB - 宇宙橙": "MFYW4ZA/A",
-    "iPhone 17 Pro Max   2TB - 宇宙橙": "MG004ZA/A",
-    "iPhone 17 Pro Max 256GB - 深墨蓝": "MFYP4ZA/A",
-    "iPhone 17 Pro Max 512GB - 深墨蓝": "MFYU4ZA/A",
-    "iPhone 17 Pro Max   1TB - 深墨蓝": "MFYX4ZA/A",
-    "iPhone 17 Pro Max   2TB - 深墨蓝": "MG014ZA/A",
-    "iPhone 17 Pro Max 256GB -    银": "MFYM4ZA/A",
-    "iPhone 17 Pro Max 512GB -    银": "MFYQ4ZA/A",
-    "iPhone 17 Pro Max   1TB -    银": "MFYV4ZA/A",
-    "iPhone 17 Pro Max   2TB -    银": "MFYY4ZA/A",
-    "iPhone 17 Pro 256GB - 宇宙橙": "MG8H4ZA/A",
-    "iPhone 17 Pro 512GB - 宇宙橙": "MG8M4ZA/A",
-    "iPhone 17 Pro   1TB - 宇宙橙": "MG8Q4ZA/A",
-    "iPhone 17 Pro 256GB - 深墨蓝": "MG8J4ZA/A",
-    "iPhone 17 Pro 512GB - 深墨蓝": "MG8N4ZA/A",
-    "iPhone 17 Pro   1TB - 深墨蓝": "MG8R4ZA/A",
-    "iPhone 17 Pro 256GB -    银": "MG8G4ZA/A",
-    "iPhone 17 Pro 512GB -    银": "MG8K4ZA/A",
-    "iPhone 17 Pro   1TB -    银": "MG8P4ZA/A",
-}
+# 型号目录：地区（接口地址、语言、查询位置）与产品从 catalog.json 加载
+# APPLE_API_BASE 可把所有地区指向本地模拟接口，STOCK_REGIONS 指定同时监控的地区（如 hk,mo,cn）
+API_BASE = os.environ.get("APPLE_API_BASE")
+CATALOG_PATH = os.environ.get("STOCK_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+registry = SkuRegistry.load(
+    CATALOG_PATH,
+    api_base=API_BASE,
+    regions=[code.strip() for code in os.environ.get("STOCK_REGIONS", "").split(",") if code.strip()] or None,
+)
+
+# 默认地区的查询端点
+API_ENDPOINT = registry.endpoint(registry.default_region)
+# 批量查询端点 - 一次请求可携带多个型号代码 (parts.0, parts.1, ...)
+BATCH_API_ENDPOINT = registry.endpoint(registry.default_region, batch=True)
+
+# 所有启用地区的型号名称 -> 型号代码
+IPHONE_17_PRO_MAX_MODELS = registry.model_codes
 
 # 型号的容量列表
-CAPACITIES = ["256GB", "512GB", "1TB", "2TB"]
+CAPACITIES = registry.capacities
 
 # 型号的颜色列表
-COLORS = ["宇宙橙", "深墨蓝", "银色"]
-
-# 将型号按系列、颜色和容量分组
-MODEL_DETAILS = {
-    "iPhone 17 Pro Max": {
-        "宇宙橙": {
-            "256GB": "iPhone 17 Pro Max 256GB - 宇宙橙",
-            "512GB": "iPhone 17 Pro Max 512GB - 宇宙橙",
-            "1TB": "iPhone 17 Pro Max   1TB - 宇宙橙",
-            "2TB": "iPhone 17 Pro Max   2TB - 宇宙橙"
-        },
-        "深墨蓝": {
-            "256GB": "iPhone 17 Pro Max 256GB - 深墨蓝",
-            "512GB": "iPhone 17 Pro Max 512GB - 深墨蓝",
-            "1TB": "iPhone 17 Pro Max   1TB - 深墨蓝",
-            "2TB": "iPhone 17 Pro Max   2TB - 深墨蓝"
-        },
-        "银色": {
-            "256GB": "iPhone 17 Pro Max 256GB -    银",
-            "512GB": "iPhone 17 Pro Max 512GB -    银",
-            "1TB": "iPhone 17 Pro Max   1TB -    银",
-            "2TB": "iPhone 17 Pro Max   2TB -    银"
-        }
-    },
-    "iPhone 17 Pro": {
-        "宇宙橙": {
-            "256GB": "iPhone 17 Pro 256GB - 宇宙橙",
-            "512GB": "iPhone 17 Pro 512GB - 宇宙橙",
-            "1TB": "iPhone 17 Pro   1TB - 宇宙橙"
-        },
-        "深墨蓝": {
-            "256GB": "iPhone 17 Pro 256GB - 深墨蓝",
-            "512GB": "iPhone 17 Pro 512GB - 深墨蓝",
-            "1TB": "iPhone 17 Pro   1TB - 深墨蓝"
-        },
-        "银色": {
-            "256GB": "iPhone 17 Pro 256GB -    银",
-            "512GB": "iPhone 17 Pro 512GB -    银",
-            "1TB": "iPhone 17 Pro   1TB -    银"
-        }
-    }
-}
+COLORS = registry.colors
+
+# 默认地区的型号按系列、颜色和容量分组
+MODEL_DETAILS = registry.model_details[registry.default_region]
 
 # 系列支持的容量
-SERIES_CAPACITIES = {
-    "iPhone 17 Pro Max": ["256GB", "512GB", "1TB", "2TB"],
-    "iPhone 17 Pro": ["256GB", "512GB", "1TB"]
-}
+SERIES_CAPACITIES = registry.series_capacities
 
 # 提取所有型号
-ALL_MODELS = []
-for series, colors in MODEL_DETAILS.items():
-    for color, capacities in colors.items():
-        for capacity, model in capacities.items():
-            ALL_MODELS.append(model)
-
-# 全局变量存储最新的库存数据
-stock_data = {}
-last_updated = {}
-is_checking = {}
-model_checking_status = {}
+ALL_MODELS = [sku.key for sku in registry.skus]
+
+# 型号在目录中的位置，按门店查询有货型号时按目录顺序返回
+MODEL_ORDER = {model_name: index for index, model_name in enumerate(ALL_MODELS)}
+
+# 最新的库存数据保存在 state_store 的不可变快照中（库存、更新时间、检查状态）
 
 # 默认配置参数
 CONFIG = {
     'refresh_interval': 3,  # 默认刷新间隔（秒）
-    'request_delay': 0.5,  # 请求间隔（秒）- 每次请求后等待的时间
+    'request_delay': 0.5,  # 请求间隔（秒）- 同一出口（直连或某个代理）相邻请求的最小间隔
+    'rate_limit_per_second': 2.0,  # 每个出口每秒允许的请求数，与 request_delay 互为倒数
+    'rate_limit_tokens': 1,  # 每个出口允许的突发请求数（令牌桶容量）
     'batch_size': 5,  # 批次大小 - 每批处理的型号数量
     'use_proxy': False,  # 是否使用代理
-    'proxy_list': []  # 代理服务器列表
+    'proxy_list': [],  # 代理服务器列表
+    'batched_query': True,  # 是否将多个型号合并到一个请求中查询
+    'max_url_length': 2000,  # 批量查询时单个请求URL的最大长度
+    'engine': 'thread',  # 检查引擎: thread (每个请求一个线程) 或 async (单事件循环协程)
+    'session_pool_size': 10,  # 每个代理会话保持的最大连接数
+    'session_idle_timeout': 300,  # 会话空闲多久后关闭（秒）
+    'adaptive_polling': True,  # 是否按型号自适应调度查询频率
+    'request_budget_per_minute': 120,  # 自适应调度下每分钟最多发出的请求数
+    'max_poll_interval': 600,  # 长时间无货的型号退避后的最大查询间隔（秒）
+    'hedge_requests': False,  # 请求超过对冲阈值（最近耗时的 p90）仍未返回时经另一个出口再发一次
+    'hedge_quantile': 0.9,  # 对冲阈值取最近成功请求耗时的哪个分位数
+    'hedge_max_ratio': 0.1,  # 最近一分钟内对冲请求数占请求总数的比例上限
+    'sweep_deadline': 30,  # 每轮查询的时限（秒），超过后不再发出新请求，未查询的型号留到下一轮
+    'allow_overlapping_sweeps': False,  # 是否允许上一轮查询未结束时开始新一轮
+    'history_enabled': os.environ.get("STOCK_HISTORY_ENABLED", "1") != "0",  # 是否持久化库存历史
+    'history_db': os.environ.get("STOCK_HISTORY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock_history.db")),
+    'history_record_all': False,  # True 时记录每次观测，False 时只记录状态变化
+    'notify_config': os.environ.get("STOCK_NOTIFY_CONFIG"),  # 补货通知的渠道与订阅配置文件（JSON），为空时不加载
+    'log_level': os.environ.get("STOCK_LOG_LEVEL", "INFO").upper(),  # 日志级别: DEBUG/INFO/WARNING/ERROR/OFF
+    # 运行角色: standalone (单进程，python app.py)、poller (唯一的查询进程)、web (只读的 Web 工作进程)
+    'role': os.environ.get("STOCK_ROLE", "standalone"),
+    'shared_state_path': os.environ.get("STOCK_SHARED_STATE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock_state.json")),
+    'poller_url': os.environ.get("STOCK_POLLER_URL", "http://127.0.0.1:5001"),  # web 进程转发写操作的查询进程地址
+    # 内存映射的库存矩阵文件，供其他进程直接读取；poller 模式默认开启，其他模式设置环境变量后开启
+    'matrix_path': os.environ.get("STOCK_MATRIX_PATH") or (
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock_matrix.bin")
+        if os.environ.get("STOCK_ROLE") == "poller" else None),
+    # 集群模式的协调库（SQLite 文件），多个查询节点指向同一个文件时按租约分担型号；为空时不启用
+    'cluster_db': os.environ.get("STOCK_CLUSTER_DB"),
+    'node_id': os.environ.get("STOCK_NODE_ID") or default_node_id(),  # 集群中本节点的标识
+    'node_url': os.environ.get("STOCK_NODE_URL"),  # 本节点对外的访问地址，刷新其他节点负责的型号时返回给调用方
+    'cluster_lease_seconds': float(os.environ.get("STOCK_CLUSTER_LEASE", "15")),  # 租约时长（秒），节点失联后其型号在此时间后被接手
+    # SSE 推送服务的监听地址（host:port），设置后 /api/stream 由事件循环提供并把原路由重定向过去；为空时由 Flask 直接推送
+    'stream_bind': os.environ.get("STOCK_STREAM_BIND"),
+    'stream_url': os.environ.get("STOCK_STREAM_URL"),  # 浏览器访问推送服务的地址，默认取页面主机名加推送端口
 }
 
-# 请求时间控制
-last_request_time = time.time()
-request_lock = threading.Lock()
-
-def delay_request():
-    """控制请求间隔"""
-    global last_request_time
-    with request_lock:
-        current_time = time.time()
-        elapsed = current_time - last_request_time
-        if elapsed < CONFIG['request_delay']:
-            time.sleep(CONFIG['request_delay'] - elapsed)
-        last_request_time = time.time()
-
-def check_stock_for_model(model_name, model_code, batch_mode=False, max_retries=2):
-    """为指定型号检查库存
+# 只属于本进程、不随共享快照同步的配置项
+LOCAL_CONFIG_KEYS = ('role', 'shared_state_path', 'poller_url', 'history_db', 'notify_config', 'matrix_path',
+                     'cluster_db', 'node_id', 'node_url', 'cluster_lease_seconds', 'stream_bind', 'stream_url')
+
+# 结构化日志，STOCK_LOG_FORMAT=json 时每行输出一个 JSON 对象
+configure_logging(CONFIG['log_level'])
+log = get_logger("app")
+
+# 按默认配置初始化速率限制器与会话池
+rate_limiter.configure(rate_per_second=CONFIG['rate_limit_per_second'], burst=CONFIG['rate_limit_tokens'])
+session_pool.configure(pool_size=CONFIG['session_pool_size'], idle_timeout=CONFIG['session_idle_timeout'])
+hedge_policy.configure(quantile=CONFIG['hedge_quantile'], max_ratio=CONFIG['hedge_max_ratio'])
+poll_scheduler.configure(base_interval=CONFIG['refresh_interval'], max_interval=CONFIG['max_poll_interval'],
+                         budget_per_minute=CONFIG['request_budget_per_minute'])
+
+# 集群模式下各查询节点按租约分担型号，调度器只登记本节点持有租约的型号；web 进程不参与
+cluster = ClusterCoordinator(CONFIG['cluster_db'], CONFIG['node_id'], ALL_MODELS,
+                             lease_seconds=CONFIG['cluster_lease_seconds'], url=CONFIG['node_url']) \
+    if CONFIG['cluster_db'] and CONFIG['role'] != 'web' else None
+if cluster is None:
+    poll_scheduler.register(IPHONE_17_PRO_MAX_MODELS)
+
+# 库存历史存储，关闭时为 None
+history_store = HistoryStore(CONFIG['history_db'], record_all=CONFIG['history_record_all']) if CONFIG['history_enabled'] else None
+
+# 加载补货通知的渠道与订阅（web 进程不发送通知）
+if CONFIG['notify_config'] and CONFIG['role'] != 'web':
+    notifier.load_file(CONFIG['notify_config'])
+
+# 异步检查引擎，首次使用时创建
+async_engine = None
+async_engine_lock = threading.Lock()
+
+# 运行指标，通过 /metrics 以 Prometheus 格式输出
+UPSTREAM_LATENCY = metrics.histogram(
+    "stock_upstream_request_seconds", "上游库存接口请求耗时", ["proxy", "outcome"])
+RATE_LIMIT_WAIT = metrics.histogram(
+    "stock_rate_limit_wait_seconds", "发送请求前等待速率限制（delay_request）的时间", ["proxy"],
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+SWEEP_DURATION = metrics.histogram(
+    "stock_sweep_seconds", "一轮查询从开始到全部结果发布的耗时", ["engine"])
+SWEEPS = metrics.counter("stock_sweeps_total", "查询轮数，按结束状态（refused 为因上一轮未结束而跳过）", ["outcome"])
+HEDGES = metrics.counter("stock_hedged_requests_total", "对冲请求数，按对冲请求是否先返回", ["outcome"])
+RETRIES = metrics.counter("stock_retries_total", "查询重试次数", ["engine"])
+ERRORS = metrics.counter("stock_errors_total", "查询失败次数，按失败类型", ["kind"])
+
+def last_updated_ages():
+    """各型号距上次更新的秒数"""
+    now = datetime.now()
+    ages = {}
+    for model, updated in state_store.snapshot().last_updated.items():
+        try:
+            ages[(model,)] = round((now - datetime.strptime(updated, "%Y-%m-%d %H:%M:%S")).total_seconds(), 3)
+        except (TypeError, ValueError):
+            continue
+    return ages
+
+metrics.gauge("stock_sweeps_running", "进行中的查询轮数", function=lambda: len(sweep_manager.running()))
+metrics.gauge("stock_models_in_flight", "正在查询中的型号数", function=lambda: len(model_flights.in_flight()))
+metrics.gauge("stock_scheduler_due_models", "已到期等待查询的型号数", function=lambda: poll_scheduler.due_count())
+metrics.gauge("stock_history_pending_writes", "等待写入库存历史的记录数",
+              function=lambda: history_store.pending if history_store is not None else 0)
+metrics.gauge("stock_notify_queue_depth", "等待投递的补货通知数", function=lambda: notifier.get_status()["queue_depth"])
+metrics.gauge("stock_stream_subscribers", "SSE 订阅者数", function=lambda: stock_stream.subscribers)
+metrics.gauge("stock_retry_cooldown_seconds", "整体被限流后全局冷却的剩余秒数", function=lambda: retry_policy.cooldown_remaining())
+metrics.gauge("stock_hedge_threshold_seconds", "当前的对冲阈值", function=lambda: hedge_policy.threshold())
+metrics.gauge("stock_cluster_owned_models", "集群模式下本节点持有租约的型号数",
+              function=lambda: len(cluster.owned()) if cluster is not None else len(IPHONE_17_PRO_MAX_MODELS))
+metrics.gauge("stock_last_updated_age_seconds", "各型号距上次成功更新的秒数", ["model"], function=last_updated_ages)
+
+def proxy_label(identity):
+    """指标中使用的出口名称，去掉代理地址中的用户名和密码"""
+    if not identity or identity == DIRECT:
+        return DIRECT
+    parts = urlsplit(identity)
+    return f"{parts.scheme}://{parts.hostname}:{parts.port}" if parts.hostname else identity
+
+def sweep_sleep(seconds, sweep=None):
+    """等待 seconds 秒；属于某一轮查询时不超过其截止时间、取消时立即返回，返回之后是否仍可发出请求"""
+    if sweep is None:
+        time.sleep(seconds)
+        return True
+    return sweep.sleep(seconds)
+
+def delay_request(proxies=None, sweep=None):
+    """按出口身份控制请求速率，每个代理（或直连）使用独立的令牌桶；出口被限流暂停或全局冷却时先等待
     
     参数:
-        model_name: 型号名称
-        model_code: 型号代码
-        batch_mode: 是否为批量模式 (如果是，则失败时会重试而不是立即返回错误)
-        max_retries: 最大重试次数
+        proxies: 本次请求使用的代理，None 表示直连
+        sweep: 所属的查询轮次，各段等待都不超过其截止时间
+    
+    返回:
+        是否可以发送；所属轮次在等待期间被取消或到期时返回 False，调用方不再发送
     """
-    # 使用随机用户代理
-    headers = {
+    identity = proxies["https"] if proxies else DIRECT
+    pause = retry_policy.identity_wait(identity)
+    if pause > 0 and not sweep_sleep(pause, sweep):
+        return False
+    wait = rate_limiter.reserve(identity)
+    RATE_LIMIT_WAIT.observe(pause + wait, proxy=proxy_label(identity))
+    if wait > 0 and not sweep_sleep(wait, sweep):
+        return False
+    return sweep is None or not sweep.should_stop()
+
+class ObservedRateLimiter:
+    """把预约等待时间记入指标的速率限制器包装，供异步引擎使用"""
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    def reserve(self, identity=DIRECT):
+        wait = retry_policy.identity_wait(identity) + self._limiter.reserve(identity)
+        RATE_LIMIT_WAIT.observe(wait, proxy=proxy_label(identity))
+        return wait
+
+observed_rate_limiter = ObservedRateLimiter(rate_limiter)
+
+def begin_sweep(engine, model_names, task_count, reason):
+    """登记一轮查询；已有查询未结束且不允许重叠时返回 None"""
+    sweep = sweep_manager.begin(engine, model_names, task_count, deadline_seconds=CONFIG['sweep_deadline'],
+                                reason=reason, allow_overlap=CONFIG['allow_overlapping_sweeps'])
+    if sweep is None:
+        SWEEPS.inc(outcome="refused")
+        log.debug("上一轮查询尚未结束，跳过本轮", engine=engine, reason=reason)
+    return sweep
+
+def finish_sweep(sweep, held=False):
+    """结束一轮查询：记录耗时与结果，没有查询到的型号交给调度器尽快重新安排
+    
+    参数:
+        sweep: 查询轮次
+        held: 未发布的型号是否仍由本轮占用（异步引擎在开始时占用全部型号并标记为检查中）
+    """
+    skipped = sweep.finish()
+    if skipped and held:
+        model_flights.release(skipped)
+        state_store.set_checking(skipped, False)
+        notify_shared_state()
+    if skipped and CONFIG['adaptive_polling']:
+        poll_scheduler.defer(skipped)
+    sweep_manager.end(sweep)
+    SWEEP_DURATION.observe(sweep.finished_at - sweep.started_at, engine=sweep.engine)
+    SWEEPS.inc(outcome=sweep.state)
+    log.info("查询结束", sweep=sweep.id, engine=sweep.engine, state=sweep.state, published=sweep.published,
+             errors=sweep.errors, skipped=len(skipped), seconds=round(sweep.finished_at - sweep.started_at, 3))
+
+def run_sweep_task(target, args, sweep):
+    """在查询线程中执行一个任务并报告完成"""
+    try:
+        target(*args)
+    finally:
+        sweep.task_done()
+
+def build_request_headers(region=None):
+    """构造请求头，每次使用随机用户代理
+    
+    参数:
+        region: 地区代码，决定 Referer 与 Accept-Language，默认取默认地区
+    """
+    region = registry.regions[region or registry.default_region]
+    return {
         "User-Agent": get_random_user_agent(),
         "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Accept-Language": region.accept_language,
         "Accept-Encoding": "gzip, deflate, br",
         "Connection": "keep-alive",
-        "Referer": "https://www.apple.com/hk/shop/buy-iphone/",
+        "Referer": f"{region.site}{region.path}/shop/buy-iphone/",
     }
+
+def get_session(proxies):
+    """借出代理对应的持久会话（上下文管理器），proxies 为 None 时使用直连会话"""
+    return session_pool.session(proxies["https"] if proxies else None)
+
+def fleet_size():
+    """当前可用的出口数量，重试策略据此判断是否整体被限流"""
+    return max(len(proxy_manager.get_proxy_list()), 1) if CONFIG['use_proxy'] else 1
+
+def report_request_result(proxies, started, error=None):
+    """记录一次上游请求的结果：耗时与失败类型计入指标与重试策略，经代理发出的请求同时计入代理健康统计"""
+    error_kind = classify_failure(error) if error is not None else None
+    identity = proxies["https"] if proxies else DIRECT
+    UPSTREAM_LATENCY.observe(time.time() - started, proxy=proxy_label(identity), outcome=error_kind or "ok")
+    hedge_policy.record_request(time.time() - started if error is None else None)
+    if error_kind is not None:
+        ERRORS.inc(kind=error_kind)
+    retry_policy.observe(identity, error_kind, retry_after_seconds(error) if error is not None else None, fleet_size())
+    if not proxies:
+        return
+    if error is None:
+        proxy_manager.record_result(proxies["https"], latency=time.time() - started)
+        return
+    # 只有收到了响应（HTTP 错误）时耗时才有意义
+    latency = time.time() - started if error_kind.startswith("http_") else None
+    proxy_manager.record_result(proxies["https"], latency=latency, error_kind=error_kind)
+
+def report_request_cancelled(proxies):
+    """请求被取消或未发出、没有结果：不计入统计，只释放代理上的半开探测"""
+    if proxies:
+        proxy_manager.release_probe(proxies["https"])
+
+def send_request(url, params, headers, proxies, timeout=10):
+    """发送请求并记录代理健康统计，HTTP 错误状态码会抛出异常"""
+    started = time.time()
+    try:
+        with get_session(proxies) as session:
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        report_request_result(proxies, started, e)
+        raise
+    report_request_result(proxies, started)
+    return response
+
+# 批次大小（并发上限）允许设置的最大值
+MAX_BATCH_SIZE = 20
+
+# 线程引擎发送对冲请求用的线程池；只在开启 hedge_requests 后由查询进程（含单进程模式）首次对冲时创建
+hedge_executor = None
+hedge_executor_lock = threading.Lock()
+
+def get_hedge_executor():
+    """获取（必要时创建）对冲线程池
+    每个并发查询最多同时占用主请求与对冲请求两个线程，线程数按并发上限的最大值（MAX_BATCH_SIZE）的两倍设置，
+    运行中调整 batch_size 时无需重建；线程按需创建，并发较小时不会启动多余的线程
+    """
+    global hedge_executor
+    with hedge_executor_lock:
+        if hedge_executor is None:
+            hedge_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_SIZE * 2, thread_name_prefix="hedge")
+        return hedge_executor
+
+def report_hedge_result(won):
+    """记录一次对冲的结果，won 表示对冲请求先于主请求返回"""
+    HEDGES.inc(outcome="won" if won else "lost")
+    if won:
+        hedge_policy.record_win()
+
+def get_hedge_proxy(exclude):
+    """对冲请求使用的代理：避开主请求的代理，没有其他健康代理时返回 None"""
+    return proxy_manager.get_random_proxy(exclude=exclude)
+
+def send_hedge(url, params, headers, proxies, timeout=10, sweep=None):
+    """经对冲出口发送请求，同样遵守该出口的速率限制；等待期间所属轮次停止时不再发送，返回 None"""
+    if not delay_request(proxies, sweep):
+        report_request_cancelled(proxies)
+        return None
+    return send_request(url, params, headers, proxies, timeout)
+
+def close_response(future):
+    """丢弃落后一方的响应，把连接还给连接池；未发出的对冲请求没有响应"""
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
+
+def send_hedged_request(url, params, headers, proxies, timeout=10, sweep=None):
+    """发送请求；开启对冲时，超过对冲阈值仍未返回则经另一个出口再发一次，先返回有效响应的一方胜出
+    
+    参数:
+        url, params, headers: 请求地址、查询参数与请求头
+        proxies: 主请求使用的代理（已通过 delay_request 预约发送时间）
+        timeout: 单个请求的超时（秒）
+        sweep: 所属的查询轮次，对冲请求的速率限制等待不超过其截止时间
+    """
+    if not CONFIG['hedge_requests']:
+        return send_request(url, params, headers, proxies, timeout)
+    
+    executor = get_hedge_executor()
+    primary = executor.submit(send_request, url, params, headers, proxies, timeout)
+    try:
+        return primary.result(timeout=hedge_policy.threshold())
+    except FutureTimeout:
+        pass
+    
+    # 没有其他代理时经同一出口发送，会话会为它使用另一条连接；
+    # 该出口被限流暂停或处于全局冷却时不对冲，只等待主请求
+    hedge_proxies = (get_hedge_proxy(proxies["https"]) if proxies else None) or proxies
+    if retry_policy.identity_wait(hedge_proxies["https"] if hedge_proxies else DIRECT) > 0 \
+            or not hedge_policy.try_hedge():
+        return primary.result()
+    hedge = executor.submit(send_hedge, url, params, headers, hedge_proxies, timeout, sweep)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = None
+        for future in done:
+            if future.exception() is not None:
+                # 两个请求都失败时抛出主请求的错误
+                if error is None or future is primary:
+                    error = future.exception()
+            elif future.result() is not None and winner is None:
+                winner = future
+        if winner is not None:
+            # 线程中的请求无法中断，落后的一方返回后丢弃其响应
+            for future in pending:
+                future.add_done_callback(close_response)
+            report_hedge_result(winner is hedge)
+            return winner.result()
+    raise error
+
+def check_stock_for_model(model_name, model_code, batch_mode=False, max_retries=2, sweep=None):
+    """为指定型号检查库存
+    
+    参数:
+        model_name: 型号名称
+        model_code: 型号代码
+        batch_mode: 是否为批量模式 (如果是，则失败时按重试策略重试而不是立即返回错误)
+        max_retries: 最大重试次数
+        sweep: 所属的查询轮次，取消或超过截止时间后不再重试，请求超时也不超过截止时间
+    """
+    region = registry.region_of(model_name)
+    headers = build_request_headers(region.code)
     
     params = {
         "product": model_code,
-        "location": "Hong Kong",
+        "location": region.location,
     }
     
     for attempt in range(max_retries + 1):
         try:
-            # 简单延迟机制控制请求速率
-            delay_request()
-            
             # 获取代理（如果启用）
             proxies = proxy_manager.get_random_proxy() if CONFIG['use_proxy'] else None
             
-            # 发送请求，可选使用代理
-            response = requests.get(API_ENDPOINT, params=params, headers=headers, proxies=proxies, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            stores_data = data.get("body", {}).get("PickupMessage", {}).get("stores", [])
-            
-            if not stores_data:
-                if batch_mode and attempt < max_retries:
-                    # 在批量模式下，如果还有重试次数，休息一下再重试
-                    time.sleep(1.0 + random.random())
-                    continue
-                return {"error": "未能获取库存信息"}
+            # 按代理的令牌桶控制请求速率；等待期间本轮被取消或到期时不再发送
+            if not delay_request(proxies, sweep):
+                report_request_cancelled(proxies)
+                return {"error": "查询轮次已停止"}
             
-            stores_availability = []
-            for store in stores_data:
-                store_name = store.get("storeName")
-                parts_availability = store.get("partsAvailability", {})
-                
-                
-                if parts_availability:
-                    model_stock_info = parts_availability.get(model_code)
-                    pickup_status = model_stock_info.get("pickupSearchQuote", "未知状态")
-                    pickup_display = model_stock_info.get("pickupDisplay", "unknown")
-                    stores_availability.append({
-                        "store": store_name,
-                        "status": pickup_status,
-                        "available": pickup_display == "available"
-                    })
-                else:
-                    stores_availability.append({
-                        "store": store_name,
-                        "status": "unknown",
-                        "available": False
-                    })
+            # 发送请求，按代理复用持久会话的连接
+            response = send_hedged_request(registry.endpoint(region.code), params, headers, proxies,
+                                           sweep.request_timeout(10) if sweep else 10, sweep)
+            # 直接从响应体字节解码，只取出需要的字段；门店不含该型号时记为 unknown
+            stores_availability = pickup_parser.parse_single(response.content, model_code)
             
-            # 如果成功处理了数据，返回结果
-            return stores_availability
+            if stores_availability:
+                # 如果成功处理了数据，返回结果
+                return stores_availability
+            ERRORS.inc(kind="empty_response")
+            kind, error_message = "empty_response", "未能获取库存信息"
             
         except Exception as e:
-            if batch_mode and attempt < max_retries:
-                # 在批量模式下，如果还有重试次数，休息一下再重试
-                time.sleep(1.0 + random.random())
-                continue
-            return {"error": str(e)}
+            kind, error_message = classify_failure(e), str(e)
+        
+        # 按失败类型决定是否重试：限流时不重试（出口暂停由 delay_request 执行），超时等按型号退避
+        if sweep is not None and sweep.should_stop():
+            return {"error": error_message}
+        decision = retry_policy.decide(kind, [model_name], attempt, max_retries if batch_mode else 0, fleet_size())
+        if not decision.retry:
+            return {"error": error_message}
+        RETRIES.inc(engine="thread")
+        if not sweep_sleep(decision.delay, sweep):
+            return {"error": error_message}
     
     # 如果所有尝试都失败
     return {"error": "多次尝试后仍无法获取数据"}
 
-def check_single_model_stock(model_name, model_code, batch_mode=False):
+def build_batch_params(model_codes, region=None):
+    """构造批量查询参数，型号代码依次放入 parts.0, parts.1, ...
+    
+    参数:
+        model_codes: 型号代码列表
+        region: 地区代码，决定查询位置，默认取默认地区
+    """
+    params = {
+        "searchNearby": "true",
+        "location": registry.regions[region or registry.default_region].location,
+    }
+    for index, model_code in enumerate(model_codes):
+        params[f"parts.{index}"] = model_code
+    return params
+
+def group_by_region(models):
+    """按地区分组，保持各组内的原有顺序
+    
+    返回:
+        {地区代码: (型号名称, 型号代码) 列表}
+    """
+    groups = {}
+    for model in models:
+        groups.setdefault(registry.by_key[model[0]].region, []).append(model)
+    return groups
+
+def build_query_batches(models, max_url_length=None):
+    """按地区和URL长度上限将型号拆分为若干批次
+    
+    参数:
+        models: (型号名称, 型号代码) 列表
+        max_url_length: 单个请求URL的最大长度，默认取 CONFIG['max_url_length']
+    
+    返回:
+        批次列表，每个批次是同一地区的 (型号名称, 型号代码) 列表，各地区的批次轮流排列；
+        单个型号超长时也会单独成批
+    """
+    limit = max_url_length or CONFIG['max_url_length']
+    region_batches = []
+    for region, region_models in group_by_region(models).items():
+        endpoint = registry.endpoint(region, batch=True)
+        batches = []
+        current = []
+        for model in region_models:
+            candidate = current + [model]
+            url = f"{endpoint}?{urlencode(build_batch_params([code for _, code in candidate], region))}"
+            if current and len(url) > limit:
+                batches.append(current)
+                current = [model]
+            else:
+                current = candidate
+        if current:
+            batches.append(current)
+        region_batches.append(batches)
+    # 各地区轮流占用并发与预算，避免型号多的地区排在前面挤占其他地区
+    return round_robin(region_batches)
+
+def build_query_groups(models):
+    """把型号拆分为请求：合并查询时按批次，否则每个型号一个请求，各地区轮流排列"""
+    if CONFIG['batched_query']:
+        return build_query_batches(models)
+    return round_robin([[model] for model in region_models] for region_models in group_by_region(models).values())
+
+def split_batch_response(data, models):
+    """将批量查询的响应按型号拆分
+    
+    参数:
+        data: 已解码的响应数据或响应体字节串
+        models: 本次请求的 (型号名称, 型号代码) 列表
+    
+    返回:
+        (结果字典, 缺失型号列表)；缺失型号是在所有门店中都没有出现的型号
+    """
+    by_code, missing_codes = pickup_parser.parse(data, [model_code for _, model_code in models])
+    results = {model_name: by_code[model_code] for model_name, model_code in models if model_code in by_code}
+    missing_codes = set(missing_codes)
+    return results, [model for model in models if model[1] in missing_codes]
+
+def check_stock_for_models(models, batch_mode=False, max_retries=2, sweep=None):
+    """在一个请求中查询多个型号的库存，并按型号拆分结果
+    
+    参数:
+        models: (型号名称, 型号代码) 列表
+        batch_mode: 是否为批量模式 (如果是，则失败时按重试策略重试而不是立即返回错误)
+        max_retries: 最大重试次数，重试时只查询上次响应中缺失的型号
+        sweep: 所属的查询轮次，取消或超过截止时间后不再重试
+    
+    返回:
+        {型号名称: 门店库存列表 或 {"error": 错误信息}}
+    """
+    # 批次中的型号属于同一地区
+    region = registry.by_key[models[0][0]].region
+    headers = build_request_headers(region)
+    results = {}
+    pending = list(models)
+    last_error = "未能获取库存信息"
+    
+    for attempt in range(max_retries + 1):
+        try:
+            proxies = proxy_manager.get_random_proxy() if CONFIG['use_proxy'] else None
+            if not delay_request(proxies, sweep):
+                report_request_cancelled(proxies)
+                last_error = "查询轮次已停止"
+                break
+            
+            params = build_batch_params([model_code for _, model_code in pending], region)
+            response = send_hedged_request(registry.endpoint(region, batch=True), params, headers, proxies,
+                                           sweep.request_timeout(10) if sweep else 10, sweep)
+            # 按型号回填各门店的库存状态，响应中完全没有出现的型号留待重试
+            batch_results, missing = split_batch_response(response.content, pending)
+            results.update(batch_results)
+            
+            pending = missing
+            if not pending:
+                return results
+            ERRORS.inc(len(pending), kind="missing_parts")
+            kind, last_error = "missing_parts", "未能获取库存信息"
+            
+        except Exception as e:
+            kind, last_error = classify_failure(e), str(e)
+        
+        if sweep is not None and sweep.should_stop():
+            break
+        decision = retry_policy.decide(kind, [model_name for model_name, _ in pending], attempt,
+                                       max_retries if batch_mode else 0, fleet_size())
+        if not decision.retry:
+            break
+        RETRIES.inc(engine="thread")
+        if not sweep_sleep(decision.delay, sweep):
+            break
+    
+    for model_name, _ in pending:
+        results[model_name] = {"error": last_error}
+    return results
+
+def mark_checking(model_names):
+    """标记型号正在检查中"""
+    state_store.set_checking(model_names, True)
+    stock_stream.publish("checking", {"models": list(model_names)})
+    notify_shared_state()
+
+def publish_results(results, now=None, remote=False):
+    """发布一批型号的查询结果：一次性换入新快照，再逐个通知下游并交给调度器安排下一次查询
+    
+    参数:
+        results: {型号名称: 门店库存列表 或 {"error": 错误信息}}
+        now: 更新时间文字，默认当前时间
+        remote: 集群中其他节点查询的结果，只更新本节点的视图，通知、历史与调度由负责的节点处理
+    """
+    previous = state_store.snapshot().stock
+    updated = now or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    stock_index.update(state_store.publish(results, updated), results)
+    if cluster is not None and not remote:
+        try:
+            cluster.write_results(results, updated)
+        except sqlite3.Error as e:
+            log.warning("写入集群结果失败", models=len(results), error=str(e))
+    
+    for model_name, result in results.items():
+        update = {"model": model_name, "lastUpdated": updated}
+        if isinstance(result, list):
+            events = change_tracker.apply(model_name, result)
+            if not remote:
+                retry_policy.model_succeeded([model_name])
+                # 只做索引匹配并入队，投递在通知线程中进行
+                notifier.notify(events)
+                if history_store is not None:
+                    history_store.record(model_name, result, updated, events)
+            if isinstance(previous.get(model_name), list):
+                # 只推送发生变化的门店
+                update["changes"] = [
+                    {"store": event.store, "status": event.new_status, "available": event.available}
+                    for event in events
+                ]
+            else:
+                update["stock"] = result
+        else:
+            update["stock"] = result
+        stock_stream.publish("update", update)
+        
+        if not remote:
+            poll_scheduler.record_result(model_name, result)
+    notify_shared_state()
+
+def publish_result(model_name, result, now=None):
+    """发布单个型号的查询结果"""
+    publish_results({model_name: result}, now)
+
+def polled_items():
+    """本节点负责查询的 (型号名称, 型号代码) 列表：集群模式下只含持有租约的型号"""
+    if cluster is None:
+        return list(IPHONE_17_PRO_MAX_MODELS.items())
+    owned = cluster.owned()
+    return [(model_name, model_code) for model_name, model_code in IPHONE_17_PRO_MAX_MODELS.items()
+            if model_name in owned]
+
+def apply_lease_change(gained, lost):
+    """集群租约变化：新获得的型号立即到期查询，失去的型号不再调度"""
+    poll_scheduler.register([model_name for model_name in gained if model_name in IPHONE_17_PRO_MAX_MODELS])
+    poll_scheduler.unregister(lost)
+
+def apply_cluster_results(rows):
+    """把集群中其他节点写入的结果合并到本节点的视图，按更新时间分批发布"""
+    batches = {}
+    for model_name, node_id, result, updated in rows:
+        # 本节点已接手的型号以本节点的结果为准，忽略前一个负责节点较早写入的结果
+        if model_name in IPHONE_17_PRO_MAX_MODELS and not cluster.owns(model_name):
+            batches.setdefault(updated, {})[model_name] = result
+    for updated, results in sorted(batches.items()):
+        publish_results(results, updated, remote=True)
+
+def run_single_model_check(model_name, model_code, batch_mode=False, sweep=None):
+    """在已占用 single-flight 的前提下检查单个型号，完成后释放"""
+    try:
+        mark_checking([model_name])
+        try:
+            result = check_stock_for_model(model_name, model_code, batch_mode=batch_mode, sweep=sweep)
+        except Exception as e:
+            result = {"error": str(e)}
+        publish_result(model_name, result)
+        if sweep is not None:
+            sweep.record({model_name: result})
+    finally:
+        model_flights.release([model_name])
+
+def check_single_model_stock(model_name, model_code, batch_mode=False, sweep=None):
     """检查单个型号的库存
     
     参数:
         model_name: 型号名称
         model_code: 型号代码
         batch_mode: 是否为批量模式，批量模式下会非阻塞地处理请求
+        sweep: 所属的查询轮次
     """
-    global stock_data, last_updated, is_checking, model_checking_status
-    
-    # 如果已经在检查中且非批量模式，则直接返回
-    if is_checking.get(model_name, False) and not batch_mode:
+    # 同一型号已有查询在进行中时直接合并，不再重复请求上游
+    if not model_flights.acquire([model_name]):
+        if sweep is not None:
+            sweep.merge([model_name])
         return
-    
-    is_checking[model_name] = True
-    model_checking_status[model_name] = True
-    
+    run_single_model_check(model_name, model_code, batch_mode, sweep)
+
+def check_model_batch_stock(models, batch_mode=False, sweep=None):
+    """用一个请求检查一批型号的库存
+
+    参数:
+        models: (型号名称, 型号代码) 列表
+        batch_mode: 是否为批量模式
+        sweep: 所属的查询轮次
+    """
+    # 已在别处查询中的型号不再重复请求
+    acquired = set(model_flights.acquire([model_name for model_name, _ in models]))
+    if sweep is not None:
+        sweep.merge([model_name for model_name, _ in models if model_name not in acquired])
+    models = [model for model in models if model[0] in acquired]
+    if not models:
+        return
+
     try:
-        # 使用批量模式查询
-        result = check_stock_for_model(model_name, model_code, batch_mode=batch_mode)
-        stock_data[model_name] = result
-        last_updated[model_name] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    except Exception as e:
-        stock_data[model_name] = {"error": str(e)}
-        last_updated[model_name] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        mark_checking([model_name for model_name, _ in models])
+        try:
+            results = check_stock_for_models(models, batch_mode=batch_mode, sweep=sweep)
+        except Exception as e:
+            results = {model_name: {"error": str(e)} for model_name, _ in models}
+        results = {model_name: results.get(model_name, {"error": "未能获取库存信息"}) for model_name, _ in models}
+        publish_results(results)
+        if sweep is not None:
+            sweep.record(results)
     finally:
-        is_checking[model_name] = False
-        model_checking_status[model_name] = False
+        model_flights.release(acquired)
+
+def get_async_engine():
+    """获取（必要时创建）异步检查引擎"""
+    global async_engine
+    with async_engine_lock:
+        if async_engine is None:
+            async_engine = AsyncStockChecker(max_concurrency=CONFIG['batch_size'])
+        return async_engine
+
+def build_query_job(models):
+    """为同一地区的一组型号构造查询任务，合并查询模式使用批量端点"""
+    region = registry.region_of(models[0][0])
+    if CONFIG['batched_query'] or len(models) > 1:
+        return QueryJob(registry.endpoint(region.code, batch=True),
+                        build_batch_params([code for _, code in models], region.code), models)
+    return QueryJob(registry.endpoint(region.code), {"product": models[0][1], "location": region.location}, models)
+
+def build_job_headers(job):
+    """按任务所属地区构造请求头"""
+    return build_request_headers(registry.by_key[job.models[0][0]].region)
+
+def handle_async_result(job, data, error, final, sweep=None):
+    """异步引擎的结果回调：回填库存数据，返回需要重试的任务"""
+    if error is None:
+        results, missing = split_batch_response(data, job.models)
+        error_message = "未能获取库存信息"
+    else:
+        results, missing = {}, list(job.models)
+        error_message = str(error)
+    
+    if missing and not final:
+        results_to_publish = results
+    else:
+        results_to_publish = dict(results)
+        for model_name, _ in missing:
+            results_to_publish[model_name] = {"error": error_message}
+    
+    if results_to_publish:
+        publish_results(results_to_publish)
+        # 轮次已结束（被取消）时占用已在结束时释放
+        if sweep is None or not sweep.done:
+            model_flights.release(list(results_to_publish))
+        if sweep is not None:
+            sweep.record(results_to_publish)
+    
+    if missing and error is None:
+        ERRORS.inc(len(missing), kind="missing_parts")
+    if missing and not final and not (sweep is not None and sweep.should_stop()):
+        return build_query_job(missing)
+    if sweep is not None:
+        sweep.task_done()
+    return None
 
-def check_all_models_stock(batch_mode=True):
+def async_retry_delay(job, error, attempt, max_retries):
+    """异步引擎的重试决定：返回重试前等待的秒数，None 表示放弃"""
+    kind = classify_failure(error) if error is not None else "missing_parts"
+    decision = retry_policy.decide(kind, [model_name for model_name, _ in job.models], attempt,
+                                   max_retries, fleet_size())
+    if not decision.retry:
+        return None
+    RETRIES.inc(engine="async")
+    return decision.delay
+
+def check_all_models_stock_async(batch_mode=True, models=None, reason="scheduled"):
+    """使用异步引擎检查所有型号的库存
+    
+    参数:
+        batch_mode: 批量模式下提交后立即返回，否则等待本轮查询完成
+        models: 要检查的 (型号名称, 型号代码) 列表，默认检查本节点负责的全部型号
+        reason: 发起原因
+    
+    返回:
+        Sweep；没有需要查询的型号，或上一轮未结束且不允许重叠时返回 None
+    """
+    items = models if models is not None else polled_items()
+    # 已在别处查询中的型号不再重复请求；占用在结果发布时由回调释放
+    acquired = set(model_flights.acquire([model_name for model_name, _ in items]))
+    items = [item for item in items if item[0] in acquired]
+    if not items:
+        return None
+    jobs = [build_query_job(group) for group in build_query_groups(items)]
+    sweep = begin_sweep("async", [model_name for model_name, _ in items], len(jobs), reason)
+    if sweep is None:
+        model_flights.release(acquired)
+        return None
+    
+    mark_checking([model_name for model_name, _ in items])
+    
+    log.info("开始查询", engine="async", sweep=sweep.id, models=len(items), requests=len(jobs),
+             concurrency=CONFIG['batch_size'])
+    future = get_async_engine().submit_sweep(
+        jobs,
+        partial(handle_async_result, sweep=sweep),
+        headers_factory=build_job_headers,
+        max_concurrency=CONFIG['batch_size'],
+        rate_limiter=observed_rate_limiter,
+        proxy_getter=proxy_manager.get_random_proxy if CONFIG['use_proxy'] else None,
+        result_reporter=report_request_result,
+        cancel_reporter=report_request_cancelled,
+        retry_delay=async_retry_delay,
+        hedge_policy=hedge_policy if CONFIG['hedge_requests'] else None,
+        hedge_proxy_getter=get_hedge_proxy if CONFIG['use_proxy'] else None,
+        hedge_reporter=report_hedge_result,
+        batch_mode=batch_mode,
+        deadline=sweep.deadline,
+    )
+    # 取消时取消事件循环中的任务，进行中的请求随之中断；任务全部结束后 future 才完成，
+    # 此时（包括引擎异常退出）结束本轮并释放仍未发布结果的型号
+    sweep.on_cancel(partial(get_async_engine().cancel_sweep, future))
+    future.add_done_callback(lambda done: finish_sweep(sweep, held=True))
+    if not batch_mode:
+        sweep.wait()
+    return sweep
+
+def check_all_models_stock(batch_mode=True, models=None, reason="scheduled"):
     """检查所有型号的库存
     
     参数:
-        batch_mode: 是否使用批量模式，批量模式下会并行处理请求，减少阻塞
+        batch_mode: 是否使用批量模式，批量模式下启动本轮查询后立即返回，否则等待本轮结束
+        models: 要检查的 (型号名称, 型号代码) 列表，默认检查本节点负责的全部型号
+        reason: 发起原因，如 scheduled、manual
+    
+    返回:
+        Sweep；没有需要查询的型号，或上一轮查询未结束且不允许重叠时返回 None
     """
-    # 创建线程列表
-    active_threads = []
-    max_concurrent = CONFIG['batch_size']  # 最大并发数量
+    if CONFIG['engine'] == 'async':
+        return check_all_models_stock_async(batch_mode=batch_mode, models=models, reason=reason)
     
     # 计算当前有多少个型号
-    total_models = len(IPHONE_17_PRO_MAX_MODELS)
-    print(f"正在检查 {total_models} 个型号的库存，最大并发数: {max_concurrent}")
+    items = models if models is not None else polled_items()
+    if not items:
+        return None
+    
+    # 合并查询模式下，按URL长度把同一地区的多个型号放进同一个请求；各地区的请求轮流排队
+    if CONFIG['batched_query']:
+        tasks = [(check_model_batch_stock, (batch, batch_mode),
+                  f"{registry.by_key[batch[0][0]].region} {len(batch)} 个型号") for batch in build_query_batches(items)]
+    else:
+        tasks = [(check_single_model_stock, (model_name, model_code, batch_mode), model_name)
+                 for group in build_query_groups(items) for model_name, model_code in group]
+    sweep = begin_sweep("thread", [model_name for model_name, _ in items], len(tasks), reason)
+    if sweep is None:
+        return None
+    log.info("开始查询", engine="thread", sweep=sweep.id, models=len(items), requests=len(tasks),
+             concurrency=CONFIG['batch_size'])
+    
+    # 由调度线程按并发上限启动查询线程，调用方不必等待全部任务启动
+    threading.Thread(target=dispatch_sweep_tasks, args=(sweep, tasks), daemon=True).start()
     
-    # 处理所有型号
-    for idx, (model_name, model_code) in enumerate(IPHONE_17_PRO_MAX_MODELS.items()):
+    # 如果不是批量模式，等待本轮结束
+    if not batch_mode:
+        sweep.wait()
+    return sweep
+
+def dispatch_sweep_tasks(sweep, tasks):
+    """按并发上限逐个启动查询线程；取消或超过截止时间后不再启动新任务，全部线程结束后结束本轮
+    
+    参数:
+        sweep: 查询轮次
+        tasks: (函数, 参数, 日志标签) 列表，函数最后一个参数为所属轮次
+    """
+    active_threads = []
+    max_concurrent = CONFIG['batch_size']  # 最大并发数量
+    
+    for idx, (target, args, label) in enumerate(tasks):
         # 限制并发线程数量
-        while len(active_threads) >= max_concurrent:
+        while len(active_threads) >= max_concurrent and not sweep.should_stop():
             # 检查哪些线程已完成并移除
             active_threads = [t for t in active_threads if t.is_alive()]
             if len(active_threads) >= max_concurrent:
-                # 如果仍然达到最大并发，等待短暂时间
-                time.sleep(0.2)
+                # 如果仍然达到最大并发，等待最早启动的线程一小段时间
+                active_threads[0].join(0.05)
+        if sweep.should_stop():
+            log.warning("查询轮次已停止，剩余任务不再启动", sweep=sweep.id, started=idx, total=len(tasks))
+            break
         
         # 创建并启动新线程
         thread = threading.Thread(
-            target=check_single_model_stock, 
-            args=(model_name, model_code, batch_mode),
+            target=run_sweep_task, 
+            args=(target, args + (sweep,), sweep),
             daemon=True
         )
         thread.start()
         active_threads.append(thread)
         
         # 在日志中显示进度
-        print(f"启动查询 [{idx+1}/{total_models}] {model_name}")
+        log.debug("启动查询", sweep=sweep.id, index=idx + 1, total=len(tasks), label=label)
     
-    # 如果不是批量模式，等待所有线程完成
-    if not batch_mode:
-        for thread in active_threads:
-            thread.join()
+    for thread in active_threads:
+        thread.join()
+    finish_sweep(sweep)
+
+def run_scheduled_poll():
+    """查询调度器中已到期的型号，请求数超出每分钟预算的部分推迟；上一轮未结束时等到下一次"""
+    if sweep_manager.running() and not CONFIG['allow_overlapping_sweeps']:
+        return
+    due = poll_scheduler.pop_due()
+    if not due:
+        return
+    
+    items = [(model_name, IPHONE_17_PRO_MAX_MODELS[model_name]) for model_name in due]
+    # 各地区的请求轮流排列，预算不足时每个地区都能分到一部分
+    groups = build_query_groups(items)
+    allowed = poll_scheduler.reserve(len(groups))
+    if allowed < len(groups):
+        # 调度器已按优先级排序，超出预算的低优先级型号顺延
+        poll_scheduler.defer([model_name for group in groups[allowed:] for model_name, _ in group])
+    
+    selected = [item for group in groups[:allowed] for item in group]
+    if selected and check_all_models_stock(batch_mode=True, models=selected) is None:
+        # 别处刚开始了一轮查询，已到期的型号留到下一次
+        poll_scheduler.defer([model_name for model_name, _ in selected])
+
+def warm_load_history():
+    """从历史存储恢复上次保存的库存状态，让页面在第一轮查询完成前也有数据"""
+    if history_store is None:
+        return
+    saved = history_store.load_latest()
+    restored = state_store.restore({model_name: entry for model_name, entry in saved.items()
+                                    if model_name in IPHONE_17_PRO_MAX_MODELS})
+    for model_name in restored:
+        change_tracker.apply(model_name, saved[model_name][0])
+    stock_index.update(state_store.snapshot(), restored)
+    if restored:
+        log.info("已从历史记录恢复库存状态", models=len(restored))
+        notify_shared_state()
+
+# 共享快照中保留的最近变化事件数，web 进程据此提供 /api/changes
+SHARED_EVENTS_LIMIT = 1000
+
+# 查询进程写出共享快照，web 进程跟随快照；standalone 模式下两者都为 None
+shared_state_writer = None
+shared_state_follower = None
+
+def build_shared_state():
+    """查询进程写入共享快照的完整状态"""
+    snapshot = state_store.snapshot()
+    latest_seq = change_tracker.latest_seq
+    events, _ = change_tracker.events_since(max(latest_seq - SHARED_EVENTS_LIMIT, 0))
+    return {
+        "epoch": POLLER_EPOCH,
+        "version": snapshot.version,
+        "stock": dict(snapshot.stock),
+        "lastUpdated": dict(snapshot.last_updated),
+        "checkingStatus": dict(snapshot.checking),
+        "modelVersions": dict(snapshot.model_versions),
+        "events": [list(event) for event in events],
+        "latestSeq": latest_seq,
+        "config": {key: value for key, value in CONFIG.items() if key not in LOCAL_CONFIG_KEYS},
+    }
+
+def notify_shared_state():
+    """状态变化后唤醒共享快照的写线程，并把变化的型号写入库存矩阵文件"""
+    if shared_state_writer is not None:
+        shared_state_writer.notify()
+    if matrix_writer is not None:
+        matrix_writer.publish(state_store.snapshot())
+
+def apply_shared_state(data):
+    """web 进程：换入查询进程写出的快照，并把变化推送给本进程的 SSE 订阅者"""
+    global shared_state_epoch
+    current = state_store.snapshot()
+    if data["epoch"] != shared_state_epoch:
+        # 查询进程重启过，版本号与事件序号都已重新开始
+        shared_state_epoch = data["epoch"]
+        change_tracker.reset()
+        current = None
+    
+    snapshot = state_store.load(StockSnapshot(data["version"], data["stock"], data["lastUpdated"],
+                                              data["checkingStatus"], data["modelVersions"]))
+    change_tracker.replay([ChangeEvent(*event) for event in data["events"]])
+    changed = None if current is None else [model for model, version in snapshot.model_versions.items()
+                                            if version > current.model_versions.get(model, 0)]
+    # 首次加载或查询进程重启时整体重建有货索引，之后只更新版本号变化的型号
+    stock_index.update(snapshot, changed)
+    if data["config"].get('log_level', CONFIG['log_level']) != CONFIG['log_level']:
+        configure_logging(data["config"]['log_level'])
+    for key, value in data["config"].items():
+        CONFIG[key] = value
+    
+    if current is None:
+        return
+    checking = [model for model in changed
+                if snapshot.checking.get(model) and not current.checking.get(model)]
+    if checking:
+        stock_stream.publish("checking", {"models": checking})
+    for model in changed:
+        if model in snapshot.stock and snapshot.last_updated.get(model) != current.last_updated.get(model):
+            stock_stream.publish("update", {"model": model, "lastUpdated": snapshot.last_updated[model],
+                                            "stock": snapshot.stock[model]})
+
+# 查询进程的启动标识，web 进程据此发现查询进程重启
+POLLER_EPOCH = f"{os.getpid()}-{time.time():.3f}"
+shared_state_epoch = None
+
+# 版本号从当前毫秒时间开始，进程重启后 ETag 与 since 版本号也不会与重启前重复；
+# 各角色都如此，web 进程随后改用查询进程写出的版本号
+state_store.load(state_store.snapshot()._replace(version=int(time.time() * 1000)))
+
+if CONFIG['role'] == 'poller':
+    shared_state_writer = SnapshotWriter(CONFIG['shared_state_path'], build_shared_state)
+elif CONFIG['role'] == 'web':
+    shared_state_follower = SnapshotFollower(CONFIG['shared_state_path'], apply_shared_state)
+    # 各 web 进程的 SSE 序号从不同的起点开始，连到另一个进程重连时会重新收到完整快照
+    stock_stream.rebase(random.SystemRandom().randrange(1, 2 ** 40) << 12)
+
+# 库存矩阵按目录顺序（与 MODEL_DETAILS 一致）为每个型号分配一行；web 进程只读，不写入
+matrix_writer = StockMatrixWriter(CONFIG['matrix_path'], ALL_MODELS) \
+    if CONFIG['matrix_path'] and CONFIG['role'] != 'web' else None
+
+# 在 web 进程中转发给查询进程处理的接口：会触发查询、修改配置或读取查询进程内部状态
+POLLER_ENDPOINTS = {
+    'refresh_stock', 'refresh_single_model', 'watch_models', 'update_config',
+    'get_sweeps', 'get_sweep', 'cancel_sweep', 'get_cluster',
+    'get_subscriptions', 'add_subscription', 'delete_subscription',
+    'get_schedule', 'get_proxy_status', 'get_metrics',
+}
+
+@app.before_request
+def route_web_request():
+    """web 进程：确保已在跟随共享快照，并把需要查询进程处理的请求转发过去"""
+    if shared_state_follower is None:
+        return None
+    shared_state_follower.start()
+    if request.endpoint not in POLLER_ENDPOINTS:
+        return None
+    try:
+        upstream = requests.request(
+            request.method,
+            CONFIG['poller_url'].rstrip('/') + request.full_path.rstrip('?'),
+            data=request.get_data(),
+            headers={"Content-Type": request.headers.get("Content-Type", "application/json")},
+            timeout=10,
+        )
+    except requests.RequestException as e:
+        log.warning("转发到查询进程失败", path=request.path, error=str(e))
+        return jsonify({"error": "查询进程不可用"}), 503
+    return Response(upstream.content, status=upstream.status_code,
+                    content_type=upstream.headers.get("Content-Type"))
 
 def background_stock_checker():
     """后台定期检查库存 - 使用随机间隔和配置的刷新时间避免被封锁"""
     while True:
+        cooldown = retry_policy.cooldown_remaining()
+        if cooldown > 0:
+            # 大部分出口都被限流时暂停发起新一轮查询，冷却结束后再继续
+            time.sleep(min(cooldown, 1.0))
+            continue
+        
+        if CONFIG['adaptive_polling']:
+            # 按型号调度：只查询已到期的型号
+            run_scheduled_poll()
+            time.sleep(min(max(poll_scheduler.seconds_until_next(), 0.2), 1.0))
+            continue
+        
         # 使用批量模式检查所有型号
         check_all_models_stock(batch_mode=True)
         
@@ -295,49 +1116,421 @@ def background_stock_checker():
         next_round_wait = interval * (0.9 + (0.2 * random.random()))
         time.sleep(next_round_wait)
 
+# 主页嵌入库存快照的位置；页面外壳按配置缓存，快照按版本拼接
+SNAPSHOT_PLACEHOLDER = "__INITIAL_SNAPSHOT__"
+index_cache = PageCache(SNAPSHOT_PLACEHOLDER)
+
+def render_index_shell():
+    """渲染主页外壳：型号目录与配置以 JSON 嵌入，库存快照留出占位符"""
+    return render_template('index.html',
+                           page_data={
+                               "modelDetails": MODEL_DETAILS,
+                               "regions": registry.region_list(),
+                               "regionModelDetails": registry.model_details,
+                               "defaultRegion": registry.default_region,
+                               "seriesCapacities": SERIES_CAPACITIES,
+                               "seriesList": list(SERIES_CAPACITIES.keys()),
+                               "colorsList": COLORS,
+                               "capacitiesList": CAPACITIES,
+                               "config": CONFIG,
+                           },
+                           snapshot_placeholder=SNAPSHOT_PLACEHOLDER)
+
 @app.route('/')
 def index():
-    """主页"""
-    # 传递更详细的模型数据和配置
-    model_details_json = json.dumps(MODEL_DETAILS)
-    series_capacities_json = json.dumps(SERIES_CAPACITIES)
-    config_json = json.dumps(CONFIG)
-    
-    return render_template('index.html', 
-                          model_details_json=model_details_json,
-                          models=IPHONE_17_PRO_MAX_MODELS,
-                          series_list=list(MODEL_DETAILS.keys()),
-                          colors_list=COLORS,
-                          capacities_list=CAPACITIES,
-                          series_capacities_json=series_capacities_json,
-                          config_json=config_json)
+    """主页
+    
+    页面外壳只在配置变化时重新渲染；当前库存快照（含推送序号）嵌入页面，首屏不必再请求 /api/stock，
+    SSE 连接从该序号开始只接收之后的变化
+    """
+    # 先取推送序号再取快照：快照之后发布的消息会再推送一次，重复应用是幂等的
+    seq = stock_stream.latest_seq
+    snapshot = state_store.snapshot()
+    body, gzip_body = index_cache.get(
+        json.dumps(CONFIG, sort_keys=True), render_index_shell, snapshot.version,
+        lambda: dict(build_stock_snapshot(snapshot), version=snapshot.version, seq=seq))
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(gzip_body if use_gzip else body, mimetype='text/html')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/assets/<path:filename>')
+def get_asset(filename):
+    """静态文件：带指纹的地址长期缓存，按 Accept-Encoding 返回预压缩的 brotli 或 gzip 版本"""
+    asset, fingerprinted = static_assets.get(filename)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    etag = f'"{asset.digest}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = Response(status=304)
+    else:
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        if asset.brotli_body is not None and 'br' in accept_encoding:
+            body, encoding = asset.brotli_body, 'br'
+        elif asset.gzip_body is not None and 'gzip' in accept_encoding:
+            body, encoding = asset.gzip_body, 'gzip'
+        else:
+            body, encoding = asset.body, None
+        response = Response(body, content_type=asset.content_type)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 带指纹的地址内容不会变化；不带指纹的地址每次向服务器确认
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if fingerprinted else 'no-cache'
+    return response
+
+@app.route('/api/catalog')
+def get_catalog():
+    """获取已启用地区的型号目录
+    
+    查询参数:
+        region, series, color, capacity: 可选的筛选条件
+    """
+    region = request.args.get('region')
+    if region is not None and region not in registry.by_region:
+        return jsonify({"error": f"未启用的地区: {region}"}), 404
+    skus = registry.find(series=request.args.get('series'), color=request.args.get('color'),
+                         capacity=request.args.get('capacity'), region=region)
+    return jsonify({
+        "defaultRegion": registry.default_region,
+        "regions": registry.region_list(),
+        "models": [sku._asdict() for sku in skus]
+    })
+
+def build_json_response(body, gzip_body, version):
+    """构造带 ETag 的 JSON 响应，客户端接受 gzip 时返回压缩后的响应体"""
+    use_gzip = gzip_body is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(gzip_body if use_gzip else body, mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['ETag'] = f'"{version}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/stock')
 def get_stock():
-    """获取库存数据的API"""
+    """获取库存数据的API
+    
+    响应带有版本号 ETag，状态未变化时对 If-None-Match 返回 304；
+    查询参数 since=<版本号> 时只返回该版本之后变化过的型号
+    """
+    snapshot = state_store.snapshot()
+    version = snapshot.version
+    if request.headers.get('If-None-Match') == f'"{version}"':
+        response = Response(status=304)
+        response.headers['ETag'] = f'"{version}"'
+        return response
+    
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since 必须是整数版本号"}), 400
+        models = [model for model, model_version in snapshot.model_versions.items() if model_version > since]
+        payload = {
+            "stock": {model: snapshot.stock[model] for model in models if model in snapshot.stock},
+            "lastUpdated": {model: snapshot.last_updated[model] for model in models if model in snapshot.last_updated},
+            "checkingStatus": {model: snapshot.checking[model] for model in models if model in snapshot.checking},
+            "version": version,
+            "since": since
+        }
+        body, gzip_body = stock_cache.encode(payload)
+        return build_json_response(body, gzip_body, version)
+    
+    body, gzip_body = stock_cache.get(version, lambda: dict(build_stock_snapshot(snapshot), version=version))
+    return build_json_response(body, gzip_body, version)
+
+def build_stock_snapshot(snapshot=None):
+    """当前完整库存状态，与 /api/stock 的响应结构相同"""
+    snapshot = snapshot or state_store.snapshot()
+    return {
+        "stock": dict(snapshot.stock),
+        "lastUpdated": dict(snapshot.last_updated),
+        "checkingStatus": dict(snapshot.checking)
+    }
+
+def build_index_response(build):
+    """构造按有货索引生成的 JSON 响应，ETag 为索引版本号，未变化时返回 304"""
+    version = stock_index.version
+    if request.headers.get('If-None-Match') == f'"{version}"':
+        response = Response(status=304)
+    else:
+        response = jsonify(dict(build(), version=version))
+    response.headers['ETag'] = f'"{version}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def format_stores(stores):
+    """把 [(门店, 状态文字)] 转为响应中的门店列表"""
+    return [{"store": store, "status": status} for store, status in stores]
+
+def catalog_order(model_names):
+    """按目录顺序排列型号"""
+    return sorted(model_names, key=lambda model_name: MODEL_ORDER.get(model_name, len(MODEL_ORDER)))
+
+@app.route('/api/stores')
+def get_stores():
+    """获取全部已知门店及各自的有货型号数"""
+    return build_index_response(lambda: {
+        "stores": [{"store": store, "availableModels": count} for store, count in stock_index.stores().items()]
+    })
+
+@app.route('/api/stores/<store>/available')
+def get_store_available(store):
+    """获取某门店当前有货的型号，按目录顺序排列"""
+    if not stock_index.has_store(store):
+        return jsonify({"error": f"未知的门店: {store}"}), 404
+    
+    def build():
+        models = stock_index.store_available(store)
+        return {
+            "store": store,
+            "models": [{"model": model_name, "status": models[model_name]}
+                       for model_name in catalog_order(models)]
+        }
+    return build_index_response(build)
+
+@app.route('/api/available')
+def get_available():
+    """获取当前有货的型号及其有货门店
+    
+    查询参数:
+        region, series, color, capacity: 可选的筛选条件，由型号目录的属性索引求出候选型号
+    """
+    region = request.args.get('region')
+    if region is not None and region not in registry.by_region:
+        return jsonify({"error": f"未启用的地区: {region}"}), 404
+    filters = [request.args.get(name) for name in ('series', 'color', 'capacity')]
+    candidates = None
+    if region is not None or any(value is not None for value in filters):
+        candidates = [sku.key for sku in registry.find(*filters, region=region)]
+    
+    def build():
+        available = stock_index.available_models(None if candidates is None else set(candidates))
+        return {
+            "models": [{"model": model_name, "stores": format_stores(available[model_name])}
+                       for model_name in catalog_order(available)]
+        }
+    return build_index_response(build)
+
+@app.route('/api/models/<model_name>/first-available')
+def get_first_available(model_name):
+    """获取某型号第一家有货的门店
+    
+    查询参数:
+        stores: 逗号分隔的门店优先顺序，省略时按接口返回的顺序（离查询位置由近到远）
+    """
+    if model_name not in IPHONE_17_PRO_MAX_MODELS:
+        return jsonify({"error": f"未知的型号: {model_name}"}), 404
+    stores = request.args.get('stores')
+    preferred = [store.strip() for store in stores.split(',') if store.strip()] if stores else None
+    
+    def build():
+        first = stock_index.first_available(model_name, preferred)
+        return {
+            "model": model_name,
+            "store": first[0] if first else None,
+            "status": first[1] if first else None
+        }
+    return build_index_response(build)
+
+@app.route('/api/stream')
+def stream_stock():
+    """以 Server-Sent Events 推送库存：先推送完整快照，之后只推送变化
+    
+    事件类型:
+        snapshot: 完整状态 {stock, lastUpdated, checkingStatus, seq}
+        checking: 开始检查的型号 {models}
+        update: 单个型号的结果 {model, lastUpdated, changes | stock}
+    """
+    # 浏览器重连时带 Last-Event-ID；首次连接可用 since 参数指定页面内嵌快照的序号
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    last_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    if stream_server is not None:
+        # 由事件循环中的推送服务保持连接，不占用本进程的处理线程
+        url = CONFIG['stream_url'] or f"{request.scheme}://{stream_host()}:{stream_server.port}/api/stream"
+        if last_seq is not None:
+            url += f"?since={last_seq}"
+        response = Response(status=307)
+        response.headers['Location'] = url
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return Response(
+        stock_stream.subscribe(build_stock_snapshot, last_seq=last_seq),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.route('/api/changes')
+def get_changes():
+    """获取库存变化事件
+    
+    查询参数:
+        since: 只返回序号大于该值的事件，默认 0
+        limit: 最多返回的事件数，默认 500
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', 500)), 5000)
+    except ValueError:
+        return jsonify({"error": "since 和 limit 必须是整数"}), 400
+    
+    events, truncated = change_tracker.events_since(since, limit)
     return jsonify({
-        "stock": stock_data,
-        "lastUpdated": last_updated,
-        "checkingStatus": model_checking_status
+        "events": [event._asdict() for event in events],
+        "latestSeq": change_tracker.latest_seq,
+        "truncated": truncated
+    })
+
+@app.route('/api/history')
+def get_history():
+    """查询某型号在某门店的库存状态时间线
+    
+    查询参数:
+        model: 型号名称
+        store: 门店名称
+        days: 查询最近多少天，默认 7
+    """
+    if history_store is None:
+        return jsonify({"error": "未启用库存历史"}), 404
+    model_name = request.args.get('model')
+    store = request.args.get('store')
+    if not model_name or not store:
+        return jsonify({"error": "必须指定 model 和 store"}), 400
+    try:
+        days = float(request.args.get('days', 7))
+    except ValueError:
+        return jsonify({"error": "days 必须是有效数字"}), 400
+    
+    started = time.perf_counter()
+    timeline = history_store.timeline(model_name, store, time.time() - days * 86400)
+    return jsonify({
+        "model": model_name,
+        "store": store,
+        "days": days,
+        "timeline": timeline,
+        "elapsedMs": round((time.perf_counter() - started) * 1000, 3)
     })
 
 @app.route('/api/refresh', methods=['POST'])
 def refresh_stock():
-    """手动刷新库存"""
-    threading.Thread(target=check_all_models_stock, kwargs={"batch_mode": True}, daemon=True).start()
-    return jsonify({"status": "refreshing"})
+    """手动刷新库存；上一轮查询未结束时不重复发起，返回进行中的轮次"""
+    sweep = check_all_models_stock(batch_mode=True, reason="manual")
+    if sweep is None:
+        running = sweep_manager.running()
+        return jsonify({"status": "running", "sweep": running[0].to_dict() if running else None})
+    return jsonify({"status": "refreshing", "sweep": sweep.to_dict()})
+
+@app.route('/api/sweeps', methods=['GET'])
+def get_sweeps():
+    """获取进行中与最近结束的查询轮次"""
+    return jsonify(sweep_manager.get_status())
+
+@app.route('/api/sweeps/<int:sweep_id>', methods=['GET'])
+def get_sweep(sweep_id):
+    """获取单个查询轮次的进度"""
+    sweep = sweep_manager.get(sweep_id)
+    if sweep is None:
+        return jsonify({"error": "未找到该查询轮次"}), 404
+    return jsonify(sweep.to_dict())
+
+@app.route('/api/sweeps/<int:sweep_id>/cancel', methods=['POST'])
+def cancel_sweep(sweep_id):
+    """取消进行中的查询轮次：不再发出新请求，已发出的请求（线程引擎）完成后结束"""
+    if not sweep_manager.cancel(sweep_id):
+        return jsonify({"error": "该查询轮次不存在或已结束"}), 404
+    return jsonify({"status": CANCELLED, "sweep": sweep_manager.get(sweep_id).to_dict()})
 
 @app.route('/api/refresh/<model_name>', methods=['POST'])
 def refresh_single_model(model_name):
     """手动刷新单个型号的库存"""
     if model_name in IPHONE_17_PRO_MAX_MODELS:
         model_code = IPHONE_17_PRO_MAX_MODELS[model_name]
+        if cluster is not None and not cluster.owns(model_name):
+            # 由集群中其他节点负责查询，返回负责的节点
+            owner = cluster.owner_of(model_name)
+            return jsonify({"status": "remote", "model": model_name,
+                            "owner": {"id": owner[0], "url": owner[1]} if owner else None})
+        # 手动刷新说明用户正在关注该型号，之后提高其查询频率
+        poll_scheduler.watch([model_name])
+        # 已有查询在进行中时合并到该查询，不再启动新线程
+        if not model_flights.acquire([model_name]):
+            return jsonify({"status": "refreshing", "model": model_name, "merged": True})
         # 使用非批量模式，确保立即处理
-        threading.Thread(target=check_single_model_stock, args=(model_name, model_code, False), daemon=True).start()
+        threading.Thread(target=run_single_model_check, args=(model_name, model_code, False), daemon=True).start()
         return jsonify({"status": "refreshing", "model": model_name})
     else:
         return jsonify({"error": "Model not found"}), 404
 
+@app.route('/api/watch', methods=['POST'])
+def watch_models():
+    """登记用户正在关注的型号，调度器会提高这些型号的查询频率"""
+    data = request.get_json(silent=True) or {}
+    models = data.get('models')
+    if not isinstance(models, list):
+        return jsonify({"error": "models 必须是型号名称列表"}), 400
+    watched = poll_scheduler.watch([model for model in models if model in IPHONE_17_PRO_MAX_MODELS])
+    return jsonify({"status": "watching", "models": watched})
+
+@app.route('/api/subscriptions', methods=['GET'])
+def get_subscriptions():
+    """获取补货通知订阅与投递统计"""
+    return jsonify({
+        "subscriptions": [subscription._asdict() for subscription in notifier.subscriptions()],
+        "status": notifier.get_status()
+    })
+
+@app.route('/api/subscriptions', methods=['POST'])
+def add_subscription():
+    """添加补货通知订阅
+    
+    请求体:
+        channel: 渠道名称（webhook、telegram、email），须已在通知配置中启用
+        target: 接收方（URL、chat_id 或邮箱地址）
+        models: 可选，关注的型号列表，默认全部
+        stores: 可选，关注的门店列表，默认全部
+    """
+    data = request.get_json(silent=True) or {}
+    channel = data.get('channel')
+    target = data.get('target')
+    models = data.get('models')
+    stores = data.get('stores')
+    if not channel or not target:
+        return jsonify({"error": "必须指定 channel 和 target"}), 400
+    if models is not None and (not isinstance(models, list) or any(model not in IPHONE_17_PRO_MAX_MODELS for model in models)):
+        return jsonify({"error": "models 必须是已知型号名称的列表"}), 400
+    if stores is not None and not isinstance(stores, list):
+        return jsonify({"error": "stores 必须是门店名称列表"}), 400
+    try:
+        subscription = notifier.subscribe(channel, target, models, stores)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if models:
+        # 订阅了具体型号说明用户在关注这些型号
+        poll_scheduler.watch(models)
+    return jsonify({"status": "subscribed", "subscription": subscription._asdict()})
+
+@app.route('/api/subscriptions/<int:subscription_id>', methods=['DELETE'])
+def delete_subscription(subscription_id):
+    """删除补货通知订阅"""
+    if not notifier.unsubscribe(subscription_id):
+        return jsonify({"error": "Subscription not found"}), 404
+    return jsonify({"status": "unsubscribed", "id": subscription_id})
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """获取自适应调度状态"""
+    return jsonify(poll_scheduler.get_status())
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """获取当前配置信息"""
@@ -353,6 +1546,7 @@ def update_config():
             new_interval = float(data['refresh_interval'])
             if 5 <= new_interval <= 60:  # 限制刷新间隔在5-60秒之间
                 CONFIG['refresh_interval'] = new_interval
+                poll_scheduler.configure(base_interval=new_interval)
             else:
                 return jsonify({"error": "刷新间隔必须在5到60秒之间"}), 400
         except (ValueError, TypeError):
@@ -363,21 +1557,155 @@ def update_config():
             new_delay = float(data['request_delay'])
             if 0.1 <= new_delay <= 2.0:
                 CONFIG['request_delay'] = new_delay
+                CONFIG['rate_limit_per_second'] = round(1.0 / new_delay, 3)
+                rate_limiter.configure(rate_per_second=CONFIG['rate_limit_per_second'])
             else:
                 return jsonify({"error": "请求延迟必须在0.1到2.0秒之间"}), 400
         except (ValueError, TypeError):
             return jsonify({"error": "请求延迟必须是有效数字"}), 400
     
+    if 'rate_limit_per_second' in data:
+        try:
+            new_rate = float(data['rate_limit_per_second'])
+            if 0.5 <= new_rate <= 10.0:
+                CONFIG['rate_limit_per_second'] = new_rate
+                CONFIG['request_delay'] = round(1.0 / new_rate, 3)
+                rate_limiter.configure(rate_per_second=new_rate)
+            else:
+                return jsonify({"error": "每秒请求数必须在0.5到10之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "每秒请求数必须是有效数字"}), 400
+    
+    if 'rate_limit_tokens' in data:
+        try:
+            new_tokens = int(data['rate_limit_tokens'])
+            if 1 <= new_tokens <= 20:
+                CONFIG['rate_limit_tokens'] = new_tokens
+                rate_limiter.configure(burst=new_tokens)
+            else:
+                return jsonify({"error": "突发请求数必须在1到20之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "突发请求数必须是有效整数"}), 400
+    
+    if 'adaptive_polling' in data:
+        CONFIG['adaptive_polling'] = bool(data['adaptive_polling'])
+    
+    if 'request_budget_per_minute' in data:
+        try:
+            new_budget = int(data['request_budget_per_minute'])
+            if 1 <= new_budget <= 600:
+                CONFIG['request_budget_per_minute'] = new_budget
+                poll_scheduler.configure(budget_per_minute=new_budget)
+            else:
+                return jsonify({"error": "每分钟请求预算必须在1到600之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "每分钟请求预算必须是有效整数"}), 400
+    
+    if 'max_poll_interval' in data:
+        try:
+            new_max_interval = float(data['max_poll_interval'])
+            if 60 <= new_max_interval <= 3600:
+                CONFIG['max_poll_interval'] = new_max_interval
+                poll_scheduler.configure(max_interval=new_max_interval)
+            else:
+                return jsonify({"error": "最大查询间隔必须在60到3600秒之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "最大查询间隔必须是有效数字"}), 400
+    
+    if 'engine' in data:
+        if data['engine'] not in ('thread', 'async'):
+            return jsonify({"error": "检查引擎必须是 thread 或 async"}), 400
+        CONFIG['engine'] = data['engine']
+    
+    if 'batched_query' in data:
+        CONFIG['batched_query'] = bool(data['batched_query'])
+    
+    if 'allow_overlapping_sweeps' in data:
+        CONFIG['allow_overlapping_sweeps'] = bool(data['allow_overlapping_sweeps'])
+    
+    if 'sweep_deadline' in data:
+        try:
+            new_deadline = float(data['sweep_deadline'])
+            if 5 <= new_deadline <= 600:
+                CONFIG['sweep_deadline'] = new_deadline
+            else:
+                return jsonify({"error": "查询时限必须在5到600秒之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "查询时限必须是有效数字"}), 400
+    
+    if 'hedge_requests' in data:
+        CONFIG['hedge_requests'] = bool(data['hedge_requests'])
+    
+    if 'hedge_quantile' in data:
+        try:
+            new_quantile = float(data['hedge_quantile'])
+            if 0.5 <= new_quantile <= 0.99:
+                CONFIG['hedge_quantile'] = new_quantile
+                hedge_policy.configure(quantile=new_quantile)
+            else:
+                return jsonify({"error": "对冲分位数必须在0.5到0.99之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "对冲分位数必须是有效数字"}), 400
+    
+    if 'hedge_max_ratio' in data:
+        try:
+            new_ratio = float(data['hedge_max_ratio'])
+            if 0 <= new_ratio <= 0.5:
+                CONFIG['hedge_max_ratio'] = new_ratio
+                hedge_policy.configure(max_ratio=new_ratio)
+            else:
+                return jsonify({"error": "对冲比例上限必须在0到0.5之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "对冲比例上限必须是有效数字"}), 400
+    
+    if 'log_level' in data:
+        new_level = str(data['log_level']).upper()
+        if new_level not in LOG_LEVELS:
+            return jsonify({"error": f"日志级别必须是 {'/'.join(LOG_LEVELS)} 之一"}), 400
+        CONFIG['log_level'] = configure_logging(new_level)
+    
+    if 'max_url_length' in data:
+        try:
+            new_length = int(data['max_url_length'])
+            if 256 <= new_length <= 8000:
+                CONFIG['max_url_length'] = new_length
+            else:
+                return jsonify({"error": "URL长度上限必须在256到8000之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "URL长度上限必须是有效整数"}), 400
+    
     if 'batch_size' in data:
         try:
             new_size = int(data['batch_size'])
-            if 1 <= new_size <= 20:
+            if 1 <= new_size <= MAX_BATCH_SIZE:
                 CONFIG['batch_size'] = new_size
             else:
-                return jsonify({"error": "批次大小必须在1到20之间"}), 400
+                return jsonify({"error": f"批次大小必须在1到{MAX_BATCH_SIZE}之间"}), 400
         except (ValueError, TypeError):
             return jsonify({"error": "批次大小必须是有效整数"}), 400
     
+    if 'session_pool_size' in data:
+        try:
+            new_pool_size = int(data['session_pool_size'])
+            if 1 <= new_pool_size <= 100:
+                CONFIG['session_pool_size'] = new_pool_size
+                session_pool.configure(pool_size=new_pool_size)
+            else:
+                return jsonify({"error": "连接池大小必须在1到100之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "连接池大小必须是有效整数"}), 400
+    
+    if 'session_idle_timeout' in data:
+        try:
+            new_idle_timeout = float(data['session_idle_timeout'])
+            if 10 <= new_idle_timeout <= 3600:
+                CONFIG['session_idle_timeout'] = new_idle_timeout
+                session_pool.configure(idle_timeout=new_idle_timeout)
+            else:
+                return jsonify({"error": "会话空闲超时必须在10到3600秒之间"}), 400
+        except (ValueError, TypeError):
+            return jsonify({"error": "会话空闲超时必须是有效数字"}), 400
+    
     # 处理代理设置
     if 'use_proxy' in data:
         try:
@@ -408,12 +1736,30 @@ def update_config():
         except Exception as e:
             return jsonify({"error": f"更新代理列表失败: {str(e)}"}), 400
     
+    notify_shared_state()
     return jsonify({"status": "success", "config": CONFIG})
 
+@app.route('/metrics')
+def get_metrics():
+    """以 Prometheus 文本格式输出运行指标"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/proxy/status', methods=['GET'])
 def get_proxy_status():
-    """获取代理状态"""
-    return jsonify(proxy_manager.get_status())
+    """获取代理状态及连接复用统计"""
+    status = proxy_manager.get_status()
+    status["sessions"] = session_pool.get_stats()
+    status["rate_limit"] = rate_limiter.get_status()
+    status["retry"] = retry_policy.get_status()
+    status["hedge"] = dict(hedge_policy.get_status(), enabled=CONFIG['hedge_requests'])
+    return jsonify(status)
+
+@app.route('/api/cluster', methods=['GET'])
+def get_cluster():
+    """获取集群节点、心跳与租约分布"""
+    if cluster is None:
+        return jsonify({"error": "未启用集群模式"}), 404
+    return jsonify(cluster.get_status())
 
 def find_free_port(start_port=5000, max_port=5010):
     """查找可用端口"""
@@ -427,32 +1773,66 @@ def find_free_port(start_port=5000, max_port=5010):
             continue
     return None
 
+# SSE 推送服务，配置了 stream_bind 时由 start_stream_server() 启动
+stream_server = None
+
+def stream_host():
+    """浏览器访问本页面使用的主机名（IPv6 地址带方括号），推送服务地址沿用它"""
+    host = urlsplit(f"//{request.host}").hostname or "localhost"
+    return f"[{host}]" if ":" in host else host
+
+def start_stream_server():
+    """配置了 stream_bind 时在事件循环中提供 /api/stream；多个 Web 工作进程共用同一端口分担连接"""
+    global stream_server
+    if not CONFIG['stream_bind'] or stream_server is not None:
+        return stream_server
+    host, _, port = CONFIG['stream_bind'].rpartition(':')
+    server = StreamServer(stock_stream, build_stock_snapshot, host.strip('[]') or '127.0.0.1', int(port),
+                          reuse_port=True)
+    server.start()
+    stream_server = server
+    return stream_server
+
+def start_background_tasks():
+    """恢复历史状态并启动后台查询线程（standalone 与 poller 模式）"""
+    # 恢复上次保存的库存状态
+    warm_load_history()
+    if shared_state_writer is not None:
+        shared_state_writer.start()
+    if cluster is not None:
+        # 先完成一次心跳拿到租约，并合并其他节点已写入的结果；退出时释放租约，其余节点立即接手
+        cluster.start(apply_lease_change, apply_cluster_results)
+        atexit.register(cluster.leave)
+    
+    # 启动后台线程检查库存
+    stock_checker_thread = threading.Thread(target=background_stock_checker, daemon=True)
+    stock_checker_thread.start()
+    
+    # 在后台线程中初始化库存数据，使用批量模式并行请求
+    init_thread = threading.Thread(
+        target=check_all_models_stock,
+        kwargs={"batch_mode": True},
+        daemon=True
+    )
+    init_thread.start()
+
 if __name__ == '__main__':
     try:
-        # 启动后台线程检查库存
-        stock_checker_thread = threading.Thread(target=background_stock_checker, daemon=True)
-        stock_checker_thread.start()
-        
-        # 在后台线程中初始化库存数据，使用批量模式并行请求
-        init_thread = threading.Thread(
-            target=check_all_models_stock,
-            kwargs={"batch_mode": True},
-            daemon=True
-        )
-        init_thread.start()
+        start_background_tasks()
         
         # 查找可用端口
         port = find_free_port()
         if port is None:
-            print("警告：无法找到可用端口，尝试使用默认3000端口")
+            log.warning("无法找到可用端口，尝试使用默认端口", port=5000)
             port = 5000
         
-        print(f"正在启动服务器，端口: {port}")
+        start_stream_server()
+        log.info("正在启动服务器", port=port)
         # 使用localhost而不是0.0.0.0，减少权限问题
         app.run(host='localhost', port=port, debug=False)
         
     except OSError as e:
-        print(f"启动服务器失败: {e}")
+        log.error("启动服务器失败", error=str(e))
         print("如果看到'以一种访问权限不允许的方式做了一个访问套接字的尝试'错误，请尝试:")
         print("1. 检查端口是否已被占用")
         print("2. 以管理员权限运行程序")
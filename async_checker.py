@@ -0,0 +1,277 @@
+"""
+异步库存检查引擎
+在单个事件循环中以协程方式执行一轮查询，替代每个型号一个线程的方式
+依赖 httpx (pip install 'httpx[http2]')，未安装时仍可使用线程引擎
+"""
+
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 可选依赖
+    httpx = None
+
+# 一个查询任务: 请求地址、查询参数，以及该请求覆盖的 (型号名称, 型号代码) 列表
+QueryJob = namedtuple("QueryJob", ["url", "params", "models"])
+
+
+class RetryExhausted(Exception):
+    """重试策略放弃重试时交给结果回调的错误"""
+    def __init__(self, message="未能获取库存信息"):
+        super().__init__(message)
+
+
+class AsyncStockChecker:
+    """
+    异步检查引擎
+    在后台线程中运行一个事件循环，所有请求共享 HTTP/2 长连接客户端，
+    并发数由信号量限制，每个请求有独立的超时
+    """
+    def __init__(self, max_concurrency=5, timeout=10.0, http2=True):
+        if httpx is None:
+            raise RuntimeError("异步引擎需要安装 httpx: pip install 'httpx[http2]'")
+        self.timeout = timeout
+        self.http2 = http2
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        self._clients = {}
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # submit_sweep 返回的 Future -> 该轮的选项，用于 cancel_sweep 找到事件循环中的任务
+        self._sweeps = {}
+
+    def start(self):
+        """启动事件循环线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="async-stock-checker", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _get_client(self, proxy_url=None, lane=0):
+        """按代理获取共享客户端，同一代理的请求复用连接；lane 不同的客户端使用各自的连接（对冲请求用）"""
+        client = self._clients.get((proxy_url, lane))
+        if client is None:
+            limits = httpx.Limits(max_connections=max(self._max_concurrency, 1) * 2,
+                                  max_keepalive_connections=max(self._max_concurrency, 1))
+            client = httpx.AsyncClient(http2=self.http2, proxy=proxy_url, limits=limits,
+                                       timeout=self.timeout)
+            self._clients[(proxy_url, lane)] = client
+        return client
+
+    async def _pace(self, rate_limiter, identity):
+        """向速率限制器预约发送时间，在事件循环中等待而不阻塞其他协程"""
+        wait = rate_limiter.reserve(identity)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _send(self, job, options, proxies, lane=0):
+        """经指定出口发送一次请求，HTTP 错误状态码会抛出异常"""
+        proxy_url = proxies.get("https") if proxies else None
+        started = time.time()
+        try:
+            await self._pace(options["rate_limiter"], proxy_url or "direct")
+            started = time.time()
+            response = await self._get_client(proxy_url, lane).get(
+                job.url, params=job.params, headers=options["headers_factory"](job), timeout=self.timeout)
+            response.raise_for_status()
+        except asyncio.CancelledError:
+            # 被取消的请求（对冲落后的一方、本轮取消或到期）没有结果，不计入统计，
+            # 但要释放出口上的半开探测，否则该代理不会再被选中
+            if options["cancel_reporter"]:
+                options["cancel_reporter"](proxies)
+            raise
+        except Exception as e:
+            if options["result_reporter"]:
+                options["result_reporter"](proxies, started, e)
+            raise
+        if options["result_reporter"]:
+            options["result_reporter"](proxies, started)
+        return response
+
+    async def _fetch(self, job, options):
+        """
+        发送查询请求；启用对冲时，主请求超过对冲阈值仍未返回则经另一个出口再发一次，
+        先返回有效响应的一方胜出，另一方被取消
+        """
+        proxies = options["proxy_getter"]() if options["proxy_getter"] else None
+        primary = asyncio.ensure_future(self._send(job, options, proxies))
+        tasks = [primary]
+        try:
+            policy = options["hedge_policy"]
+            if policy is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=policy.threshold())
+            if done or not policy.try_hedge():
+                return await primary
+
+            proxy_url = proxies.get("https") if proxies else None
+            hedge_proxies = options["hedge_proxy_getter"](proxy_url) \
+                if proxy_url and options["hedge_proxy_getter"] else None
+            # 没有其他代理时经同一出口的另一个客户端（另一条连接）发送
+            hedge = asyncio.ensure_future(self._send(job, options, hedge_proxies or proxies,
+                                                     lane=0 if hedge_proxies else 1))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                if winner is not None:
+                    if options["hedge_reporter"]:
+                        options["hedge_reporter"](winner is hedge)
+                    return winner.result()
+            raise error
+        finally:
+            # 胜出后取消落后的一方；本轮被取消时 asyncio.wait 不会取消等待中的请求，在此一并取消，
+            # 并等它们处理完取消（释放半开探测）后再返回，本轮结束时不会留下仍在运行的请求
+            cancelled = [task for task in tasks if not task.done()]
+            for task in cancelled:
+                task.cancel()
+            if cancelled:
+                await asyncio.wait(cancelled)
+
+    async def _run_job(self, job, handler, options):
+        """执行单个查询任务，失败或结果不完整时按需重试"""
+        max_retries = options["max_retries"] if options["batch_mode"] else 0
+        for attempt in range(max_retries + 1):
+            final = attempt >= max_retries
+            data, error = None, None
+            async with self._semaphore:
+                try:
+                    response = await self._fetch(job, options)
+                    data = response.json()
+                except Exception as e:
+                    error = e
+
+            retry_job = handler(job, data, error, final)
+            if retry_job is None or final:
+                return
+            delay = options["retry_delay"](retry_job, error, attempt, max_retries) if options["retry_delay"] else 0.0
+            if delay is None:
+                # 重试策略放弃（限流冷却、重试预算用尽等），剩余型号按失败处理
+                handler(retry_job, None, error or RetryExhausted(), True)
+                return
+            job = retry_job
+            await asyncio.sleep(delay)
+
+    async def _sweep(self, jobs, handler, options):
+        if options["cancelled"]:
+            return
+        if self._semaphore is None or self._max_concurrency != options["max_concurrency"]:
+            self._max_concurrency = options["max_concurrency"]
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        sweep = asyncio.gather(*(self._run_job(job, handler, options) for job in jobs))
+        options["gathered"] = sweep
+        # 本轮被取消时 gather 以 CancelledError 结束，取出异常避免事件循环报告未处理的异常
+        sweep.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            if options["deadline"] is None:
+                await sweep
+            else:
+                # 超过截止时间后取消仍在进行的任务并等待其结束，未完成的型号由调用方处理
+                await asyncio.wait_for(sweep, timeout=max(options["deadline"] - time.time(), 0))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # cancel_sweep 取消的 gather 在全部任务结束后才以 CancelledError 完成，本轮正常返回
+            if not options["cancelled"]:
+                raise
+
+    def _cancel_in_loop(self, options):
+        options["cancelled"] = True
+        if options["gathered"] is not None:
+            options["gathered"].cancel()
+
+    def submit_sweep(self, jobs, handler, headers_factory, rate_limiter, max_concurrency=5,
+                     proxy_getter=None, result_reporter=None, cancel_reporter=None, retry_delay=None,
+                     hedge_policy=None, hedge_proxy_getter=None, hedge_reporter=None, batch_mode=True, max_retries=2,
+                     deadline=None):
+        """
+        提交一轮查询，立即返回 concurrent.futures.Future
+
+        参数:
+            jobs: QueryJob 列表
+            handler: 结果回调 handler(job, data, error, final)，在事件循环线程中调用；
+                     返回新的 QueryJob 表示需要重试（例如部分型号缺失），返回 None 表示完成
+            headers_factory: 构造请求头的函数 headers_factory(job)，可按任务所属地区设置请求头
+            rate_limiter: 速率限制器，按代理身份预约发送时间
+            max_concurrency: 最大并发请求数
+            proxy_getter: 返回 requests 风格代理字典的函数，None 表示不使用代理
+            result_reporter: 请求结果回调 result_reporter(proxies, started, error)，用于代理健康统计
+            cancel_reporter: 请求被取消时的回调 cancel_reporter(proxies)，用于释放代理的半开探测
+            retry_delay: 重试决定 retry_delay(job, error, attempt, max_retries)，返回重试前等待的秒数，
+                         None 表示放弃；未提供时立即重试
+            hedge_policy: 对冲策略（hedging.HedgePolicy），None 表示不发对冲请求
+            hedge_proxy_getter: 返回另一个代理的函数 hedge_proxy_getter(exclude)，没有其他代理时返回 None
+            hedge_reporter: 对冲结果回调 hedge_reporter(won)，won 表示对冲请求先返回
+            batch_mode: 是否为批量模式 (失败时重试)
+            max_retries: 最大重试次数
+            deadline: 本轮的截止时间（time.time() 时间戳），到期时取消仍在进行的任务；None 表示不限
+
+        取消本轮使用 cancel_sweep(future)，不要直接调用 future.cancel()
+        """
+        self.start()
+        options = {
+            "headers_factory": headers_factory,
+            "rate_limiter": rate_limiter,
+            "max_concurrency": max_concurrency,
+            "proxy_getter": proxy_getter,
+            "result_reporter": result_reporter,
+            "cancel_reporter": cancel_reporter,
+            "retry_delay": retry_delay,
+            "hedge_policy": hedge_policy,
+            "hedge_proxy_getter": hedge_proxy_getter,
+            "hedge_reporter": hedge_reporter,
+            "batch_mode": batch_mode,
+            "max_retries": max_retries,
+            "deadline": deadline,
+            "cancelled": False,
+            "gathered": None,
+        }
+        future = asyncio.run_coroutine_threadsafe(self._sweep(jobs, handler, options), self._loop)
+        self._sweeps[future] = options
+        future.add_done_callback(lambda done: self._sweeps.pop(done, None))
+        return future
+
+    def cancel_sweep(self, future):
+        """
+        取消 submit_sweep 提交的一轮查询：事件循环中本轮的任务被取消，全部结束后 future 才完成
+        直接调用 future.cancel() 会让 future 在任务结束前就被标记为完成
+        """
+        options = self._sweeps.get(future)
+        if options is not None:
+            self._loop.call_soon_threadsafe(self._cancel_in_loop, options)
+
+    def close(self):
+        """关闭所有客户端并停止事件循环"""
+        if self._loop is None:
+            return
+
+        async def close_clients():
+            for client in self._clients.values():
+                await client.aclose()
+            self._clients.clear()
+
+        asyncio.run_coroutine_threadsafe(close_clients(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
@@ -0,0 +1,77 @@
+"""
+线程引擎与异步引擎的对比基准
+使用本地模拟接口，测量一轮完整查询的耗时与峰值线程数
+
+示例:
+    python benchmarks/bench_engines.py --rounds 3 --latency 0.2 --concurrency 10
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_apple_api import start_mock_server
+
+
+def measure(app, engine, batched, rounds):
+    """运行若干轮查询，返回 (平均耗时, 峰值线程数)"""
+    app.CONFIG['engine'] = engine
+    app.CONFIG['batched_query'] = batched
+    # 预热一轮，排除建立连接和创建事件循环的开销
+    app.check_all_models_stock(batch_mode=False)
+    peak_threads = threading.active_count()
+    stop = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not stop.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        app.check_all_models_stock(batch_mode=False)
+        durations.append(time.perf_counter() - start)
+    stop.set()
+    sampler.join()
+    return sum(durations) / len(durations), peak_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线程引擎与异步引擎的对比基准")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟接口的响应延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1000.0, help="每个出口每秒允许的请求数")
+    args = parser.parse_args()
+
+    server, api, base_url = start_mock_server(latency=args.latency, seed=1)
+    os.environ["APPLE_API_BASE"] = base_url
+    os.environ.setdefault("STOCK_LOG_LEVEL", "WARNING")
+    import app
+
+    app.CONFIG['batch_size'] = args.concurrency
+    app.rate_limiter.configure(rate_per_second=args.rate, burst=args.concurrency)
+
+    print(f"{'引擎':<8}{'合并查询':<10}{'平均耗时(s)':>12}{'峰值线程':>10}{'请求数':>8}")
+    for batched in (False, True):
+        for engine in ("thread", "async"):
+            before = api.request_count
+            duration, peak = measure(app, engine, batched, args.rounds)
+            requests_per_round = (api.request_count - before) // (args.rounds + 1)
+            print(f"{engine:<8}{str(batched):<10}{duration:>12.3f}{peak:>10}{requests_per_round:>8}")
+
+    if app.async_engine is not None:
+        app.async_engine.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
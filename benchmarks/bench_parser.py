@@ -0,0 +1,157 @@
+"""
+取货库存响应解析的微基准
+对比原来的解析方式（先把响应体转成文本再完整解码，为每个门店新建字典）与 pickup_parser，
+输出每个响应的解码耗时、解析过程的峰值内存，以及保留结果时每个响应新增的内存块数
+
+示例:
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --record   # 用本地模拟接口重新录制样本
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, ROOT)
+
+from pickup_parser import PickupParser
+
+# 录制样本时请求的型号代码
+PARTS = [
+    "MFYN4ZA/A", "MFYT4ZA/A", "MFYW4ZA/A", "MG004ZA/A", "MFYP4ZA/A", "MFYU4ZA/A", "MFYX4ZA/A",
+    "MG014ZA/A", "MFYM4ZA/A", "MFYQ4ZA/A", "MFYV4ZA/A", "MFYY4ZA/A", "MG8H4ZA/A", "MG8M4ZA/A",
+    "MG8Q4ZA/A", "MG8J4ZA/A", "MG8N4ZA/A", "MG8R4ZA/A", "MG8G4ZA/A", "MG8K4ZA/A", "MG8P4ZA/A",
+]
+
+
+def legacy_split(content, codes):
+    """原来的解析方式：response.json() 先解码为文本，再为每个型号、每个门店新建字典"""
+    data = json.loads(content.decode("utf-8"))
+    body = data.get("body", {})
+    stores_data = (body.get("PickupMessage") or body.get("content", {}).get("pickupMessage", {})).get("stores", [])
+    results = {}
+    for code in codes:
+        stores_availability = []
+        for store in stores_data:
+            model_stock_info = (store.get("partsAvailability") or {}).get(code)
+            if model_stock_info:
+                stores_availability.append({
+                    "store": store.get("storeName"),
+                    "status": model_stock_info.get("pickupSearchQuote", "未知状态"),
+                    "available": model_stock_info.get("pickupDisplay", "unknown") == "available"
+                })
+            else:
+                stores_availability.append({
+                    "store": store.get("storeName"),
+                    "status": "unknown",
+                    "available": False
+                })
+        results[code] = stores_availability
+    return results
+
+
+def record_fixtures():
+    """从本地模拟接口录制样本响应"""
+    from mock_apple_api import MockAppleAPI
+
+    os.makedirs(FIXTURES, exist_ok=True)
+    # 中国大陆的门店数量约为香港的六倍
+    many_stores = [f"Apple Store {index:02d}" for index in range(42)]
+    # verbose 样本带有真实接口中的门店地址、营业时间、消息文案等字段，42 家门店的样本只保留必要字段以控制体积
+    fixtures = {
+        "pickup_single_7stores.json": (MockAppleAPI(seed=1, verbose=True), PARTS[:1], False),
+        "fulfillment_21parts_7stores.json": (MockAppleAPI(seed=2, verbose=True), PARTS, True),
+        "fulfillment_21parts_42stores.json": (MockAppleAPI(stores=many_stores, seed=3), PARTS, True),
+        "fulfillment_missing_parts.json": (MockAppleAPI(drop_parts=PARTS[::3], seed=4, verbose=True), PARTS, True),
+        "fulfillment_compact_7stores.json": (MockAppleAPI(seed=5), PARTS, True),
+    }
+    for name, (api, parts, nested) in fixtures.items():
+        payload = api.build_payload(parts, nested=nested)
+        with open(os.path.join(FIXTURES, name), "w", encoding="utf-8") as f:
+            json.dump({"parts": parts, "response": payload}, f, ensure_ascii=False)
+        print(f"已录制 {name}")
+
+
+def load_fixtures():
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        content = json.dumps(fixture["response"], ensure_ascii=False).encode("utf-8")
+        fixtures.append((os.path.basename(path), fixture["parts"], content))
+    return fixtures
+
+
+def time_per_call(func, seconds):
+    """每次调用的平均耗时（微秒），每次测量约 seconds 秒，取五次测量的最小值"""
+    start = time.perf_counter()
+    func()
+    iterations = max(1, int(seconds / max(time.perf_counter() - start, 1e-6)))
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def memory_per_call(func, keep):
+    """
+    返回 (单次调用的峰值内存 KB, 保留 keep 次调用结果时每次新增的内存块数)
+    模拟连续多轮查询的结果被同时引用（快照、历史、推送缓冲区）
+    """
+    func()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    baseline = tracemalloc.take_snapshot()
+    kept = [func() for _ in range(keep)]
+    blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+    del kept
+    return (peak - before) / 1024, blocks / keep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="取货库存响应解析的微基准")
+    parser.add_argument("--record", action="store_true", help="重新录制样本后再运行")
+    parser.add_argument("--seconds", type=float, default=0.3, help="每次计时测量的大致时长（秒）")
+    parser.add_argument("--keep", type=int, default=50, help="测量保留内存时同时持有的结果数")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.record or not glob.glob(os.path.join(FIXTURES, "*.json")):
+        record_fixtures()
+
+    rows = []
+    print(f"{'样本':<36}{'解析器':<10}{'耗时(µs)':>10}{'峰值(KB)':>10}{'块/响应':>10}")
+    for name, parts, content in load_fixtures():
+        pickup_parser = PickupParser()
+        candidates = {
+            "legacy": lambda: legacy_split(content, parts),
+            "parser": lambda: pickup_parser.parse(content, parts),
+        }
+        for label, func in candidates.items():
+            micros = time_per_call(func, args.seconds)
+            peak_kb, blocks = memory_per_call(func, args.keep)
+            rows.append({"fixture": name, "parser": label, "bytes": len(content),
+                         "decode_us": round(micros, 2), "peak_kb": round(peak_kb, 1),
+                         "retained_blocks": round(blocks, 1)})
+            print(f"{name:<36}{label:<10}{micros:>10.1f}{peak_kb:>10.1f}{blocks:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
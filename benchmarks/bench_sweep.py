@@ -0,0 +1,374 @@
+"""
+离线查询基准
+在子进程中启动本地模拟接口（mock_apple_api.py），在本进程中运行 app 的查询流程，
+按场景测量一轮查询的耗时、每秒请求数、补货被发现所需时间（p50/p99）以及每轮的 CPU 与内存，
+结果保存为 JSON，便于比较不同版本
+
+场景:
+    baseline       固定 50ms 延迟
+    lognormal      对数正态延迟（中位数 80ms，长尾）
+    rate_limited   10% 请求返回 429（Retry-After: 1）
+    forbidden      5% 请求返回 403
+    slow_proxies   经 3 个代理出口，其中一个额外慢 400ms
+    large_payload  42 家门店并附带完整门店详情的响应体
+    replay         回放 baseline 场景录制的响应轨迹（或 --trace 指定的轨迹），不测量补货发现时间
+
+示例:
+    python benchmarks/bench_sweep.py --seconds 10
+    python benchmarks/bench_sweep.py --scenario baseline --scenario slow_proxies --engine async
+    python benchmarks/bench_sweep.py --output new.json --compare benchmarks/results/old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_apple_api import make_stores
+
+SCENARIOS = {
+    "baseline": {"mock": ["--latency", "0.05"]},
+    "lognormal": {"mock": ["--latency", "lognormal:0.08,0.8"]},
+    "rate_limited": {"mock": ["--latency", "0.05", "--rate-limit-rate", "0.1", "--retry-after", "1"]},
+    "forbidden": {"mock": ["--latency", "0.05", "--forbidden-rate", "0.05"]},
+    "slow_proxies": {"mock": ["--latency", "0.05", "--slow-proxy", "0", "--slow-proxy", "0", "--slow-proxy", "0.4"],
+                     "proxies": 3},
+    "large_payload": {"mock": ["--latency", "0.05", "--verbose", "--stores", "42"], "stores": 42},
+    "replay": {"mock": [], "replay": True},
+}
+
+# 用于对比的指标，值越小越好（requests_per_second 除外）
+COMPARED = ("sweep_p50", "sweep_p99", "requests_per_second", "ttd_p50", "ttd_p99", "cpu_per_sweep", "heap_peak_kb")
+
+
+def free_port(count=1):
+    """找一段连续可用的端口，返回起始端口"""
+    while True:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            start = probe.getsockname()[1]
+        if start + count > 65535:
+            continue
+        try:
+            for port in range(start, start + count):
+                with socket.socket() as check:
+                    check.bind(("127.0.0.1", port))
+            return start
+        except OSError:
+            continue
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class MockProcess:
+    """在子进程中运行的模拟接口，使其 CPU 开销不计入被测进程"""
+    def __init__(self, port, args):
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "mock_apple_api.py"), "--port", str(port), "--seed", "1"] + args,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 10
+        while True:
+            try:
+                self.stats()
+                return
+            except requests.RequestException:
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError("模拟接口启动失败")
+                time.sleep(0.05)
+
+    def stats(self):
+        return requests.get(f"{self.base_url}/_mock/stats", timeout=2).json()
+
+    def set_availability(self, part, store, available):
+        requests.post(f"{self.base_url}/_mock/availability",
+                      json={"part": part, "store": store, "available": available}, timeout=2)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def store_available(entries, store):
+    """型号的发布结果中某门店是否有货；查询失败时结果是 {"error": ...}"""
+    return isinstance(entries, list) and any(record["store"] == store and record["available"] for record in entries)
+
+
+class RestockProbe:
+    """
+    定期把一个无货的 (型号, 门店) 改为有货，并在 app 发布的结果中等待它出现，
+    记录从改动到被发现的时间；发现后恢复为无货
+    """
+    def __init__(self, app, mock, stores, every, seed=1):
+        self.app = app
+        self.mock = mock
+        self.stores = stores
+        self.every = every
+        self.models = {code: name for name, code in app.IPHONE_17_PRO_MAX_MODELS.items()}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._stop = threading.Event()
+        self.detections = []
+        self._threads = [threading.Thread(target=self._inject_loop, daemon=True),
+                         threading.Thread(target=self._detect_loop, daemon=True)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            return len(self._pending)
+
+    def _inject_loop(self):
+        while not self._stop.wait(self.every):
+            stock = self.app.state_store.snapshot().stock
+            with self._lock:
+                candidates = [(code, store) for code in self.models for store in self.stores
+                              if (code, store) not in self._pending
+                              and not store_available(stock.get(self.models[code]), store)]
+            if not candidates:
+                continue
+            code, store = self._random.choice(candidates)
+            flipped_at = time.time()
+            self.mock.set_availability(code, store, True)
+            with self._lock:
+                self._pending[(code, store)] = flipped_at
+
+    def _detect_loop(self):
+        # 只在 app 发布结果时被唤醒，轮询本身不占用 CPU
+        for _ in self.app.stock_stream.subscribe(self.app.build_stock_snapshot, heartbeat=0.2):
+            if self._stop.is_set():
+                return
+            now = time.time()
+            stock = self.app.state_store.snapshot().stock
+            with self._lock:
+                found = [(key, flipped_at) for key, flipped_at in self._pending.items()
+                         if store_available(stock.get(self.models[key[0]]), key[1])]
+                for key, flipped_at in found:
+                    del self._pending[key]
+                    self.detections.append(now - flipped_at)
+            for (code, store), _ in found:
+                self.mock.set_availability(code, store, False)
+
+
+def run_sweeps(app, mock, seconds, interval, probe=None):
+    """在 seconds 秒内连续查询，返回每轮耗时与 CPU 时间及请求数"""
+    before = mock.stats()
+    walls, cpus = [], []
+    if probe is not None:
+        probe.start()
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        wall, cpu = time.perf_counter(), time.process_time()
+        app.check_all_models_stock(batch_mode=False)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+        time.sleep(interval)
+    elapsed = time.perf_counter() - started
+    missed = probe.stop() if probe is not None else 0
+    after = mock.stats()
+    statuses = {status: count - before["status_counts"].get(status, 0)
+                for status, count in after["status_counts"].items()}
+    return walls, cpus, after["requests"] - before["requests"], elapsed, statuses, missed
+
+
+def measure_heap(app):
+    """单独运行一轮并用 tracemalloc 记录 Python 堆峰值（与计时分开，避免追踪开销影响耗时）"""
+    tracemalloc.start()
+    try:
+        app.check_all_models_stock(batch_mode=False)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def configure_app(app, engine, proxies):
+    app.CONFIG['engine'] = engine
+    # 各场景从干净的重试状态开始，上一场景的限流暂停不影响下一场景
+    app.retry_policy.reset()
+    app.proxy_manager.clear_proxies()
+    if proxies:
+        for proxy in proxies:
+            app.proxy_manager.add_proxy(proxy)
+        app.proxy_manager.enable()
+    else:
+        app.proxy_manager.disable()
+
+
+def run_scenario(app, port, name, engine, args, trace_path):
+    scenario = SCENARIOS[name]
+    mock_args = list(scenario["mock"])
+    replay = scenario.get("replay", False)
+    if replay:
+        mock_args += ["--replay-trace", args.trace or trace_path]
+    else:
+        mock_args.append("--sticky")
+        if name == "baseline" and not args.trace:
+            mock_args += ["--record-trace", trace_path]
+    mock = MockProcess(port, mock_args)
+    try:
+        proxy_count = scenario.get("proxies", 0)
+        configure_app(app, engine, [f"http://127.0.0.1:{port + index + 1}" for index in range(proxy_count)])
+        # 预热一轮，建立连接并让 app 记录当前库存状态
+        app.check_all_models_stock(batch_mode=False)
+        probe = None if replay else RestockProbe(app, mock, make_stores(scenario.get("stores", 7)), args.restock_every)
+        walls, cpus, request_count, elapsed, statuses, missed = run_sweeps(
+            app, mock, args.seconds, args.interval, probe)
+        heap_peak = measure_heap(app)
+    finally:
+        configure_app(app, engine, [])
+        mock.stop()
+
+    detections = probe.detections if probe is not None else []
+    return {
+        "sweeps": len(walls),
+        "sweep_p50": percentile(walls, 0.5),
+        "sweep_p99": percentile(walls, 0.99),
+        "sweep_mean": sum(walls) / len(walls) if walls else None,
+        "requests": request_count,
+        "requests_per_second": request_count / elapsed if elapsed else None,
+        "status_counts": statuses,
+        "restocks_detected": len(detections),
+        "restocks_missed": missed,
+        "ttd_p50": percentile(detections, 0.5),
+        "ttd_p99": percentile(detections, 0.99),
+        "cpu_per_sweep": sum(cpus) / len(cpus) if cpus else None,
+        "heap_peak_kb": heap_peak,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_number(value, scale=1.0, digits=3):
+    return "-" if value is None else f"{value * scale:.{digits}f}"
+
+
+def print_report(results):
+    print(f"{'场景':<15}{'引擎':<8}{'轮数':>6}{'p50(ms)':>10}{'p99(ms)':>10}{'请求/秒':>10}"
+          f"{'发现p50(s)':>12}{'发现p99(s)':>12}{'CPU/轮(ms)':>12}{'堆峰值(KB)':>12}")
+    for name, engines in results.items():
+        for engine, item in engines.items():
+            print(f"{name:<15}{engine:<8}{item['sweeps']:>6}"
+                  f"{format_number(item['sweep_p50'], 1000, 1):>10}{format_number(item['sweep_p99'], 1000, 1):>10}"
+                  f"{format_number(item['requests_per_second'], 1, 1):>10}"
+                  f"{format_number(item['ttd_p50'], 1, 3):>12}{format_number(item['ttd_p99'], 1, 3):>12}"
+                  f"{format_number(item['cpu_per_sweep'], 1000, 2):>12}{format_number(item['heap_peak_kb'], 1, 1):>12}")
+
+
+def print_comparison(results, baseline):
+    """与之前保存的结果比较，列出变化超过 5% 的指标"""
+    print(f"\n与 {baseline['meta'].get('revision')} ({baseline['meta'].get('timestamp')}) 比较:")
+    for name, engines in results.items():
+        for engine, item in engines.items():
+            old = baseline["results"].get(name, {}).get(engine)
+            if not old:
+                continue
+            for key in COMPARED:
+                if item.get(key) is None or not old.get(key):
+                    continue
+                change = (item[key] - old[key]) / old[key]
+                if abs(change) < 0.05:
+                    continue
+                better = change > 0 if key == "requests_per_second" else change < 0
+                print(f"  {name}/{engine} {key}: {old[key]:.4g} -> {item[key]:.4g} "
+                      f"({change:+.0%}{'' if better else ' 退化'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线查询基准")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="默认运行全部场景")
+    parser.add_argument("--engine", action="append", choices=["thread", "async"], help="默认两种引擎都运行")
+    parser.add_argument("--seconds", type=float, default=10.0, help="每个场景每种引擎的运行时间")
+    parser.add_argument("--interval", type=float, default=0.5, help="两轮查询之间的间隔（秒）")
+    parser.add_argument("--restock-every", type=float, default=1.0, help="注入补货的间隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--batched", action="store_true", help="使用合并查询")
+    parser.add_argument("--trace", help="replay 场景回放的轨迹文件，默认使用 baseline 场景的录制")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results",
+                                                         f"sweep_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    parser.add_argument("--compare", help="与之前保存的结果文件比较")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    if "replay" in scenarios and not args.trace and "baseline" not in scenarios:
+        parser.error("replay 场景需要 --trace，或同时运行 baseline 场景以录制轨迹")
+    engines = args.engine or ["thread", "async"]
+
+    # 各场景复用同一端口，app 导入时读取的接口地址保持有效；其后的端口留给代理
+    port = free_port(4)
+    os.environ["APPLE_API_BASE"] = f"http://127.0.0.1:{port}"
+    os.environ["STOCK_HISTORY_ENABLED"] = "0"
+    os.environ.setdefault("STOCK_LOG_LEVEL", "WARNING")
+    import app
+
+    app.CONFIG['batch_size'] = args.concurrency
+    app.CONFIG['batched_query'] = args.batched
+    app.rate_limiter.configure(rate_per_second=1000.0, burst=args.concurrency)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in scenarios:
+            for engine in engines:
+                trace_path = os.path.join(workdir, f"trace_{engine}.jsonl")
+                results.setdefault(name, {})[engine] = run_scenario(app, port, name, engine, args, trace_path)
+                print(f"完成 {name}/{engine}", file=sys.stderr)
+
+    if app.async_engine is not None:
+        app.async_engine.close()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(results)
+    print(f"\n结果已保存到 {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+集群模式演示
+在一台机器上启动本地模拟接口与若干个查询节点（poller.py 子进程，共用一个 SQLite 协调库），依次验证：
+- 租约分配：每个型号只由一个节点查询，各节点分到的型号数大致相同
+- 合并视图：每个节点的 /api/stock 都包含全部型号，模拟接口中的库存变化在所有节点上出现
+- 节点失联（SIGKILL）：租约到期后其型号由其余节点接手，变化仍能在所有节点上出现
+- 节点正常退出（SIGTERM）：立即释放租约，其余节点在下一次心跳时接手
+
+示例:
+    python benchmarks/cluster_demo.py
+    python benchmarks/cluster_demo.py --nodes 4 --lease 2 --engine async
+"""
+
+import argparse
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_sweep import MockProcess, free_port, store_available
+
+
+class Node:
+    """一个查询节点子进程"""
+    def __init__(self, index, port, workdir, cluster_db, mock_url, lease, engine):
+        self.id = f"node-{index}"
+        self.url = f"http://127.0.0.1:{port}"
+        env = dict(
+            os.environ,
+            STOCK_ROLE="poller",
+            STOCK_POLLER_URL=self.url,
+            STOCK_NODE_ID=self.id,
+            STOCK_NODE_URL=self.url,
+            STOCK_CLUSTER_DB=cluster_db,
+            STOCK_CLUSTER_LEASE=str(lease),
+            STOCK_SHARED_STATE=os.path.join(workdir, f"{self.id}.json"),
+            STOCK_MATRIX_PATH=os.path.join(workdir, f"{self.id}.bin"),
+            STOCK_HISTORY_ENABLED="0",
+            STOCK_LOG_LEVEL="WARNING",
+            APPLE_API_BASE=mock_url,
+        )
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, "poller.py")], env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.engine = engine
+
+    def get(self, path):
+        return requests.get(self.url + path, timeout=5).json()
+
+    def wait_ready(self, timeout=20):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                requests.post(self.url + "/api/config", json={"engine": self.engine}, timeout=2)
+                return
+            except requests.RequestException:
+                time.sleep(0.1)
+        raise RuntimeError(f"{self.id} 启动失败")
+
+    def stop(self, sig=signal.SIGTERM):
+        if self.process.poll() is None:
+            self.process.send_signal(sig)
+        self.process.wait()
+
+
+def wait_for(condition, timeout, interval=0.1):
+    """等待 condition() 为真，返回所用的秒数；超时返回 None"""
+    started = time.time()
+    while time.time() - started < timeout:
+        if condition():
+            return time.time() - started
+        time.sleep(interval)
+    return None
+
+
+def lease_owners(cluster_db):
+    """协调库中每个型号当前的租约持有节点"""
+    connection = sqlite3.connect(cluster_db)
+    try:
+        return dict(connection.execute("SELECT model, node_id FROM leases WHERE expires >= ?", (time.time(),)))
+    finally:
+        connection.close()
+
+
+def result_writers(cluster_db):
+    """协调库中每个型号最近一次结果的写入节点"""
+    connection = sqlite3.connect(cluster_db)
+    try:
+        return dict(connection.execute("SELECT model, node_id FROM results"))
+    finally:
+        connection.close()
+
+
+def balanced(cluster_db, nodes, total):
+    """全部型号都有租约，且每个存活节点都分到了型号"""
+    owners = lease_owners(cluster_db)
+    return len(owners) == total and set(owners.values()) == {node.id for node in nodes}
+
+
+def views_agree(nodes, model, store, available):
+    """每个节点的合并视图中该型号在该门店的状态都已变为 available"""
+    for node in nodes:
+        try:
+            stock = node.get("/api/stock")["stock"]
+        except (requests.RequestException, ValueError):
+            return False
+        if store_available(stock.get(model), store) != available:
+            return False
+    return True
+
+
+def propagate(mock, nodes, codes, model, store, timeout):
+    """在模拟接口中把 (型号, 门店) 改为有货，返回所有节点都看到变化所用的秒数"""
+    mock.set_availability(codes[model], store, True)
+    return wait_for(lambda: views_agree(nodes, model, store, True), timeout)
+
+
+def report(label, value):
+    print(f"  {label:<28} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="集群模式演示")
+    parser.add_argument("--nodes", type=int, default=3, help="查询节点数")
+    parser.add_argument("--lease", type=float, default=3.0, help="租约时长（秒）")
+    parser.add_argument("--engine", choices=("thread", "async"), default="thread")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("STOCK_LOG_LEVEL", "WARNING")
+    os.environ.setdefault("STOCK_HISTORY_ENABLED", "0")
+    from sku_registry import SkuRegistry
+    from mock_apple_api import DEFAULT_STORES
+
+    codes = SkuRegistry.load(os.path.join(ROOT, "catalog.json")).model_codes
+    total = len(codes)
+    workdir = tempfile.mkdtemp(prefix="stock-cluster-")
+    cluster_db = os.path.join(workdir, "cluster.db")
+    mock = MockProcess(free_port(), ["--latency", "0.05", "--sticky", "--available-ratio", "0"])
+    base = free_port(args.nodes)
+    nodes = [Node(index, base + index, workdir, cluster_db, mock.base_url, args.lease, args.engine)
+             for index in range(args.nodes)]
+    ok = True
+    try:
+        for node in nodes:
+            node.wait_ready()
+        print(f"{args.nodes} 个节点，{total} 个型号，租约 {args.lease}s，引擎 {args.engine}")
+
+        elapsed = wait_for(lambda: balanced(cluster_db, nodes, total), args.lease * 4)
+        counts = Counter(lease_owners(cluster_db).values())
+        print("租约分配")
+        report("分配完成用时", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        report("各节点型号数", dict(sorted(counts.items())))
+        ok &= elapsed is not None
+
+        elapsed = wait_for(lambda: all(len(node.get("/api/stock")["lastUpdated"]) == total for node in nodes), 30)
+        print("合并视图")
+        report("各节点都有全部型号", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        ok &= elapsed is not None
+        owners = lease_owners(cluster_db)
+        # 只有租约持有者写入结果：新的持有者完成首次查询后，每个型号的结果都由其持有者写入
+        elapsed = wait_for(lambda: result_writers(cluster_db) == owners, 30)
+        report("结果写入者与租约一致", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        ok &= elapsed is not None
+
+        victim = nodes[-1]
+        model = next(model for model, owner in owners.items() if owner == victim.id)
+        elapsed = propagate(mock, nodes, codes, model, DEFAULT_STORES[0], 30)
+        report("库存变化出现在所有节点", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        ok &= elapsed is not None
+
+        print(f"节点失联（SIGKILL {victim.id}）")
+        victim.stop(signal.SIGKILL)
+        survivors = nodes[:-1]
+        elapsed = wait_for(lambda: balanced(cluster_db, survivors, total), args.lease * 4)
+        report("其余节点接手用时", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        ok &= elapsed is not None
+        elapsed = propagate(mock, survivors, codes, model, DEFAULT_STORES[1], 30)
+        report("接手后的变化出现", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+        ok &= elapsed is not None
+
+        if len(survivors) > 1:
+            leaving = survivors[-1]
+            model = next(model for model, owner in lease_owners(cluster_db).items() if owner == leaving.id)
+            print(f"节点正常退出（SIGTERM {leaving.id}）")
+            leaving.stop()
+            survivors = survivors[:-1]
+            elapsed = wait_for(lambda: balanced(cluster_db, survivors, total), args.lease * 4)
+            report("其余节点接手用时", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+            ok &= elapsed is not None
+            elapsed = propagate(mock, survivors, codes, model, DEFAULT_STORES[2], 30)
+            report("接手后的变化出现", f"{elapsed:.1f}s" if elapsed is not None else "超时")
+            ok &= elapsed is not None
+
+        print("集群状态")
+        for node in survivors:
+            status = node.get("/api/cluster")
+            report(node.id, f"持有 {status['owned']}，写入 {status['written']}，拒绝 {status['rejected']}，"
+                            f"合并 {status['applied']}")
+    finally:
+        for node in nodes:
+            node.stop()
+        mock.stop()
+    print("通过" if ok else "失败")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
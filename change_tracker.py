@@ -0,0 +1,203 @@
+"""
+库存变化跟踪
+把每次查询结果与上一次的状态比较，只记录发生变化的 (型号, 门店) 组合。
+当前状态保存在紧凑的矩阵中：门店名称与状态文字都被驻留为整数编号，
+每个型号一行状态编号数组加一个有货门店位图；变化事件写入定长环形缓冲区
+"""
+
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+
+# 一条变化事件；old_status 为 None 表示该门店首次出现。
+# was_available 是变化前是否有货：型号已有数据、门店首次出现时为 False，型号首次出现（之前状态未知）时为 None
+ChangeEvent = namedtuple("ChangeEvent", ["seq", "model", "store", "old_status", "new_status", "available", "timestamp",
+                                         "was_available"], defaults=(None,))
+
+
+class _Interner:
+    """把字符串映射为从 1 开始的整数编号，0 保留表示缺失"""
+    def __init__(self):
+        self._ids = {}
+        self._values = [None]
+
+    def intern(self, value):
+        index = self._ids.get(value)
+        if index is None:
+            index = len(self._values)
+            self._ids[value] = index
+            self._values.append(value)
+        return index
+
+    def lookup(self, index):
+        return self._values[index]
+
+    def find(self, value):
+        """查找已驻留字符串的编号，不存在时返回 None"""
+        return self._ids.get(value)
+
+    def __len__(self):
+        return len(self._values) - 1
+
+
+class ChangeTracker:
+    """
+    库存状态矩阵与变化事件流
+
+    参数:
+        capacity: 环形缓冲区保留的最大事件数
+    """
+    def __init__(self, capacity=5000):
+        self._lock = threading.Lock()
+        self._stores = _Interner()
+        self._statuses = _Interner()
+        # 型号 -> 各门店状态编号（按门店编号索引，0 表示该门店没有数据）
+        self._rows = {}
+        # 型号 -> 有货门店位图（第 i 位对应门店编号 i）
+        self._available = {}
+        self._events = deque(maxlen=capacity)
+        self._seq = 0
+
+    @property
+    def latest_seq(self):
+        """最新一条事件的序号，没有事件时为 0"""
+        return self._seq
+
+    def apply(self, model, stores_availability, timestamp=None):
+        """
+        合并一个型号的最新查询结果并返回产生的变化事件
+
+        参数:
+            model: 型号名称
+            stores_availability: 门店库存列表 [{"store", "status", "available"}, ...]
+            timestamp: 观测时间，默认当前时间
+        """
+        timestamp = timestamp or time.time()
+        events = []
+        with self._lock:
+            known = model in self._rows
+            row = self._rows.setdefault(model, array("H"))
+            bitmap = self._available.get(model, 0)
+
+            for store in stores_availability:
+                store_id = self._stores.intern(store.get("store"))
+                status_id = self._statuses.intern(store.get("status"))
+                if store_id >= len(row):
+                    row.extend([0] * (store_id + 1 - len(row)))
+                available = bool(store.get("available"))
+                was_available = bool(bitmap >> store_id & 1)
+                if available:
+                    bitmap |= 1 << store_id
+                else:
+                    bitmap &= ~(1 << store_id)
+
+                # 状态文字不变但有货标记变化也算一次变化
+                old_status_id = row[store_id]
+                if old_status_id == status_id and was_available == available:
+                    continue
+                row[store_id] = status_id
+
+                self._seq += 1
+                event = ChangeEvent(
+                    self._seq,
+                    model,
+                    self._stores.lookup(store_id),
+                    self._statuses.lookup(old_status_id) if old_status_id else None,
+                    self._statuses.lookup(status_id),
+                    available,
+                    timestamp,
+                    was_available if known else None,
+                )
+                self._events.append(event)
+                events.append(event)
+
+            self._available[model] = bitmap
+        return events
+
+    def replay(self, events):
+        """
+        合并其他进程产生的事件，保留原有序号；序号不大于当前最新序号的事件会被忽略
+        用于 Web 进程跟随查询进程，使 /api/changes 的序号在各进程间一致
+
+        参数:
+            events: ChangeEvent 列表，按序号递增
+        """
+        with self._lock:
+            for event in events:
+                if event.seq <= self._seq:
+                    continue
+                row = self._rows.setdefault(event.model, array("H"))
+                store_id = self._stores.intern(event.store)
+                if store_id >= len(row):
+                    row.extend([0] * (store_id + 1 - len(row)))
+                row[store_id] = self._statuses.intern(event.new_status)
+                bitmap = self._available.get(event.model, 0)
+                if event.available:
+                    bitmap |= 1 << store_id
+                else:
+                    bitmap &= ~(1 << store_id)
+                self._available[event.model] = bitmap
+                self._events.append(event)
+                self._seq = event.seq
+
+    def reset(self):
+        """清空矩阵与事件（事件来源进程重启、序号重新开始时使用）"""
+        with self._lock:
+            self._rows.clear()
+            self._available.clear()
+            self._events.clear()
+            self._seq = 0
+
+    def events_since(self, seq, limit=None):
+        """
+        获取序号大于 seq 的事件
+
+        返回:
+            (事件列表, 是否有事件已被环形缓冲区淘汰)
+        """
+        with self._lock:
+            events = [event for event in self._events if event.seq > seq]
+            truncated = bool(self._events) and self._events[0].seq > seq + 1
+        if limit is not None:
+            events = events[:limit]
+        return events, truncated
+
+    def available_stores(self, model):
+        """获取某型号当前有货的门店列表"""
+        with self._lock:
+            bitmap = self._available.get(model, 0)
+            stores = []
+            store_id = 0
+            while bitmap:
+                if bitmap & 1:
+                    stores.append(self._stores.lookup(store_id))
+                bitmap >>= 1
+                store_id += 1
+            return stores
+
+    def get_status(self, model, store):
+        """获取某型号在某门店的当前状态文字，没有数据时返回 None"""
+        with self._lock:
+            row = self._rows.get(model)
+            store_id = self._stores.find(store)
+            if row is None or store_id is None or store_id >= len(row) or not row[store_id]:
+                return None
+            return self._statuses.lookup(row[store_id])
+
+    def get_stats(self):
+        """获取矩阵规模与事件缓冲区的使用情况"""
+        with self._lock:
+            return {
+                "models": len(self._rows),
+                "stores": len(self._stores),
+                "statuses": len(self._statuses),
+                "matrix_bytes": sum(row.itemsize * len(row) for row in self._rows.values()),
+                "events_buffered": len(self._events),
+                "events_capacity": self._events.maxlen,
+                "latest_seq": self._seq,
+            }
+
+
+# 创建全局变化跟踪实例
+change_tracker = ChangeTracker()
@@ -0,0 +1,326 @@
+"""
+集群模式
+多个查询节点共用一个 SQLite 协调库（WAL 模式，同一台机器或共享磁盘上的多个进程），按租约划分型号：
+- 每个节点定期写入心跳并续约自己持有的租约，心跳超过租约时长未更新的节点视为离线
+- 型号按 rendezvous hash 分配给在线节点；节点只认领分给自己且空闲或已过期的租约，
+  不再分给自己的租约主动释放。节点退出或失联后，其余节点在租约到期后的下一次心跳中接手
+- 查询结果写入同一张结果表，只有仍持有该型号租约的节点才能写入（租约过期的旧节点写入会被拒绝）；
+  每个节点跟随其他节点写入的结果，都能提供合并后的完整视图
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from structured_log import get_logger
+
+log = get_logger("cluster")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    url TEXT,
+    heartbeat REAL NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    model TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    model TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    last_updated TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_version ON results (version);
+"""
+
+
+def default_node_id():
+    """默认节点标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def rendezvous_owner(model, nodes):
+    """按 rendezvous hash 选出型号的负责节点：节点增减时只有落在该节点上的型号会移动"""
+    return max(nodes, key=lambda node: hashlib.blake2b(f"{node}\0{model}".encode(), digest_size=8).digest())
+
+
+class ClusterCoordinator:
+    """
+    基于 SQLite 租约的型号分片
+
+    参数:
+        path: 协调库文件路径，所有节点使用同一个文件
+        node_id: 本节点标识，各节点不能重复
+        models: 全部型号名称
+        lease_seconds: 租约时长（秒），心跳间隔为其三分之一
+        url: 本节点对外的访问地址，查询其他节点负责的型号时返回给调用方
+        poll_interval: 跟随其他节点查询结果的间隔（秒）
+    """
+    def __init__(self, path, node_id, models, lease_seconds=15.0, url=None, poll_interval=0.5):
+        self.path = path
+        self.node_id = node_id
+        self.models = list(models)
+        self.lease_seconds = lease_seconds
+        self.url = url
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._start_lock = threading.Lock()
+        self._threads = []
+        self._stopped = threading.Event()
+        self._owned = frozenset()
+        # 本节点持有的租约在此时间之前有效（最近一次成功心跳 + 租约时长）
+        self._valid_until = 0.0
+        self._last_version = 0
+        self.stats = {"heartbeats": 0, "heartbeat_errors": 0, "gained": 0, "lost": 0,
+                      "written": 0, "rejected": 0, "applied": 0}
+
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        connection.commit()
+
+    def _connection(self):
+        """每个线程一个连接，WAL 模式下读写互不阻塞"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, work):
+        """在写事务中执行 work(connection)；BEGIN IMMEDIATE 让各节点的写入按顺序进行"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def heartbeat(self, now=None):
+        """
+        写入心跳、续约并按在线节点重新分配租约
+
+        返回:
+            (新获得的型号, 失去的型号)
+        """
+        now = now or time.time()
+        expires = now + self.lease_seconds
+
+        def work(connection):
+            connection.execute(
+                "INSERT INTO nodes (node_id, url, heartbeat, started) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (node_id) DO UPDATE SET url = excluded.url, heartbeat = excluded.heartbeat",
+                (self.node_id, self.url, now, now))
+            live = [row[0] for row in connection.execute(
+                "SELECT node_id FROM nodes WHERE heartbeat >= ?", (now - self.lease_seconds,))]
+            desired = {model for model in self.models if rendezvous_owner(model, live) == self.node_id}
+            held = {row[0] for row in connection.execute(
+                "SELECT model FROM leases WHERE node_id = ?", (self.node_id,))}
+            connection.executemany("DELETE FROM leases WHERE model = ? AND node_id = ?",
+                                   [(model, self.node_id) for model in held - desired])
+            connection.execute("UPDATE leases SET expires = ? WHERE node_id = ?", (expires, self.node_id))
+            # 只认领空闲或已过期的租约；仍由其他节点持有的型号等它释放或过期
+            connection.executemany(
+                "INSERT INTO leases (model, node_id, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (model) DO UPDATE SET node_id = excluded.node_id, expires = excluded.expires "
+                "WHERE leases.expires < ?",
+                [(model, self.node_id, expires, now) for model in desired - held])
+            return frozenset(row[0] for row in connection.execute(
+                "SELECT model FROM leases WHERE node_id = ?", (self.node_id,)))
+
+        owned = self._write(work)
+        previous = self._owned if self._valid_until > now else frozenset()
+        self._owned = owned
+        self._valid_until = expires
+        gained, lost = sorted(owned - previous), sorted(previous - owned)
+        self.stats["heartbeats"] += 1
+        self.stats["gained"] += len(gained)
+        self.stats["lost"] += len(lost)
+        return gained, lost
+
+    def owns(self, model, now=None):
+        """本节点当前是否持有该型号的租约（心跳中断超过租约时长后不再认为持有）"""
+        return (now or time.time()) < self._valid_until and model in self._owned
+
+    def owned(self, now=None):
+        """本节点当前持有租约的型号"""
+        return self._owned if (now or time.time()) < self._valid_until else frozenset()
+
+    def owner_of(self, model, now=None):
+        """
+        型号当前的负责节点
+
+        返回:
+            (节点标识, 节点地址)，没有有效租约时返回 None
+        """
+        row = self._connection().execute(
+            "SELECT leases.node_id, nodes.url FROM leases LEFT JOIN nodes ON nodes.node_id = leases.node_id "
+            "WHERE leases.model = ? AND leases.expires >= ?", (model, now or time.time())).fetchone()
+        return tuple(row) if row is not None else None
+
+    def write_results(self, results, updated, now=None):
+        """
+        把本节点的查询结果写入结果表；已失去租约的型号不写入
+
+        参数:
+            results: {型号名称: 门店库存列表 或 {"error": 错误信息}}
+            updated: 更新时间文字
+
+        返回:
+            写入的型号数
+        """
+        now = now or time.time()
+
+        def work(connection):
+            version = connection.execute("SELECT COALESCE(MAX(version), 0) FROM results").fetchone()[0]
+            written = 0
+            for model, result in results.items():
+                version += 1
+                cursor = connection.execute(
+                    "INSERT INTO results (model, node_id, stock, last_updated, version) "
+                    "SELECT ?, ?, ?, ?, ? WHERE EXISTS "
+                    "(SELECT 1 FROM leases WHERE model = ? AND node_id = ? AND expires >= ?) "
+                    "ON CONFLICT (model) DO UPDATE SET node_id = excluded.node_id, stock = excluded.stock, "
+                    "last_updated = excluded.last_updated, version = excluded.version",
+                    (model, self.node_id, json.dumps(result, ensure_ascii=False), updated, version,
+                     model, self.node_id, now))
+                written += cursor.rowcount
+            return written
+
+        written = self._write(work)
+        self.stats["written"] += written
+        self.stats["rejected"] += len(results) - written
+        return written
+
+    def results_since(self, version):
+        """
+        其他节点在某版本之后写入的结果
+
+        返回:
+            ([(型号名称, 节点标识, 结果, 更新时间)], 最新版本号)
+        """
+        rows = self._connection().execute(
+            "SELECT model, node_id, stock, last_updated, version FROM results WHERE version > ? ORDER BY version",
+            (version,)).fetchall()
+        if not rows:
+            return [], version
+        return ([(model, node_id, json.loads(stock), last_updated)
+                 for model, node_id, stock, last_updated, _ in rows if node_id != self.node_id], rows[-1][4])
+
+    def leave(self):
+        """退出集群：删除本节点的心跳与租约，其余节点在下一次心跳时立即接手"""
+        self._stopped.set()
+        self._owned = frozenset()
+        self._valid_until = 0.0
+
+        def work(connection):
+            connection.execute("DELETE FROM leases WHERE node_id = ?", (self.node_id,))
+            connection.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+
+        try:
+            self._write(work)
+        except sqlite3.Error as e:
+            log.warning("退出集群失败", node=self.node_id, error=str(e))
+
+    def start(self, on_change, apply_results):
+        """
+        先同步完成一次心跳，再启动心跳线程与结果跟随线程（重复调用无副作用）
+
+        参数:
+            on_change: on_change(获得的型号, 失去的型号)，租约变化时调用
+            apply_results: apply_results(结果列表)，读到其他节点写入的新结果时调用，格式同 results_since
+        """
+        with self._start_lock:
+            if self._threads:
+                return
+            self._run_heartbeat(on_change)
+            self._threads = [
+                threading.Thread(target=self._heartbeat_loop, args=(on_change,), name="cluster-heartbeat", daemon=True),
+                threading.Thread(target=self._follow_loop, args=(apply_results,), name="cluster-follow", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run_heartbeat(self, on_change):
+        try:
+            gained, lost = self.heartbeat()
+        except sqlite3.Error as e:
+            # 暂时写不进协调库时保留现有租约，直到租约到期
+            self.stats["heartbeat_errors"] += 1
+            log.warning("集群心跳失败", node=self.node_id, error=str(e))
+            return
+        if gained or lost:
+            log.info("租约变化", node=self.node_id, gained=len(gained), lost=len(lost), owned=len(self._owned))
+            on_change(gained, lost)
+
+    def _heartbeat_loop(self, on_change):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            self._run_heartbeat(on_change)
+
+    def _follow_loop(self, apply_results):
+        while not self._stopped.is_set():
+            try:
+                rows, self._last_version = self.results_since(self._last_version)
+            except sqlite3.Error as e:
+                log.warning("读取集群结果失败", node=self.node_id, error=str(e))
+                rows = []
+            if rows:
+                self.stats["applied"] += len(rows)
+                apply_results(rows)
+            self._stopped.wait(self.poll_interval)
+
+    def get_status(self, now=None):
+        now = now or time.time()
+        connection = self._connection()
+        leases = dict(connection.execute(
+            "SELECT node_id, COUNT(*) FROM leases WHERE expires >= ? GROUP BY node_id", (now,)).fetchall())
+        nodes = [{
+            "id": node_id,
+            "url": url,
+            "heartbeatAge": round(now - heartbeat, 1),
+            "live": heartbeat >= now - self.lease_seconds,
+            "leases": leases.get(node_id, 0),
+        } for node_id, url, heartbeat in connection.execute(
+            "SELECT node_id, url, heartbeat FROM nodes ORDER BY node_id")]
+        return {
+            "node": self.node_id,
+            "leaseSeconds": self.lease_seconds,
+            "owned": len(self.owned(now)),
+            "models": len(self.models),
+            "unassigned": len(self.models) - sum(leases.values()),
+            "nodes": nodes,
+            **self.stats,
+        }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "cluster.db")
+    models = [f"model-{index}" for index in range(12)]
+    a = ClusterCoordinator(path, "node-a", models, lease_seconds=3)
+    b = ClusterCoordinator(path, "node-b", models, lease_seconds=3)
+    print("a 单独加入:", len(a.heartbeat()[0]))
+    b.heartbeat()
+    print("a 释放后:", a.heartbeat())
+    print("b 认领:", len(b.heartbeat()[0]), "a 持有:", len(a.owned()), "b 持有:", len(b.owned()))
+    print("a 写入 b 的型号:", a.write_results({model: [] for model in b.owned()}, "2025-09-19 08:00:00"))
+    print("b 写入:", b.write_results({model: [] for model in b.owned()}, "2025-09-19 08:00:00"))
+    print("a 读到:", len(a.results_since(0)[0]))
+    # b 失联：心跳停止，租约到期后 a 接手全部型号
+    later = time.time() + 4
+    print("b 失联后 a 接手:", len(a.heartbeat(now=later)[0]))
+    print(a.get_status(now=later))
@@ -0,0 +1,47 @@
+"""
+gunicorn 配置
+主进程启动时拉起唯一的查询进程（poller.py），工作进程只跟随共享快照提供页面与只读接口；
+已在别处运行查询进程时设置 STOCK_POLLER_EXTERNAL=1
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get("STOCK_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("STOCK_WEB_WORKERS", multiprocessing.cpu_count()))
+# 处理线程只服务读取共享快照的短请求，几个线程足以掩盖偶发的慢客户端；
+# 长连接的 SSE 不经过这里（见下方 stream_bind）
+worker_class = "gthread"
+threads = int(os.environ.get("STOCK_WEB_THREADS", 4))
+timeout = 30
+
+# SSE 连接由各工作进程中的事件循环在单独的端口上保持（SO_REUSEPORT 共用端口），不占用处理线程；
+# /api/stream 重定向到该端口，前面有反向代理时可设置 STOCK_STREAM_URL 改为经代理访问
+stream_bind = os.environ.get("STOCK_STREAM_BIND", "127.0.0.1:5002")
+
+raw_env = ["STOCK_ROLE=web", f"STOCK_STREAM_BIND={stream_bind}"]
+
+_poller = None
+
+
+def on_starting(server):
+    global _poller
+    if os.environ.get("STOCK_POLLER_EXTERNAL") == "1":
+        return
+    env = dict(os.environ, STOCK_ROLE="poller")
+    _poller = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "poller.py")],
+                               env=env)
+    server.log.info(f"已启动查询进程 pid={_poller.pid}")
+
+
+def post_worker_init(worker):
+    from app import start_stream_server
+    start_stream_server()
+
+
+def on_exit(server):
+    if _poller is not None and _poller.poll() is None:
+        _poller.terminate()
+        _poller.wait(10)
@@ -0,0 +1,124 @@
+"""
+对冲请求策略
+请求在自适应阈值（最近成功请求耗时的 p90）内没有返回时，经另一个代理（没有其他代理时经同一出口的另一条连接）
+再发一次相同的请求，先返回有效响应的一方胜出，另一方被取消或丢弃。
+对冲请求数按最近一分钟请求总数的比例封顶，不会明显增加请求预算的消耗
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class HedgePolicy:
+    """
+    对冲阈值与对冲预算
+
+    参数:
+        quantile: 以最近成功请求耗时的哪个分位数作为对冲阈值
+        window: 计算分位数时保留的最近耗时样本数
+        min_samples: 样本数不足时使用 initial_delay 作为阈值
+        initial_delay: 样本不足时的对冲阈值（秒）
+        min_delay: 对冲阈值下限（秒），避免上游很快时几乎每个请求都被对冲
+        max_ratio: 最近一分钟内对冲请求数占请求总数的比例上限
+    """
+    def __init__(self, quantile=0.9, window=200, min_samples=20, initial_delay=1.0, min_delay=0.05, max_ratio=0.1):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._threshold = None
+        self._requests = deque()
+        self._hedges = deque()
+        self.stats = {"hedged": 0, "hedge_wins": 0, "over_budget": 0}
+
+    def configure(self, quantile=None, max_ratio=None):
+        """更新分位数与对冲比例上限"""
+        with self._lock:
+            if quantile is not None:
+                self.quantile = quantile
+                self._threshold = None
+            if max_ratio is not None:
+                self.max_ratio = max_ratio
+
+    def record_request(self, latency=None, now=None):
+        """
+        记录一次上游请求（主请求与对冲请求都记录）
+
+        参数:
+            latency: 成功请求的耗时（秒），失败的请求传 None，不计入分位数
+        """
+        now = now or time.time()
+        with self._lock:
+            self._requests.append(now)
+            self._trim(self._requests, now - 60.0)
+            if latency is not None:
+                self._latencies.append(latency)
+                self._threshold = None
+
+    @staticmethod
+    def _trim(items, horizon):
+        while items and items[0] < horizon:
+            items.popleft()
+
+    def threshold(self):
+        """当前的对冲阈值（秒）"""
+        with self._lock:
+            if self._threshold is None:
+                if len(self._latencies) < self.min_samples:
+                    self._threshold = self.initial_delay
+                else:
+                    ordered = sorted(self._latencies)
+                    self._threshold = ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)]
+            return max(self._threshold, self.min_delay)
+
+    def try_hedge(self, now=None):
+        """申请发出一次对冲请求，超出对冲预算时返回 False"""
+        now = now or time.time()
+        with self._lock:
+            self._trim(self._requests, now - 60.0)
+            self._trim(self._hedges, now - 60.0)
+            if len(self._hedges) + 1 > self.max_ratio * len(self._requests):
+                self.stats["over_budget"] += 1
+                return False
+            self._hedges.append(now)
+            self.stats["hedged"] += 1
+            return True
+
+    def record_win(self):
+        """对冲请求先于主请求返回"""
+        with self._lock:
+            self.stats["hedge_wins"] += 1
+
+    def get_status(self):
+        threshold = self.threshold()
+        with self._lock:
+            return {
+                "threshold": round(threshold, 3),
+                "quantile": self.quantile,
+                "samples": len(self._latencies),
+                "max_ratio": self.max_ratio,
+                "requests_last_minute": len(self._requests),
+                "hedges_last_minute": len(self._hedges),
+                **self.stats,
+            }
+
+
+# 创建全局对冲策略实例
+hedge_policy = HedgePolicy()
+
+
+if __name__ == "__main__":
+    import random
+
+    policy = HedgePolicy()
+    print("样本不足时的阈值:", policy.threshold())
+    for _ in range(200):
+        policy.record_request(random.lognormvariate(-2.5, 0.6))
+    print("p90 阈值:", round(policy.threshold(), 3))
+    granted = sum(policy.try_hedge() for _ in range(50))
+    print("200 个请求中允许的对冲数:", granted)
+    print(policy.get_status())
@@ -0,0 +1,210 @@
+"""
+库存历史存储
+把库存观测写入本地 SQLite（WAL 模式），按 (型号, 门店, 时间) 建立主键索引，
+写入在后台线程中批量提交；同时保存每个型号的最新状态，供重启后预热
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from structured_log import get_logger
+
+log = get_logger("history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS stores (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS statuses (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS observations (
+    model_id INTEGER NOT NULL,
+    store_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    status_id INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    PRIMARY KEY (model_id, store_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest (
+    model TEXT PRIMARY KEY,
+    stock TEXT NOT NULL,
+    last_updated TEXT NOT NULL
+);
+"""
+
+
+class HistoryStore:
+    """
+    库存观测的持久化存储
+
+    参数:
+        path: SQLite 数据库文件路径
+        record_all: True 时记录每次观测，False 时只记录状态变化
+        flush_interval: 批量提交的最长间隔（秒）
+        batch_size: 单次提交的最大记录数
+    """
+    def __init__(self, path, record_all=False, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.record_all = record_all
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self._ids = {"models": {}, "stores": {}, "statuses": {}}
+        self.written = 0
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.commit()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self):
+        """每个线程一个只读连接，WAL 模式下读写互不阻塞"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    def start(self):
+        """启动后台写入线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+
+    def record(self, model, stock, last_updated, events=(), timestamp=None):
+        """
+        记录一个型号的查询结果（不阻塞，由后台线程写入）
+
+        参数:
+            model: 型号名称
+            stock: 门店库存列表
+            last_updated: 更新时间文字
+            events: 本次结果产生的变化事件（只记录变化时使用）
+            timestamp: 观测时间，默认当前时间
+        """
+        timestamp = timestamp or time.time()
+        if self.record_all:
+            rows = [(model, store.get("store"), timestamp, store.get("status"), bool(store.get("available")))
+                    for store in stock]
+        else:
+            rows = [(model, event.store, event.timestamp, event.new_status, event.available) for event in events]
+        self._queue.put((rows, (model, json.dumps(stock, ensure_ascii=False), last_updated)))
+        if self._writer is None:
+            self.start()
+
+    def _lookup_id(self, connection, table, name, added):
+        """名称对应的编号；新插入的编号先放在 added 中，事务提交后才写入缓存"""
+        row_id = self._ids[table].get(name) or added[table].get(name)
+        if row_id is None:
+            column = "text" if table == "statuses" else "name"
+            connection.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (name,))
+            row_id = connection.execute(f"SELECT id FROM {table} WHERE {column} = ?", (name,)).fetchone()[0]
+            added[table][name] = row_id
+        return row_id
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            items = [self._queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(items) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(connection, items)
+            except sqlite3.Error as e:
+                log.error("写入库存历史失败", error=str(e), items=len(items))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _flush(self, connection, items):
+        observations = []
+        latest = {}
+        added = {table: {} for table in self._ids}
+        # 名称表的插入与观测记录在同一个事务中：写入失败回滚时新编号也一并作废
+        with connection:
+            for rows, latest_row in items:
+                for model, store, ts, status, available in rows:
+                    observations.append((
+                        self._lookup_id(connection, "models", model, added),
+                        self._lookup_id(connection, "stores", store, added),
+                        ts,
+                        self._lookup_id(connection, "statuses", status, added),
+                        int(available),
+                    ))
+                latest[latest_row[0]] = latest_row
+            connection.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?)", observations)
+            connection.executemany("INSERT OR REPLACE INTO latest VALUES (?, ?, ?)", latest.values())
+        for table, ids in added.items():
+            self._ids[table].update(ids)
+        self.written += len(observations)
+
+    def flush(self):
+        """等待队列中的记录全部写入"""
+        self._queue.join()
+
+    def load_latest(self):
+        """读取每个型号最后保存的状态，返回 {型号: (门店库存列表, 更新时间)}"""
+        rows = self._reader().execute("SELECT model, stock, last_updated FROM latest").fetchall()
+        return {model: (json.loads(stock), last_updated) for model, stock, last_updated in rows}
+
+    def timeline(self, model, store, start, end=None):
+        """
+        查询某型号在某门店一段时间内的状态变化
+
+        参数:
+            model: 型号名称
+            store: 门店名称
+            start: 起始时间戳
+            end: 结束时间戳，默认当前时间
+
+        返回:
+            [{"ts", "status", "available"}, ...]，第一项是起始时间之前最后一次已知状态（如有）
+        """
+        end = end or time.time()
+        connection = self._reader()
+        ids = connection.execute(
+            "SELECT (SELECT id FROM models WHERE name = ?), (SELECT id FROM stores WHERE name = ?)",
+            (model, store),
+        ).fetchone()
+        if ids[0] is None or ids[1] is None:
+            return []
+
+        query = (
+            "SELECT o.ts, s.text, o.available FROM observations o JOIN statuses s ON s.id = o.status_id "
+            "WHERE o.model_id = ? AND o.store_id = ? AND o.ts {} ORDER BY o.ts {}"
+        )
+        previous = connection.execute(query.format("< ?", "DESC LIMIT 1"), (ids[0], ids[1], start)).fetchall()
+        rows = connection.execute(query.format("BETWEEN ? AND ?", "ASC"), (ids[0], ids[1], start, end)).fetchall()
+        return [{"ts": ts, "status": status, "available": bool(available)} for ts, status, available in previous + rows]
+
+    @property
+    def pending(self):
+        """等待写入的记录数"""
+        return self._queue.qsize()
+
+    def get_stats(self):
+        connection = self._reader()
+        return {
+            "path": self.path,
+            "record_all": self.record_all,
+            "observations": connection.execute("SELECT COUNT(*) FROM observations").fetchone()[0],
+            "pending": self._queue.qsize(),
+            "written": self.written,
+        }
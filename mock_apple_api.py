@@ -0,0 +1,421 @@
+"""
+本地模拟 Apple 取货库存接口
+用于在不访问 apple.com 的情况下验证批量查询的拆分、回填以及部分失败处理，
+也是 benchmarks/bench_sweep.py 的上游：支持延迟分布、429/403 注入、慢代理、
+大响应体、固定库存状态下的补货注入，以及录制与回放响应轨迹
+
+示例:
+    python mock_apple_api.py --port 8765
+    APPLE_API_BASE=http://127.0.0.1:8765 python app.py
+    python mock_apple_api.py --latency lognormal:0.1,0.5 --rate-limit-rate 0.05 --slow-proxy 0.5
+
+控制接口（供基准脚本使用）:
+    GET  /_mock/stats          请求数与各状态码计数
+    POST /_mock/availability   {"part", "store", "available"} 设置固定库存状态
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# 默认的模拟门店列表
+DEFAULT_STORES = [
+    "Apple Causeway Bay",
+    "Apple Festival Walk",
+    "Apple Canton Road",
+    "Apple ifc mall",
+    "Apple New Town Plaza",
+    "Apple Pacific Place",
+    "Apple Central",
+]
+
+
+def make_stores(count):
+    """生成 count 个门店名称，前几个与 DEFAULT_STORES 相同"""
+    return DEFAULT_STORES[:count] + [f"Apple Store {index + 1}" for index in range(len(DEFAULT_STORES), count)]
+
+
+def latency_sampler(spec):
+    """
+    把延迟描述解析为采样函数 sample(rng) -> 秒
+
+    参数:
+        spec: 数字（固定延迟），或 "fixed:0.1"、"uniform:0.05,0.3"、
+              "lognormal:中位数,sigma"、"exponential:均值"
+    """
+    if spec is None or isinstance(spec, (int, float)):
+        value = float(spec or 0.0)
+        return lambda rng: value
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        value = float(kind)
+        return lambda rng: value
+    values = [float(value) for value in args.split(",")]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+def load_trace(path):
+    """读取录制的响应轨迹（每行一个 JSON 对象）"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class MockAppleAPI:
+    """
+    模拟接口的状态与行为配置
+
+    参数:
+        stores: 门店名称列表
+        available_ratio: 每个门店每个型号有货的概率
+        drop_parts: 响应中故意省略的型号代码集合（模拟部分失败）
+        fail_rate: 整个请求返回 503 的概率
+        latency: 响应延迟，秒数或分布描述，见 latency_sampler
+        seed: 随机种子，便于复现
+        verbose: True 时像真实接口一样附带门店地址、营业时间、消息文案等字段
+        rate_limit_rate: 返回 429（带 Retry-After）的概率
+        retry_after: 429 响应的 Retry-After 秒数
+        forbidden_rate: 返回 403 的概率
+        sticky: True 时每个 (型号, 门店) 的库存状态首次生成后保持不变，只能通过 set_availability 修改
+        record_trace: 录制文件路径，每个响应追加一行 JSON
+        replay: 回放的轨迹条目列表，按请求的端点与型号依次返回录制的状态码、延迟与响应体
+    """
+    def __init__(self, stores=None, available_ratio=0.2, drop_parts=None, fail_rate=0.0, latency=0.0,
+                 seed=None, verbose=False, rate_limit_rate=0.0, retry_after=1, forbidden_rate=0.0,
+                 sticky=False, record_trace=None, replay=None):
+        self.stores = list(stores or DEFAULT_STORES)
+        self.available_ratio = available_ratio
+        self.drop_parts = set(drop_parts or [])
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self._sample_latency = latency_sampler(latency)
+        self.verbose = verbose
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.forbidden_rate = forbidden_rate
+        self.sticky = sticky
+        self._availability = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.status_counts = defaultdict(int)
+        self.requested_parts = []
+        self._trace_file = open(record_trace, "a", encoding="utf-8") if record_trace else None
+        self._replay = defaultdict(deque)
+        for entry in replay or []:
+            self._replay[(entry["endpoint"], tuple(entry["parts"]))].append(entry)
+
+    def _is_available(self, part, store_name):
+        if not self.sticky:
+            return self._random.random() < self.available_ratio
+        key = (part, store_name)
+        available = self._availability.get(key)
+        if available is None:
+            available = self._availability[key] = self._random.random() < self.available_ratio
+        return available
+
+    def set_availability(self, part, store_name, available):
+        """设置固定库存状态（sticky 模式），用于模拟补货"""
+        with self._lock:
+            self._availability[(part, store_name)] = bool(available)
+
+    def _part_availability(self, part, store_name):
+        available = self._is_available(part, store_name)
+        quote = "今天可取货" if available else "暂无供应"
+        info = {
+            "partNumber": part,
+            "pickupDisplay": "available" if available else "unavailable",
+            "pickupSearchQuote": quote,
+        }
+        if self.verbose:
+            message = {
+                "storeSelectionEnabled": True,
+                "storePickupQuote": f"{quote}，地点：所选门店",
+                "storePickupLinkText": "查看其他零售店",
+                "storePickupProductTitle": part,
+                "pickupSearchQuote": quote,
+                "pickupAvailabilityEnabled": available,
+            }
+            info.update({
+                "storePickEligible": True,
+                "storeSearchEnabled": True,
+                "storeSelectionEnabled": True,
+                "pickupType": "店內取貨",
+                "purchaseOption": "",
+                "ctoOptions": "",
+                "messageTypes": {"regular": dict(message), "compact": dict(message)},
+            })
+        return info
+
+    def _store_details(self, index, store_name):
+        """真实接口中随门店一起返回、但库存检查用不到的字段"""
+        return {
+            "storeEmail": f"store{index}@apple.com",
+            "reservationUrl": f"https://www.apple.com/hk/retail/store{index}",
+            "makeReservationUrl": f"https://www.apple.com/hk/retail/store{index}",
+            "storeImageUrl": f"https://rtlimages.apple.com/cmc/dieter/store/4_3/R{400 + index}.png",
+            "country": "HK",
+            "city": "香港",
+            "phoneNumber": f"852 3{index:03d} 0000",
+            "address": {
+                "address": store_name,
+                "address2": f"{index} 号铺",
+                "address3": None,
+                "postalCode": "",
+            },
+            "hoursUrl": f"https://www.apple.com/hk/retail/store{index}",
+            "storeHours": {
+                "storeHoursText": "营业时间",
+                "bopisPickupDays": "日期",
+                "bopisPickupHours": "时间",
+                "hours": [{"storeTimings": "10:00 - 22:00", "storeDays": "星期一至星期日:"}],
+            },
+            "storelatitude": 22.28 + index / 1000,
+            "storelongitude": 114.18 + index / 1000,
+            "storedistance": index * 1.5,
+            "storeDistanceVoText": f"{index * 1.5} km from 999077",
+            "storelistnumber": index + 1,
+            "storeListNumber": index + 1,
+            "pickupOptionsDetails": {
+                "whatToExpectAtPickup": "<h4 class=\"as-pickup-details-heading\">取货须知</h4>",
+                "comparePickupOptionsLink": "<a href=\"https://www.apple.com/hk/shop/help/shipping_delivery\">比较取货方式</a>",
+                "pickupOptions": [{"pickupOptionTitle": "店内", "pickupOptionDescription": "前往门店取货", "index": 1}],
+            },
+            "rank": index + 1,
+        }
+
+    def build_payload(self, parts, nested=False):
+        """
+        构造与 Apple 接口形状一致的响应数据
+
+        参数:
+            parts: 请求的型号代码列表
+            nested: True 时使用 fulfillment-messages 的 body.content.pickupMessage 结构
+        """
+        stores = []
+        with self._lock:
+            for index, store_name in enumerate(self.stores):
+                parts_availability = {
+                    part: self._part_availability(part, store_name)
+                    for part in parts if part not in self.drop_parts
+                }
+                store = {
+                    "storeNumber": f"R{400 + index}",
+                    "storeName": store_name,
+                    "partsAvailability": parts_availability,
+                }
+                if self.verbose:
+                    store.update(self._store_details(index, store_name))
+                stores.append(store)
+        pickup_message = {"stores": stores}
+        if nested:
+            return {"head": {"status": "200"}, "body": {"content": {"pickupMessage": pickup_message}}}
+        return {"head": {"status": "200"}, "body": {"PickupMessage": pickup_message}}
+
+    def _next_replay(self, endpoint, parts):
+        """取出与请求匹配的下一条录制响应，取完后循环回放"""
+        entries = self._replay.get((endpoint, tuple(parts)))
+        if not entries:
+            return None
+        entry = entries.popleft()
+        entries.append(entry)
+        return entry
+
+    def _record(self, endpoint, parts, status, latency, payload):
+        if self._trace_file is None:
+            return
+        line = json.dumps({"t": round(time.time(), 3), "endpoint": endpoint, "parts": parts, "status": status,
+                           "latency": round(latency, 4), "payload": payload}, ensure_ascii=False)
+        with self._lock:
+            self._trace_file.write(line + "\n")
+            self._trace_file.flush()
+
+    def handle(self, path, query):
+        """处理一个请求，返回 (状态码, 响应数据, 额外响应头)"""
+        if path.endswith("/pickup-message-recommendations"):
+            endpoint = "pickup-message-recommendations"
+            parts = query.get("product", [])
+            nested = False
+        elif path.endswith("/fulfillment-messages"):
+            endpoint = "fulfillment-messages"
+            # parts.10 需要排在 parts.9 之后
+            parts = [values[0] for key, values in sorted(
+                (item for item in query.items() if item[0].startswith("parts.")),
+                key=lambda item: int(item[0].split(".", 1)[1]))]
+            nested = True
+        else:
+            return 404, {"error": "not found"}, {}
+
+        with self._lock:
+            self.request_count += 1
+            self.requested_parts.append(list(parts))
+            roll = self._random.random()
+            latency = self._sample_latency(self._random)
+
+        replayed = self._next_replay(endpoint, parts)
+        if replayed is not None:
+            status, latency, payload = replayed["status"], replayed["latency"], replayed["payload"]
+        elif roll < self.fail_rate:
+            status, payload = 503, {"error": "service unavailable"}
+        elif roll < self.fail_rate + self.rate_limit_rate:
+            status, payload = 429, {"error": "too many requests"}
+        elif roll < self.fail_rate + self.rate_limit_rate + self.forbidden_rate:
+            status, payload = 403, {"error": "forbidden"}
+        else:
+            status, payload = 200, None
+
+        if latency > 0:
+            time.sleep(latency)
+        if payload is None:
+            payload = self.build_payload(parts, nested=nested)
+
+        with self._lock:
+            self.status_counts[status] += 1
+        self._record(endpoint, parts, status, latency, payload)
+        headers = {"Retry-After": str(self.retry_after)} if status == 429 else {}
+        return status, payload, headers
+
+    def get_stats(self):
+        with self._lock:
+            return {"requests": self.request_count, "status_counts": dict(self.status_counts)}
+
+
+def _make_handler(api, extra_latency=0.0):
+    """
+    构造请求处理类
+
+    参数:
+        extra_latency: 额外延迟（秒），用于模拟慢代理；代理请求使用绝对地址，urlparse 同样能取出路径
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/_mock/stats":
+                self.send_json(200, api.get_stats())
+                return
+            if extra_latency:
+                time.sleep(extra_latency)
+            self.send_json(*api.handle(url.path, parse_qs(url.query)))
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/_mock/availability":
+                self.send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length) or b"{}")
+            api.set_availability(data["part"], data["store"], data.get("available", True))
+            self.send_json(200, {"ok": True})
+
+        def log_message(self, format, *args):
+            # 静默访问日志，避免干扰输出
+            pass
+
+    return Handler
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """
+    在后台线程中启动模拟服务器
+
+    返回:
+        (server, api, base_url)，调用 server.shutdown() 停止
+    """
+    api = MockAppleAPI(**options)
+    server = ThreadingHTTPServer((host, port), _make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    return server, api, base_url
+
+
+def start_mock_proxies(api, delays, host="127.0.0.1", ports=None):
+    """
+    启动若干个充当 HTTP 代理的监听端口，共用同一个模拟接口，每个端口附加各自的延迟
+
+    返回:
+        [(server, proxy_url), ...]
+    """
+    proxies = []
+    for index, delay in enumerate(delays):
+        port = ports[index] if ports else 0
+        server = ThreadingHTTPServer((host, port), _make_handler(api, extra_latency=delay))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        proxies.append((server, f"http://{host}:{server.server_address[1]}"))
+    return proxies
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 Apple 取货库存接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--available-ratio", type=float, default=0.2)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency", default="0",
+                        help="响应延迟（秒），或分布: uniform:0.05,0.3 / lognormal:0.1,0.5 / exponential:0.1")
+    parser.add_argument("--drop-part", action="append", default=[], help="响应中省略的型号代码，可重复指定")
+    parser.add_argument("--verbose", action="store_true", help="附带真实接口中的门店详情字段")
+    parser.add_argument("--stores", type=int, default=len(DEFAULT_STORES), help="门店数量，决定响应体大小")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="返回 403 的概率")
+    parser.add_argument("--sticky", action="store_true", help="库存状态保持不变，只能通过控制接口修改")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record-trace", help="把每个响应录制到该文件")
+    parser.add_argument("--replay-trace", help="回放录制的响应轨迹")
+    parser.add_argument("--slow-proxy", type=float, action="append", default=[],
+                        help="在 port+1、port+2... 启动附加该延迟（秒）的代理端口，可重复指定")
+    args = parser.parse_args()
+
+    api = MockAppleAPI(
+        stores=make_stores(args.stores),
+        available_ratio=args.available_ratio,
+        drop_parts=args.drop_part,
+        fail_rate=args.fail_rate,
+        latency=args.latency,
+        verbose=args.verbose,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        forbidden_rate=args.forbidden_rate,
+        sticky=args.sticky,
+        seed=args.seed,
+        record_trace=args.record_trace,
+        replay=load_trace(args.replay_trace) if args.replay_trace else None,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(api))
+    server.daemon_threads = True
+    proxy_ports = [args.port + index + 1 for index in range(len(args.slow_proxy))]
+    for _, proxy_url in start_mock_proxies(api, args.slow_proxy, args.host, proxy_ports):
+        print(f"代理端口: {proxy_url}")
+    print(f"模拟接口已启动: http://{args.host}:{args.port}/hk/shop/pickup-message-recommendations", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,175 @@
+"""
+本地通知接收端
+在不访问外部服务的情况下验证通知渠道：
+一个 HTTP 服务同时充当 Webhook 接收端与 Telegram Bot API，一个最小的 SMTP 服务接收邮件
+
+示例:
+    python mock_notify_servers.py --http-port 8766 --smtp-port 8025
+"""
+
+import json
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class NotifyInbox:
+    """
+    收到的通知记录
+
+    参数:
+        fail_first: 前若干个 HTTP 请求返回 503，用于验证重试
+        status_code: 其余 HTTP 请求返回的状态码
+    """
+    def __init__(self, fail_first=0, status_code=200):
+        self._cond = threading.Condition()
+        self.fail_first = fail_first
+        self.status_code = status_code
+        self.http_requests = 0
+        self.webhooks = []
+        self.telegram = []
+        self.emails = []
+
+    def _add(self, bucket, item):
+        with self._cond:
+            bucket.append(dict(item, received_at=time.time()))
+            self._cond.notify_all()
+
+    def wait_for(self, count, timeout=5.0):
+        """等待累计收到 count 条通知，返回是否在超时前收到"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while len(self.webhooks) + len(self.telegram) + len(self.emails) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+def _make_http_handler(inbox):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            with inbox._cond:
+                inbox.http_requests += 1
+                failing = inbox.http_requests <= inbox.fail_first
+            status = 503 if failing else inbox.status_code
+            if status == 200:
+                if "/sendMessage" in self.path:
+                    inbox._add(inbox.telegram, {"path": self.path, "payload": payload})
+                else:
+                    inbox._add(inbox.webhooks, {"path": self.path, "payload": payload})
+            body = json.dumps({"ok": status == 200}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _make_smtp_handler(inbox):
+    class Handler(socketserver.StreamRequestHandler):
+        """只实现投递一封邮件所需的 SMTP 命令"""
+        def reply(self, line):
+            self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+        def handle(self):
+            self.reply("220 localhost mock SMTP")
+            sender, recipients = None, []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode("utf-8", "replace").strip()
+                verb = command[:4].upper()
+                if verb in ("HELO", "EHLO"):
+                    self.reply("250 localhost")
+                elif verb == "MAIL":
+                    sender, recipients = command.split(":", 1)[1].strip(), []
+                    self.reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[1].strip().strip("<>"))
+                    self.reply("250 OK")
+                elif verb == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data_line = self.rfile.readline()
+                        if not data_line or data_line in (b".\r\n", b".\n"):
+                            break
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    message = message_from_bytes(b"".join(lines), policy=policy.default)
+                    inbox._add(inbox.emails, {
+                        "from": sender,
+                        "to": recipients,
+                        "subject": str(message.get("Subject", "")),
+                        "body": message.get_content() if not message.is_multipart() else "",
+                    })
+                    self.reply("250 OK")
+                elif verb == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("250 OK")
+
+    return Handler
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_notify_servers(host="127.0.0.1", http_port=0, smtp_port=0, **options):
+    """
+    在后台线程中启动 HTTP 与 SMTP 接收端
+
+    返回:
+        (inbox, http_base_url, (smtp_host, smtp_port), stop)，调用 stop() 关闭两个服务
+    """
+    inbox = NotifyInbox(**options)
+    http_server = ThreadingHTTPServer((host, http_port), _make_http_handler(inbox))
+    http_server.daemon_threads = True
+    smtp_server = _ThreadingTCPServer((host, smtp_port), _make_smtp_handler(inbox))
+    for server in (http_server, smtp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        http_server.shutdown()
+        smtp_server.shutdown()
+
+    return inbox, f"http://{host}:{http_server.server_address[1]}", (host, smtp_server.server_address[1]), stop
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地通知接收端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=8766)
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    args = parser.parse_args()
+
+    inbox, http_base, smtp_address, stop = start_notify_servers(args.host, args.http_port, args.smtp_port)
+    print(f"Webhook / Telegram: {http_base}，SMTP: {smtp_address[0]}:{smtp_address[1]}")
+    try:
+        printed = {"webhook": 0, "telegram": 0, "email": 0}
+        while True:
+            inbox.wait_for(sum(printed.values()) + 1, timeout=3600)
+            for kind, items in (("webhook", inbox.webhooks), ("telegram", inbox.telegram), ("email", inbox.emails)):
+                for item in items[printed[kind]:]:
+                    print(kind, json.dumps(item, ensure_ascii=False))
+                printed[kind] = len(items)
+    except KeyboardInterrupt:
+        stop()
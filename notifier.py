@@ -0,0 +1,496 @@
+"""
+补货通知
+订阅按 (型号, 门店) 建立索引，型号或门店为空表示匹配全部；
+库存变化事件只在调用方线程中完成索引查找与去抖，然后放入队列立即返回，
+实际投递由后台线程完成；每个渠道有独立的队列与投递线程并单独限速，
+一个渠道限速等待或接收方缓慢不会拖慢其他渠道，失败按指数退避重试
+"""
+
+import ipaddress
+import itertools
+import json
+import smtplib
+import socket
+import threading
+import time
+from collections import namedtuple
+from email.message import EmailMessage
+from queue import Full, Queue
+from urllib.parse import urlsplit
+
+import requests
+
+from rate_limiter import RateLimiter
+from structured_log import get_logger
+
+log = get_logger("notifier")
+
+# 一个订阅；models / stores 为 None 表示不限
+Subscription = namedtuple("Subscription", ["id", "channel", "target", "models", "stores"])
+
+# 一条待投递的通知；timestamp 是观测到有货的时间，用于统计通知延迟
+Notification = namedtuple("Notification", ["subscription", "model", "store", "status", "timestamp"])
+
+
+def format_message(notification):
+    """通知正文"""
+    observed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(notification.timestamp))
+    return f"【有货】{notification.model}\n门店: {notification.store}\n状态: {notification.status}\n时间: {observed}"
+
+
+class Channel:
+    """
+    通知渠道基类，子类实现 send(target, notification)，失败时抛出异常
+
+    参数:
+        rate_per_second: 该渠道每秒允许发送的通知数
+        burst: 允许的突发数量
+        timeout: 单次发送的超时（秒）
+    """
+    name = None
+
+    def __init__(self, rate_per_second=1.0, burst=1, timeout=10):
+        self.limiter = RateLimiter(rate_per_second=rate_per_second, burst=burst)
+        self.timeout = timeout
+
+    def validate(self, target):
+        """检查订阅的接收方，不允许时抛出 ValueError"""
+
+    def send(self, target, notification):
+        raise NotImplementedError
+
+
+class WebhookChannel(Channel):
+    """
+    以 JSON POST 到订阅指定的 URL
+    订阅可以通过接口添加，为避免借此访问内网服务，默认拒绝解析到内网、回环、链路本地等地址的 URL，
+    并且不跟随重定向
+
+    参数:
+        allowed_hosts: 允许的主机名列表；指定后只允许这些主机（包括内网地址），不再检查解析结果
+        allow_private: 是否允许解析到内网地址的 URL
+    """
+    name = "webhook"
+
+    def __init__(self, rate_per_second=5.0, burst=5, timeout=10, allowed_hosts=None, allow_private=False):
+        super().__init__(rate_per_second, burst, timeout)
+        self.allowed_hosts = {host.lower() for host in allowed_hosts} if allowed_hosts else None
+        self.allow_private = allow_private
+        self._session = requests.Session()
+
+    def validate(self, target):
+        parts = urlsplit(target)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Webhook 地址必须是 http(s) URL")
+        host = parts.hostname.lower()
+        if self.allowed_hosts is not None:
+            if host not in self.allowed_hosts:
+                raise ValueError(f"Webhook 主机不在允许列表中: {host}")
+            return
+        if self.allow_private:
+            return
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or None, proto=socket.IPPROTO_TCP)}
+        except (socket.gaierror, UnicodeError):
+            raise ValueError(f"无法解析 Webhook 主机: {host}")
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split("%", 1)[0])
+            if not ip.is_global or ip.is_multicast:
+                raise ValueError(f"Webhook 主机解析到非公网地址: {host}")
+
+    def send(self, target, notification):
+        # 订阅后域名解析结果可能改变，发送前再检查一次
+        self.validate(target)
+        response = self._session.post(target, json={
+            "model": notification.model,
+            "store": notification.store,
+            "status": notification.status,
+            "timestamp": notification.timestamp,
+            "text": format_message(notification),
+        }, timeout=self.timeout, allow_redirects=False)
+        response.raise_for_status()
+
+
+class TelegramChannel(Channel):
+    """
+    通过 Telegram Bot 发送，订阅的 target 为 chat_id
+
+    参数:
+        token: Bot token
+        api_base: Bot API 地址，可指向本地接收端
+    """
+    name = "telegram"
+
+    def __init__(self, token, api_base="https://api.telegram.org", rate_per_second=1.0, burst=3, timeout=10):
+        super().__init__(rate_per_second, burst, timeout)
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self._session = requests.Session()
+
+    def send(self, target, notification):
+        response = self._session.post(self.url, json={"chat_id": target, "text": format_message(notification)},
+                                      timeout=self.timeout)
+        response.raise_for_status()
+
+
+class EmailChannel(Channel):
+    """
+    通过 SMTP 发送邮件，订阅的 target 为收件地址
+
+    参数:
+        host, port: SMTP 服务器
+        sender: 发件地址
+        username, password: 需要登录时提供
+        starttls: 是否在登录前升级为 TLS
+    """
+    name = "email"
+
+    def __init__(self, host, port=25, sender="stock-monitor@localhost", username=None, password=None,
+                 starttls=False, rate_per_second=0.5, burst=2, timeout=10):
+        super().__init__(rate_per_second, burst, timeout)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def send(self, target, notification):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = target
+        message["Subject"] = f"有货提醒: {notification.model} @ {notification.store}"
+        message.set_content(format_message(notification))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+# 可在配置文件中使用的渠道类型
+CHANNEL_TYPES = {
+    WebhookChannel.name: WebhookChannel,
+    TelegramChannel.name: TelegramChannel,
+    EmailChannel.name: EmailChannel,
+}
+
+
+class RestockNotifier:
+    """
+    补货通知分发器
+    不预置任何渠道，Webhook 等渠道需要在配置中显式启用
+
+    参数:
+        workers: 每个渠道的投递线程数
+        debounce_seconds: 同一订阅、同一 (型号, 门店) 两次通知的最短间隔，抑制有货/无货来回跳动
+        max_retries: 单条通知的最大重试次数
+        retry_backoff: 第一次重试前的等待（秒），之后每次翻倍
+        queue_size: 每个渠道待投递队列的上限，队列已满时丢弃新通知，不阻塞调用方
+    """
+    def __init__(self, workers=2, debounce_seconds=300.0, max_retries=3, retry_backoff=1.0, queue_size=1000):
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._channels = {}
+        self._subscriptions = {}
+        # (型号或 None, 门店或 None) -> 订阅编号集合
+        self._index = {}
+        # (订阅编号, 型号, 门店) -> 上次通知时间，超过去抖间隔的条目会被清理
+        self._last_sent = {}
+        self._last_expired = 0.0
+        self._ids = itertools.count(1)
+        # 渠道名称 -> 该渠道的待投递队列与投递线程
+        self._queues = {}
+        self._workers = {}
+        self._pending = 0
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.debounce_seconds = debounce_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "suppressed": 0, "dropped": 0}
+        self.last_latency = None
+        self.total_latency = 0.0
+
+    def register_channel(self, channel):
+        """注册（或替换）一个通知渠道"""
+        with self._lock:
+            self._channels[channel.name] = channel
+
+    def load_config(self, config):
+        """
+        从配置加载渠道与订阅
+
+        参数:
+            config: {"channels": {类型: 参数}, "subscriptions": [{channel, target, models, stores}],
+                     "debounce_seconds": 秒}
+        """
+        if "debounce_seconds" in config:
+            self.debounce_seconds = float(config["debounce_seconds"])
+        for name, options in config.get("channels", {}).items():
+            if name not in CHANNEL_TYPES:
+                raise ValueError(f"未知的通知渠道: {name}")
+            self.register_channel(CHANNEL_TYPES[name](**options))
+        for entry in config.get("subscriptions", []):
+            self.subscribe(entry["channel"], entry["target"], entry.get("models"), entry.get("stores"))
+
+    def load_file(self, path):
+        """从 JSON 文件加载配置"""
+        with open(path, encoding="utf-8") as f:
+            self.load_config(json.load(f))
+
+    def subscribe(self, channel, target, models=None, stores=None):
+        """
+        添加订阅
+
+        参数:
+            channel: 渠道名称
+            target: 渠道内的接收方（URL、chat_id 或邮箱地址）
+            models: 关注的型号列表，None 表示全部型号
+            stores: 关注的门店列表，None 表示全部门店
+
+        返回:
+            新建的 Subscription
+        """
+        with self._lock:
+            if channel not in self._channels:
+                raise ValueError(f"未配置的通知渠道: {channel}")
+            handler = self._channels[channel]
+        handler.validate(target)
+        with self._lock:
+            subscription = Subscription(next(self._ids), channel, target,
+                                        tuple(models) if models else None, tuple(stores) if stores else None)
+            self._subscriptions[subscription.id] = subscription
+            for key in self._index_keys(subscription):
+                self._index.setdefault(key, set()).add(subscription.id)
+        return subscription
+
+    @staticmethod
+    def _index_keys(subscription):
+        return [(model, store) for model in (subscription.models or (None,)) for store in (subscription.stores or (None,))]
+
+    def unsubscribe(self, subscription_id):
+        """删除订阅，返回是否存在"""
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+            if subscription is None:
+                return False
+            for key in self._index_keys(subscription):
+                ids = self._index.get(key)
+                if ids is not None:
+                    ids.discard(subscription_id)
+                    if not ids:
+                        del self._index[key]
+            return True
+
+    def subscriptions(self):
+        with self._lock:
+            return list(self._subscriptions.values())
+
+    def _match_locked(self, model, store):
+        """只查找四个索引键，匹配开销与订阅总数无关"""
+        matched = set()
+        for key in ((model, store), (model, None), (None, store), (None, None)):
+            ids = self._index.get(key)
+            if ids:
+                matched |= ids
+        return matched
+
+    def notify(self, events):
+        """
+        处理库存变化事件，从无货变为有货的 (型号, 门店) 通知匹配的订阅；只入队，不等待投递
+        有货状态之间的文字变化不通知；型号首次出现时之前的状态未知，也不通知
+
+        参数:
+            events: ChangeEvent 列表
+
+        返回:
+            入队的通知数
+        """
+        queued = 0
+        for event in events:
+            if not event.available or event.was_available is not False:
+                continue
+            notifications = []
+            with self._lock:
+                if not self._index:
+                    return queued
+                self._expire_locked(event.timestamp)
+                for subscription_id in self._match_locked(event.model, event.store):
+                    key = (subscription_id, event.model, event.store)
+                    last = self._last_sent.get(key)
+                    if last is not None and event.timestamp - last < self.debounce_seconds:
+                        self.stats["suppressed"] += 1
+                        continue
+                    self._last_sent[key] = event.timestamp
+                    notifications.append(Notification(self._subscriptions[subscription_id], event.model,
+                                                      event.store, event.new_status, event.timestamp))
+            for notification in notifications:
+                if self._enqueue(notification, 0):
+                    queued += 1
+        return queued
+
+    def _expire_locked(self, now):
+        """删除已超过去抖间隔的通知时间，每个去抖间隔最多扫描一次"""
+        if now - self._last_expired < self.debounce_seconds:
+            return
+        self._last_expired = now
+        cutoff = now - self.debounce_seconds
+        for key in [key for key, last in self._last_sent.items() if last <= cutoff]:
+            del self._last_sent[key]
+
+    def _enqueue(self, notification, attempt, counted=False):
+        """放入所属渠道的投递队列；counted 为 True 表示是重试，已计入待投递数"""
+        with self._lock:
+            queue = self._start_locked(notification.subscription.channel)
+            if not counted:
+                self._pending += 1
+        try:
+            queue.put_nowait((notification, attempt))
+        except Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+                self._finish_locked()
+            return False
+        with self._lock:
+            if attempt == 0:
+                self.stats["queued"] += 1
+        return True
+
+    def _finish_locked(self):
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.notify_all()
+
+    def _start_locked(self, name):
+        """返回渠道的投递队列，首次使用时创建队列并启动该渠道的投递线程"""
+        queue = self._queues.get(name)
+        if queue is None:
+            queue = self._queues[name] = Queue(self.queue_size)
+            self._workers[name] = []
+        workers = self._workers[name]
+        while len(workers) < self.worker_count:
+            worker = threading.Thread(target=self._worker_loop, args=(queue,),
+                                      name=f"notifier-{name}-{len(workers)}", daemon=True)
+            workers.append(worker)
+            worker.start()
+        return queue
+
+    def start(self):
+        """为已注册的渠道启动投递线程（重复调用无副作用）"""
+        with self._lock:
+            for name in self._channels:
+                self._start_locked(name)
+
+    def _worker_loop(self, queue):
+        while True:
+            notification, attempt = queue.get()
+            try:
+                self._deliver(notification, attempt)
+            finally:
+                queue.task_done()
+
+    def _deliver(self, notification, attempt):
+        subscription = notification.subscription
+        with self._lock:
+            channel = self._channels.get(subscription.channel)
+        try:
+            if channel is None:
+                raise ValueError(f"未配置的通知渠道: {subscription.channel}")
+            # 在该渠道自己的投递线程中等待限速，不影响查询线程与其他渠道
+            channel.limiter.acquire(channel.name)
+            channel.send(subscription.target, notification)
+        except Exception as e:
+            if channel is not None and attempt < self.max_retries:
+                with self._lock:
+                    self.stats["retried"] += 1
+                # 退避期间不占用投递线程；仍计入待投递数，flush() 会等待重试完成
+                timer = threading.Timer(self.retry_backoff * (2 ** attempt), self._enqueue,
+                                        args=(notification, attempt + 1, True))
+                timer.daemon = True
+                timer.start()
+                return
+            log.warning("发送通知失败", channel=subscription.channel, target=subscription.target, error=str(e))
+            with self._lock:
+                self.stats["failed"] += 1
+                self._finish_locked()
+            return
+        latency = time.time() - notification.timestamp
+        with self._lock:
+            self.stats["sent"] += 1
+            self.last_latency = latency
+            self.total_latency += latency
+            self._finish_locked()
+
+    def flush(self, timeout=None):
+        """等待已入队的通知（包括等待中的重试）全部投递完成，返回是否在超时前完成"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def get_status(self):
+        with self._lock:
+            sent = self.stats["sent"]
+            return {
+                "channels": sorted(self._channels),
+                "subscriptions": len(self._subscriptions),
+                "queue_depth": sum(queue.qsize() for queue in self._queues.values()),
+                "queues": {name: queue.qsize() for name, queue in sorted(self._queues.items())},
+                "pending": self._pending,
+                "debounce_seconds": self.debounce_seconds,
+                "last_latency": round(self.last_latency, 3) if self.last_latency is not None else None,
+                "avg_latency": round(self.total_latency / sent, 3) if sent else None,
+                **self.stats,
+            }
+
+
+# 创建全局通知实例
+notifier = RestockNotifier()
+
+
+if __name__ == "__main__":
+    from change_tracker import ChangeEvent
+    from mock_notify_servers import start_notify_servers
+
+    # 前两个 HTTP 请求返回 503，验证重试
+    inbox, http_base, (smtp_host, smtp_port), stop = start_notify_servers(fail_first=2)
+    demo = RestockNotifier(debounce_seconds=60, retry_backoff=0.2)
+    demo.load_config({
+        "channels": {
+            # 本地接收端在回环地址上，需要显式允许
+            "webhook": {"allowed_hosts": ["127.0.0.1"]},
+            "telegram": {"token": "TEST", "api_base": http_base},
+            "email": {"host": smtp_host, "port": smtp_port, "rate_per_second": 10, "burst": 10},
+        },
+        "subscriptions": [
+            {"channel": "webhook", "target": f"{http_base}/hook", "models": ["iPhone 17 Pro 256GB - 宇宙橙"]},
+            {"channel": "telegram", "target": "42", "stores": ["Apple Central"]},
+            {"channel": "email", "target": "me@example.com"},
+        ],
+    })
+    # 大量无关订阅不影响匹配开销
+    for index in range(10000):
+        demo.subscribe("webhook", f"{http_base}/other/{index}", models=[f"其他型号 {index}"])
+
+    now = time.time()
+    events = [
+        ChangeEvent(1, "iPhone 17 Pro 256GB - 宇宙橙", "Apple Central", "暂无供应", "今天可取货", True, now, False),
+        ChangeEvent(2, "iPhone 17 Pro 512GB - 深墨蓝", "Apple ifc mall", "暂无供应", "今天可取货", True, now, False),
+        ChangeEvent(3, "iPhone 17 Pro 512GB - 深墨蓝", "Apple ifc mall", "今天可取货", "暂无供应", False, now + 1, True),
+        # 来回跳动：去抖窗口内再次有货不会重复通知
+        ChangeEvent(4, "iPhone 17 Pro 512GB - 深墨蓝", "Apple ifc mall", "暂无供应", "今天可取货", True, now + 2, False),
+    ]
+    started = time.perf_counter()
+    queued = demo.notify(events)
+    print(f"入队 {queued} 条通知，调用方耗时 {(time.perf_counter() - started) * 1000:.2f} ms")
+    demo.flush(timeout=10)
+    print(f"Webhook {len(inbox.webhooks)} 条，Telegram {len(inbox.telegram)} 条，邮件 {len(inbox.emails)} 封")
+    for email in inbox.emails:
+        print(email["to"], email["subject"])
+    print(demo.get_status())
+    stop()
@@ -0,0 +1,186 @@
+"""
+取货库存响应解析
+只取出需要的字段（门店名称、每个型号的取货状态与是否有货），不为每次查询重复创建对象：
+门店名称与状态文字在多次查询之间驻留为同一个字符串，
+相同的 (门店, 状态, 是否有货) 组合共用同一个只读门店记录
+"""
+
+import json
+import threading
+
+# 型号不在门店的 partsAvailability 中时使用的状态
+UNKNOWN_STATUS = "unknown"
+# partsAvailability 中有该型号但缺少 pickupSearchQuote 时使用的状态
+DEFAULT_STATUS = "未知状态"
+
+
+class StoreRecord(dict):
+    """
+    一个门店的库存记录 {"store", "status", "available"}
+    同一记录会被多个型号、多次查询共用，因此创建后不允许修改
+    """
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("StoreRecord 是只读的")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # 复制得到普通字典，副本可以自由修改
+        return (dict, (dict(self),))
+
+
+class PickupParser:
+    """
+    解析 pickup-message-recommendations 与 fulfillment-messages 两种响应
+
+    参数:
+        max_records: 新建记录数达到该值后清空记录缓存（门店数×状态数通常只有几百个）
+    """
+    def __init__(self, max_records=100000):
+        self._lock = threading.Lock()
+        self._strings = {}
+        self._records = {}
+        self.max_records = max_records
+        self._records_base = 0
+        self.responses = 0
+        self.records_emitted = 0
+        self.records_created = 0
+
+    def decode(self, content):
+        """
+        把响应体解码为 JSON 对象
+
+        参数:
+            content: 响应体字节串（直接解码，不先转换为文本）或已解码的字典
+        """
+        if isinstance(content, (bytes, bytearray, str)):
+            return json.loads(content)
+        return content
+
+    @staticmethod
+    def stores(data):
+        """从响应中取出门店列表，兼容单型号与批量查询两种接口的数据结构，字段缺失或类型不符时返回空列表"""
+        body = data.get("body") if isinstance(data, dict) else None
+        if not isinstance(body, dict):
+            return []
+        pickup_message = body.get("PickupMessage")
+        if not isinstance(pickup_message, dict):
+            content = body.get("content")
+            pickup_message = content.get("pickupMessage") if isinstance(content, dict) else None
+        stores = pickup_message.get("stores") if isinstance(pickup_message, dict) else None
+        return stores if isinstance(stores, list) else []
+
+    def _store_cache_locked(self, store_name):
+        """门店的记录缓存 ({状态: 无货记录}, {状态: 有货记录})，可以直接用是否有货作为下标"""
+        cache = self._records.get(store_name)
+        if cache is None:
+            store_name = self._strings.setdefault(store_name, store_name)
+            cache = self._records[store_name] = ({}, {})
+        return cache
+
+    def _new_record_locked(self, store_name, status, available, cache):
+        if self.records_created - self._records_base >= self.max_records:
+            # 状态文字异常多时防止缓存无限增长，已发布的记录不受影响
+            self._records_base = self.records_created
+            for by_status in self._records.values():
+                by_status[0].clear()
+                by_status[1].clear()
+        store_name = self._strings.setdefault(store_name, store_name)
+        status = self._strings.setdefault(status, status)
+        record = cache[status] = StoreRecord(store=store_name, status=status, available=available)
+        self.records_created += 1
+        return record
+
+    def _parse_locked(self, data, codes):
+        results = {code: [] for code in codes}
+        found = set()
+        emitted = 0
+        for store in self.stores(self.decode(data)):
+            if not isinstance(store, dict):
+                continue
+            store_name = store.get("storeName")
+            cache = self._store_cache_locked(store_name)
+            parts = store.get("partsAvailability")
+            if not isinstance(parts, dict):
+                parts = {}
+            for code, records in results.items():
+                part = parts.get(code)
+                if isinstance(part, dict) and part:
+                    found.add(code)
+                    status = part.get("pickupSearchQuote", DEFAULT_STATUS)
+                    available = part.get("pickupDisplay") == "available"
+                else:
+                    status = UNKNOWN_STATUS
+                    available = False
+                by_status = cache[available]
+                record = by_status.get(status)
+                if record is None:
+                    record = self._new_record_locked(store_name, status, available, by_status)
+                records.append(record)
+            emitted += len(results)
+        self.responses += 1
+        self.records_emitted += emitted
+        return results, found
+
+    def parse(self, data, codes):
+        """
+        按型号代码拆分门店库存
+
+        参数:
+            data: 已解码的响应数据，或响应体字节串
+            codes: 需要的型号代码列表
+
+        返回:
+            ({型号代码: 门店记录列表}, 缺失的型号代码列表)；
+            缺失型号是在所有门店中都没有出现的型号，它们不会出现在结果字典中
+        """
+        with self._lock:
+            results, found = self._parse_locked(data, codes)
+        missing = [code for code in codes if code not in found]
+        for code in missing:
+            del results[code]
+        return results, missing
+
+    def parse_single(self, data, code):
+        """
+        解析单个型号的响应
+
+        返回:
+            门店记录列表；门店的 partsAvailability 中没有该型号时状态为 unknown，
+            响应中没有门店时返回空列表
+        """
+        with self._lock:
+            results, _ = self._parse_locked(data, [code])
+        return results[code]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "stores": len(self._records),
+                "strings": len(self._strings),
+                "records_emitted": self.records_emitted,
+                "records_created": self.records_created,
+            }
+
+
+# 创建全局解析器实例
+pickup_parser = PickupParser()
+
+
+if __name__ == "__main__":
+    payload = json.dumps({"body": {"PickupMessage": {"stores": [
+        {"storeName": "Apple Central", "partsAvailability": {
+            "MFYN4ZA/A": {"pickupDisplay": "available", "pickupSearchQuote": "今天可取货"}}},
+        {"storeName": "Apple ifc mall", "partsAvailability": {}},
+        {"storeName": "Apple Canton Road"},
+    ]}}}, ensure_ascii=False).encode("utf-8")
+
+    parser = PickupParser()
+    print(parser.parse(payload, ["MFYN4ZA/A", "MFYT4ZA/A"]))
+    first = parser.parse_single(payload, "MFYT4ZA/A")
+    second = parser.parse_single(payload, "MFYT4ZA/A")
+    print(first, "记录复用:", all(a is b for a, b in zip(first, second)))
+    print(parser.get_stats())
@@ -0,0 +1,248 @@
+"""
+自适应轮询调度器
+为每个型号单独安排下一次查询时间：状态变化频繁或用户正在关注的型号查询得更勤，
+长时间稳定无货的型号按指数退避降低频率，整体请求数受每分钟预算限制
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+
+
+class ModelSchedule:
+    """单个型号的调度状态"""
+    def __init__(self, now):
+        self.next_poll = now
+        self.interval = 0.0
+        self.volatility = 0.0
+        self.signature = None
+        self.last_change = now
+        self.all_unavailable = False
+        self.backoff = 1.0
+        self.watched_until = 0.0
+        self.polls = 0
+        self.changes = 0
+
+    def to_dict(self, now):
+        return {
+            "next_poll_in": round(max(self.next_poll - now, 0.0), 1),
+            "interval": round(self.interval, 1),
+            "volatility": round(self.volatility, 3),
+            "watched": self.watched_until > now,
+            "stable_for": round(now - self.last_change, 1),
+            "polls": self.polls,
+            "changes": self.changes,
+        }
+
+
+class PollScheduler:
+    """
+    按型号的优先级调度器
+
+    参数:
+        base_interval: 基础查询间隔（秒），通常取 CONFIG['refresh_interval']
+        max_interval: 退避后的最大查询间隔（秒）
+        stable_after: 持续无货多久后开始指数退避（秒）
+        budget_per_minute: 每分钟允许发出的请求数上限
+        watch_seconds: 用户关注一个型号后的加速时长（秒）
+        max_watched: 同时处于关注期的型号数上限，超出的关注请求被忽略
+        in_flight_timeout: 型号被取出后若迟迟没有结果，多久后重新调度（秒）
+    """
+    # 波动度滑动平均的平滑系数
+    ALPHA = 0.3
+
+    def __init__(self, base_interval=3.0, max_interval=600.0, stable_after=3600.0,
+                 budget_per_minute=120, watch_seconds=600.0, in_flight_timeout=60.0,
+                 max_watched=20):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._heap = []
+        self._sent = deque()
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.stable_after = stable_after
+        self.budget_per_minute = budget_per_minute
+        self.watch_seconds = watch_seconds
+        self.in_flight_timeout = in_flight_timeout
+        self.max_watched = max_watched
+
+    def _push_locked(self, model, next_poll):
+        self._models[model].next_poll = next_poll
+        heapq.heappush(self._heap, (next_poll, model))
+
+    def register(self, models):
+        """注册需要调度的型号，新型号立即到期"""
+        now = time.time()
+        with self._lock:
+            for model in models:
+                if model not in self._models:
+                    self._models[model] = ModelSchedule(now)
+                    self._push_locked(model, now)
+
+    def unregister(self, models):
+        """取消调度若干型号（如集群模式下租约转给了其他节点），堆中的旧项在取出时跳过"""
+        with self._lock:
+            for model in models:
+                self._models.pop(model, None)
+
+    def configure(self, base_interval=None, max_interval=None, stable_after=None, budget_per_minute=None):
+        """更新调度参数，在下一次安排时生效"""
+        with self._lock:
+            if base_interval is not None:
+                self.base_interval = base_interval
+            if max_interval is not None:
+                self.max_interval = max_interval
+            if stable_after is not None:
+                self.stable_after = stable_after
+            if budget_per_minute is not None:
+                self.budget_per_minute = budget_per_minute
+
+    def watch(self, models, now=None):
+        """
+        标记用户正在关注的型号，关注期内以更高频率查询
+        新进入关注期的型号退避清零并尽快安排一次；已在关注期内的型号只延长关注期，
+        重复登记不会反复清零退避。同时关注的型号数超过 max_watched 时，其余新型号被忽略
+
+        返回:
+            实际处于关注期的型号列表
+        """
+        now = now or time.time()
+        watched = []
+        with self._lock:
+            count = sum(1 for schedule in self._models.values() if schedule.watched_until > now)
+            for model in models:
+                schedule = self._models.get(model)
+                if schedule is None or model in watched:
+                    continue
+                if schedule.watched_until <= now:
+                    if count >= self.max_watched:
+                        continue
+                    count += 1
+                    schedule.backoff = 1.0
+                    soonest = now + self.base_interval / 2
+                    if schedule.next_poll > soonest:
+                        self._push_locked(model, soonest)
+                schedule.watched_until = now + self.watch_seconds
+                watched.append(model)
+        return watched
+
+    def _priority(self, schedule, now):
+        # 关注中的型号最优先，其次按波动度
+        return (schedule.watched_until <= now, -schedule.volatility)
+
+    def pop_due(self, now=None):
+        """
+        取出所有已到期的型号，按优先级排序
+        取出的型号暂时安排在 in_flight_timeout 之后，收到结果时会重新安排
+        """
+        now = now or time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_poll, model = heapq.heappop(self._heap)
+                schedule = self._models.get(model)
+                if schedule is None or schedule.next_poll != next_poll or model in due:
+                    # 已被重新安排的过期堆项
+                    continue
+                due.append(model)
+            for model in due:
+                self._push_locked(model, now + self.in_flight_timeout)
+            due.sort(key=lambda model: self._priority(self._models[model], now))
+        return due
+
+    def reserve(self, count, now=None):
+        """
+        在每分钟预算内预留请求数
+
+        返回:
+            实际允许发出的请求数（可能小于 count）
+        """
+        now = now or time.time()
+        with self._lock:
+            while self._sent and now - self._sent[0] >= 60.0:
+                self._sent.popleft()
+            allowed = max(0, min(count, self.budget_per_minute - len(self._sent)))
+            self._sent.extend([now] * allowed)
+            return allowed
+
+    def defer(self, models, now=None):
+        """预算不足时把型号推迟到预算窗口释放之后"""
+        now = now or time.time()
+        with self._lock:
+            retry_at = self._sent[0] + 60.0 if self._sent else now + self.base_interval
+            for model in models:
+                if model in self._models:
+                    self._push_locked(model, max(retry_at, now))
+
+    def record_result(self, model, result, now=None):
+        """
+        根据查询结果更新型号的波动度并安排下一次查询
+
+        参数:
+            model: 型号名称
+            result: 门店库存列表，或 {"error": ...}
+        """
+        now = now or time.time()
+        with self._lock:
+            schedule = self._models.get(model)
+            if schedule is None:
+                return
+            schedule.polls += 1
+
+            if isinstance(result, list):
+                signature = tuple((store.get("store"), store.get("status")) for store in result)
+                changed = schedule.signature is not None and signature != schedule.signature
+                schedule.signature = signature
+                schedule.all_unavailable = not any(store.get("available") for store in result)
+                schedule.volatility = (1 - self.ALPHA) * schedule.volatility + (self.ALPHA if changed else 0.0)
+                if changed:
+                    schedule.changes += 1
+                    schedule.last_change = now
+                    schedule.backoff = 1.0
+                elif schedule.all_unavailable and now - schedule.last_change >= self.stable_after:
+                    schedule.backoff = min(schedule.backoff * 2, self.max_interval / self.base_interval)
+                else:
+                    schedule.backoff = 1.0
+
+            # 波动越大间隔越短，最多缩短到基础间隔的三分之一
+            interval = self.base_interval / (1 + 2 * schedule.volatility) * schedule.backoff
+            if schedule.watched_until > now:
+                interval = min(interval, self.base_interval / 2)
+            schedule.interval = min(interval, self.max_interval)
+            self._push_locked(model, now + schedule.interval)
+
+    def seconds_until_next(self, now=None):
+        """距离最早一个型号到期还有多少秒"""
+        now = now or time.time()
+        with self._lock:
+            while self._heap and (self._heap[0][1] not in self._models
+                                  or self._models[self._heap[0][1]].next_poll != self._heap[0][0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return self.base_interval
+            return max(self._heap[0][0] - now, 0.0)
+
+    def due_count(self, now=None):
+        """已到期、等待查询的型号数"""
+        now = now or time.time()
+        with self._lock:
+            return sum(1 for schedule in self._models.values() if schedule.next_poll <= now)
+
+    def get_status(self):
+        """获取各型号的调度状态与预算使用情况"""
+        now = time.time()
+        with self._lock:
+            models = {model: schedule.to_dict(now) for model, schedule in self._models.items()}
+            used = sum(1 for sent in self._sent if now - sent < 60.0)
+        return {
+            "base_interval": self.base_interval,
+            "max_interval": self.max_interval,
+            "budget_per_minute": self.budget_per_minute,
+            "requests_last_minute": used,
+            "models": models,
+        }
+
+
+# 创建全局调度器实例
+poll_scheduler = PollScheduler()
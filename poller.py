@@ -0,0 +1,45 @@
+"""
+生产部署的查询进程
+唯一负责向上游发出请求的进程：运行调度与查询线程，把库存状态写入共享快照文件，
+并在本机端口上提供控制接口，web 进程收到的刷新、关注、配置修改等请求会转发到这里
+
+示例:
+    python poller.py
+    STOCK_POLLER_URL=http://127.0.0.1:5001 gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+import os
+import signal
+import sys
+from urllib.parse import urlsplit
+
+os.environ.setdefault("STOCK_ROLE", "poller")
+
+import logging
+
+from werkzeug.serving import make_server
+
+import app as stock_app
+
+
+def main():
+    if stock_app.CONFIG['role'] != 'poller':
+        raise SystemExit("poller.py 需要 STOCK_ROLE=poller")
+    stock_app.start_background_tasks()
+    # 收到 SIGTERM 时正常退出，执行退出清理（如释放集群租约，其余节点立即接手）
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    address = urlsplit(stock_app.CONFIG['poller_url'])
+    # 控制接口只有 web 进程访问，不输出访问日志
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(address.hostname, address.port, stock_app.app, threaded=True)
+    stock_app.log.info("查询进程已启动", control=stock_app.CONFIG['poller_url'],
+                       shared_state=stock_app.CONFIG['shared_state_path'])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+请求速率限制器
+为每个出口身份（直连或某个代理）维护独立的令牌桶，
+在锁内只计算需要等待的时间，等待本身在锁外进行，不会串行化其他线程
+"""
+
+import threading
+import time
+
+# 不使用代理时的出口身份
+DIRECT = "direct"
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    参数:
+        rate: 每秒补充的令牌数
+        capacity: 桶容量，即允许的突发请求数
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """
+        预约一个令牌，返回需要等待的秒数
+        令牌不足时允许透支，后来者依次排在更晚的时间点
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    按出口身份划分的速率限制器
+
+    参数:
+        rate_per_second: 每个身份每秒允许的请求数
+        burst: 每个身份允许的突发请求数
+    """
+    def __init__(self, rate_per_second=2.0, burst=1):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+
+    def reserve(self, identity=DIRECT):
+        """
+        为指定身份预约一次请求，返回需要等待的秒数（不会阻塞）
+        异步引擎使用此方法配合 asyncio.sleep
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(identity)
+            if bucket is None:
+                bucket = TokenBucket(self.rate_per_second, self.burst)
+                self._buckets[identity] = bucket
+            return bucket.reserve(now)
+
+    def acquire(self, identity=DIRECT):
+        """
+        为指定身份获取一次请求许可，必要时在锁外等待
+
+        返回:
+            实际等待的秒数
+        """
+        wait = self.reserve(identity)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def configure(self, rate_per_second=None, burst=None):
+        """更新速率与突发参数，现有令牌桶立即生效"""
+        with self._lock:
+            if rate_per_second is not None:
+                self.rate_per_second = rate_per_second
+            if burst is not None:
+                self.burst = burst
+            for bucket in self._buckets.values():
+                bucket.rate = self.rate_per_second
+                bucket.capacity = self.burst
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def get_status(self):
+        """获取各身份令牌桶的当前状态"""
+        now = time.monotonic()
+        with self._lock:
+            buckets = {
+                identity: round(min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate), 3)
+                for identity, bucket in self._buckets.items()
+            }
+        return {
+            "rate_per_second": self.rate_per_second,
+            "burst": self.burst,
+            "tokens": buckets,
+        }
+
+
+# 创建全局速率限制器实例
+rate_limiter = RateLimiter()
+
+# 示例：总吞吐量随出口身份数量线性增长
+if __name__ == "__main__":
+    def measure_throughput(identity_count, duration=2.0, workers=20):
+        limiter = RateLimiter(rate_per_second=10.0, burst=1)
+        identities = [f"http://proxy{i}.example.com:8080" for i in range(identity_count)]
+        counts = [0] * workers
+        deadline = time.monotonic() + duration
+
+        def worker(index):
+            identity = identities[index % identity_count]
+            while True:
+                limiter.acquire(identity)
+                if time.monotonic() >= deadline:
+                    return
+                counts[index] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / duration
+
+    for count in (1, 2, 4, 8):
+        print(f"{count} 个代理: {measure_throughput(count):.1f} 请求/秒 (每个代理限速 10 请求/秒)")
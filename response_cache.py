@@ -0,0 +1,142 @@
+"""
+版本化响应缓存
+库存状态每次变化时版本号加一（见 state_store）；同一版本的响应体只序列化、压缩一次。
+主页的页面外壳只在配置变化时重新渲染，嵌入的库存快照按版本拼接
+"""
+
+import gzip
+import json
+import threading
+
+# 小于该长度的响应不压缩
+GZIP_MIN_SIZE = 1024
+
+
+class VersionedResponseCache:
+    """
+    按版本缓存序列化后的响应体
+
+    参数:
+        compress_level: gzip 压缩级别
+    """
+    def __init__(self, compress_level=6):
+        self._lock = threading.Lock()
+        self._cached_version = None
+        self._body = None
+        self._gzip_body = None
+        self.compress_level = compress_level
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, payload):
+        """序列化并按需压缩，返回 (响应体, gzip 响应体或 None)"""
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        gzip_body = gzip.compress(body, self.compress_level) if len(body) >= GZIP_MIN_SIZE else None
+        return body, gzip_body
+
+    def get(self, version, build_payload):
+        """
+        获取指定版本的响应体，版本未变化时直接复用缓存
+
+        参数:
+            version: 状态版本号
+            build_payload: 构造完整响应数据的函数
+
+        返回:
+            (响应体, gzip 响应体或 None)
+        """
+        with self._lock:
+            if self._cached_version == version:
+                self.hits += 1
+                return self._body, self._gzip_body
+        body, gzip_body = self.encode(build_payload())
+        with self._lock:
+            self.misses += 1
+            # 并发构造时只保留最新版本的缓存
+            if self._cached_version is None or self._cached_version < version:
+                self._cached_version = version
+                self._body = body
+                self._gzip_body = gzip_body
+        return body, gzip_body
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "cached_version": self._cached_version,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class PageCache:
+    """
+    嵌入库存快照的页面缓存
+
+    页面外壳（模板渲染结果）按键缓存，键变化时才重新渲染；外壳中的占位符替换为快照 JSON，
+    拼接后的页面与其 gzip 版本按快照版本缓存
+
+    参数:
+        placeholder: 外壳中嵌入快照的位置
+        compress_level: gzip 压缩级别
+    """
+    def __init__(self, placeholder, compress_level=6):
+        self.placeholder = placeholder
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._key = None
+        self._shell = None
+        self._cached_version = None
+        self._body = None
+        self._gzip_body = None
+        self.renders = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render, version, build_snapshot):
+        """
+        获取页面
+
+        参数:
+            key: 页面外壳的缓存键（如配置的 JSON），变化时重新渲染
+            render: 渲染页面外壳的函数，返回含占位符的 HTML 文本
+            version: 库存快照版本号
+            build_snapshot: 构造要嵌入的快照数据的函数
+
+        返回:
+            (页面, gzip 页面)
+        """
+        with self._lock:
+            if self._key == key and self._cached_version == version:
+                self.hits += 1
+                return self._body, self._gzip_body
+            shell = self._shell if self._key == key else None
+        if shell is None:
+            shell = render().encode("utf-8").split(self.placeholder.encode("utf-8"), 1)
+            with self._lock:
+                self.renders += 1
+        snapshot = json.dumps(build_snapshot(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # 嵌在 <script> 中的 JSON 不能出现 </script>，转义所有 "<"，JSON.parse 后内容不变
+        body = shell[0] + snapshot.replace(b"<", b"\\u003c") + shell[1]
+        gzip_body = gzip.compress(body, self.compress_level)
+        with self._lock:
+            self.misses += 1
+            if self._key != key or self._cached_version is None or self._cached_version < version:
+                self._key = key
+                self._shell = shell
+                self._cached_version = version
+                self._body = body
+                self._gzip_body = gzip_body
+        return body, gzip_body
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "cached_version": self._cached_version,
+                "renders": self.renders,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# 创建全局库存响应缓存实例
+stock_cache = VersionedResponseCache()
@@ -0,0 +1,266 @@
+"""
+重试策略
+按失败类型决定是否重试以及等待多久：
+- 429 / 403 视为限流信号：遵守 Retry-After，并让该出口（代理或直连）在一段时间内暂停发送，
+  暂停时长按 decorrelated jitter 指数增长；大部分出口都在短时间内被限流时进入全局冷却
+- 超时、5xx、响应缺少型号等按型号做 decorrelated jitter 退避后重试
+- 其他 4xx 不重试
+重试总量受预算限制（最近一分钟请求数的一定比例），被限流时不会因为重试放大请求量
+"""
+
+import bisect
+import math
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from email.utils import parsedate_to_datetime
+
+# 单类失败的处理规则
+# retry: 是否重试；base / cap: 退避的起始与上限（秒）；
+# throttle: 是否为限流信号；other_identity: 只有存在其他出口时才重试（被封禁的出口重试无意义）
+RetryRule = namedtuple("RetryRule", ["retry", "base", "cap", "throttle", "other_identity"])
+
+# 重试决定；delay 为重试前等待的秒数
+RetryDecision = namedtuple("RetryDecision", ["retry", "delay", "reason"])
+
+DEFAULT_RULES = {
+    "http_429": RetryRule(True, 2.0, 60.0, True, False),
+    "http_403": RetryRule(True, 5.0, 120.0, True, True),
+    "http_5xx": RetryRule(True, 0.5, 10.0, False, False),
+    "http_4xx": RetryRule(False, 0.0, 0.0, False, False),
+    "timeout": RetryRule(True, 1.0, 15.0, False, False),
+    "error": RetryRule(True, 0.5, 10.0, False, False),
+    "decode_error": RetryRule(True, 1.0, 10.0, False, False),
+    "empty_response": RetryRule(True, 0.3, 5.0, False, False),
+    "missing_parts": RetryRule(True, 0.3, 5.0, False, False),
+}
+
+
+def classify_failure(error):
+    """将请求异常归类为失败类型，如 http_429、timeout、decode_error、error"""
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return f"http_{status_code}"
+    name = type(error).__name__
+    if "Timeout" in name or isinstance(error, TimeoutError):
+        return "timeout"
+    if isinstance(error, ValueError):
+        # json.JSONDecodeError 以及 requests / httpx 的 JSON 解码错误
+        return "decode_error"
+    return "error"
+
+
+def retry_after_seconds(error, now=None):
+    """从 HTTP 错误响应中取出 Retry-After（秒数或 HTTP 日期），没有时返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - (now or time.time()), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Backoff:
+    """decorrelated jitter: 下一次等待在 [base, 上一次 × 3] 中随机取值，不超过 cap"""
+    __slots__ = ("previous", "until")
+
+    def __init__(self):
+        self.previous = 0.0
+        self.until = 0.0
+
+    def next(self, rule, rng):
+        previous = self.previous or rule.base
+        self.previous = min(rule.cap, rng.uniform(rule.base, previous * 3))
+        return self.previous
+
+
+class RetryPolicy:
+    """
+    按失败类型、出口与型号决定重试
+
+    参数:
+        rules: {失败类型: RetryRule}，覆盖默认规则
+        retry_budget: 最近一分钟内重试数占请求数的比例上限
+        min_retries_per_minute: 请求很少时也允许的重试数
+        cooldown_window: 判断是否整体被限流的时间窗口（秒）
+        cooldown_threshold: 窗口内至少多少次限流响应才可能进入全局冷却
+        throttle_ratio: 窗口内限流响应占请求数的比例达到该值才可能进入全局冷却（偶发的 429 只暂停对应出口）
+        fleet_fraction: 窗口内被限流的出口占全部出口的比例达到该值时进入全局冷却
+        base_cooldown / max_cooldown: 全局冷却时长的起始与上限（秒），连续冷却时按 decorrelated jitter 增长
+        seed: 随机种子
+    """
+    def __init__(self, rules=None, retry_budget=0.2, min_retries_per_minute=5, cooldown_window=30.0,
+                 cooldown_threshold=3, throttle_ratio=0.3, fleet_fraction=0.5, base_cooldown=10.0, max_cooldown=300.0, seed=None):
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.retry_budget = retry_budget
+        self.min_retries_per_minute = min_retries_per_minute
+        self.cooldown_window = cooldown_window
+        self.cooldown_threshold = cooldown_threshold
+        self.throttle_ratio = throttle_ratio
+        self.fleet_fraction = fleet_fraction
+        self.cooldown_rule = RetryRule(True, base_cooldown, max_cooldown, True, False)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清除所有退避、暂停与冷却状态"""
+        with self._lock:
+            self._identities = {}
+            self._models = {}
+            self._throttles = deque()
+            self._requests = deque()
+            self._retries = deque()
+            self._cooldown = _Backoff()
+            self.stats = {"retries": 0, "gave_up": 0, "over_budget": 0, "cooldowns": 0, "throttled": 0}
+
+    def rule_for(self, kind):
+        rule = self.rules.get(kind)
+        if rule is not None:
+            return rule
+        if kind.startswith("http_5"):
+            return self.rules["http_5xx"]
+        if kind.startswith("http_"):
+            return self.rules["http_4xx"]
+        return self.rules["error"]
+
+    @staticmethod
+    def _trim(items, horizon):
+        while items and items[0] < horizon:
+            items.popleft()
+
+    def observe(self, identity, kind=None, retry_after=None, fleet_size=1, now=None):
+        """
+        记录一次上游请求的结果（每个请求调用一次）
+
+        参数:
+            identity: 出口（代理地址或直连）
+            kind: 失败类型，None 表示成功
+            retry_after: 响应中的 Retry-After 秒数
+            fleet_size: 当前可用的出口数量
+        """
+        now = now or time.time()
+        with self._lock:
+            self._requests.append(now)
+            self._trim(self._requests, now - 60.0)
+            if kind is None:
+                state = self._identities.get(identity)
+                if state is not None and state.until <= now:
+                    del self._identities[identity]
+                if self._cooldown.until and self._cooldown.until <= now:
+                    self._cooldown = _Backoff()
+                return
+            rule = self.rule_for(kind)
+            if not rule.throttle:
+                return
+
+            self.stats["throttled"] += 1
+            repeated = identity in self._identities
+            state = self._identities.setdefault(identity, _Backoff())
+            backoff = state.next(rule, self._random)
+            # 首次限流按 Retry-After 暂停；恢复成功请求之前再次被限流时按退避增长，且不短于 Retry-After
+            pause = retry_after if retry_after is not None and not repeated else max(backoff, retry_after or 0.0)
+            state.until = max(state.until, now + pause)
+
+            self._throttles.append((now, identity))
+            while self._throttles and self._throttles[0][0] < now - self.cooldown_window:
+                self._throttles.popleft()
+            throttled = {item for _, item in self._throttles}
+            needed = max(1, math.ceil(self.fleet_fraction * max(fleet_size, 1)))
+            recent = len(self._requests) - bisect.bisect_left(self._requests, now - self.cooldown_window)
+            if (len(self._throttles) >= self.cooldown_threshold and len(throttled) >= needed
+                    and len(self._throttles) >= self.throttle_ratio * recent and self._cooldown.until <= now):
+                duration = max(self._cooldown.next(self.cooldown_rule, self._random), retry_after or 0.0)
+                self._cooldown.until = now + duration
+                self._throttles.clear()
+                self.stats["cooldowns"] += 1
+
+    def identity_wait(self, identity, now=None):
+        """该出口还需暂停多少秒（Retry-After、限流退避或全局冷却）"""
+        now = now or time.time()
+        state = self._identities.get(identity)
+        until = max(state.until if state is not None else 0.0, self._cooldown.until)
+        return max(until - now, 0.0)
+
+    def cooldown_remaining(self, now=None):
+        """全局冷却剩余的秒数"""
+        return max(self._cooldown.until - (now or time.time()), 0.0)
+
+    def decide(self, kind, models, attempt, max_retries, fleet_size=1, now=None):
+        """
+        一次失败之后是否重试
+
+        参数:
+            kind: 失败类型
+            models: 需要重试的型号名称列表
+            attempt: 已经进行的尝试次数减一（首次请求失败时为 0）
+            max_retries: 最大重试次数
+            fleet_size: 当前可用的出口数量
+
+        返回:
+            RetryDecision；delay 为按型号退避的等待，出口的暂停在发送前由 identity_wait 另行执行
+        """
+        now = now or time.time()
+        rule = self.rule_for(kind)
+        with self._lock:
+            if not rule.retry or attempt >= max_retries:
+                reason = "not_retryable" if not rule.retry else "exhausted"
+            elif rule.other_identity and fleet_size <= 1:
+                reason = "no_other_identity"
+            elif self._cooldown.until > now:
+                reason = "cooldown"
+            else:
+                horizon = now - 60.0
+                self._trim(self._requests, horizon)
+                self._trim(self._retries, horizon)
+                budget = max(self.min_retries_per_minute, self.retry_budget * len(self._requests))
+                reason = "over_budget" if len(self._retries) >= budget else None
+            if reason is not None:
+                self.stats["over_budget" if reason == "over_budget" else "gave_up"] += 1
+                return RetryDecision(False, 0.0, reason)
+
+            delay = 0.0
+            for model in models:
+                delay = max(delay, self._models.setdefault(model, _Backoff()).next(rule, self._random))
+            self._retries.append(now)
+            self.stats["retries"] += 1
+            return RetryDecision(True, delay, kind)
+
+    def model_succeeded(self, models):
+        """型号查询成功后清除其退避状态"""
+        with self._lock:
+            for model in models:
+                self._models.pop(model, None)
+
+    def get_status(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "cooldown_remaining": round(max(self._cooldown.until - now, 0.0), 1),
+                "paused_identities": {identity: round(state.until - now, 1)
+                                      for identity, state in self._identities.items() if state.until > now},
+                "backing_off_models": len(self._models),
+                "retry_budget": self.retry_budget,
+                **self.stats,
+            }
+
+
+# 创建全局重试策略实例
+retry_policy = RetryPolicy()
+
+
+if __name__ == "__main__":
+    policy = RetryPolicy(seed=1)
+    print("超时重试等待:", [round(policy.decide("timeout", ["A"], attempt, 5).delay, 2) for attempt in range(5)])
+    for identity in ("proxy-1", "proxy-2", "proxy-1"):
+        policy.observe(identity, "http_429", retry_after=3, fleet_size=3)
+    print("429 后出口暂停:", round(policy.identity_wait("proxy-1"), 1), "全局冷却:", round(policy.cooldown_remaining(), 1))
+    print("冷却中重试:", policy.decide("http_503", ["B"], 0, 2, fleet_size=3))
+    print(policy.get_status())
@@ -0,0 +1,238 @@
+"""
+HTTP 会话池
+为每个代理维护一个持久的 requests.Session，复用 TCP/TLS 连接，
+并统计新建连接与复用连接的数量。
+会话以借出/归还的方式使用：需要关闭的会话（空闲超时、连接池参数变化）如果仍被借出，
+先从池中摘下，等最后一个使用方归还后再关闭，不会中断进行中的请求
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# 不使用代理时的会话键
+DIRECT = "direct"
+
+
+class _ConnectionStats:
+    """连接计数器（线程安全）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_checkout(self, reused):
+        with self._lock:
+            if reused:
+                self.reused += 1
+            else:
+                self.opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.opened,
+                "connections_reused": self.reused,
+            }
+
+
+def _counting_pool_class(base, stats):
+    """
+    生成一个在取出连接时计数的连接池类：取出的连接已有打开的套接字即为复用，
+    否则（新建的连接，或空闲时被对端关闭的连接）发送时会重新建立连接
+    """
+    class CountingConnectionPool(base):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            stats.record_checkout(getattr(conn, "sock", None) is not None)
+            return conn
+
+    CountingConnectionPool.__name__ = f"Counting{base.__name__}"
+    return CountingConnectionPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    带连接计数的 HTTPAdapter
+    直连和经代理的连接池都会替换为计数版本
+    """
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        self._pool_classes = {
+            "http": _counting_pool_class(HTTPConnectionPool, stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, stats),
+        }
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = self._pool_classes
+        return manager
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+
+class SessionPool:
+    """
+    按代理地址划分的会话池
+
+    参数:
+        pool_size: 每个会话每个主机保持的最大连接数
+        idle_timeout: 会话空闲多久后被关闭（秒）
+        max_retries: 连接失败时适配器层面的重试次数
+    """
+    def __init__(self, pool_size=10, idle_timeout=300, max_retries=1):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._last_used = {}
+        self._stats = {}
+        # 会话 -> 借出数；已从池中摘下、等待归还后关闭的会话
+        self._in_use = {}
+        self._retired = set()
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+
+    def _build_session(self, proxy_url, stats):
+        session = requests.Session()
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=0,
+            backoff_factor=0.3,
+            allowed_methods=frozenset(["GET"]),
+            # 429 / 503 原样返回给调用方，由重试策略按 Retry-After 暂停出口
+            respect_retry_after_header=False,
+        )
+        adapter = CountingHTTPAdapter(
+            stats,
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if proxy_url:
+            session.proxies = {"http": proxy_url, "https": proxy_url}
+        return session
+
+    def acquire(self, proxy_url=None):
+        """
+        借出指定代理对应的会话，不存在时创建；用完后必须调用 release 归还
+
+        参数:
+            proxy_url: 代理地址，None 表示直连
+        """
+        key = proxy_url or DIRECT
+        now = time.time()
+        with self._lock:
+            self._evict_idle_locked(now)
+            session = self._sessions.get(key)
+            if session is None:
+                stats = self._stats.setdefault(key, _ConnectionStats())
+                session = self._build_session(proxy_url, stats)
+                self._sessions[key] = session
+            self._last_used[key] = now
+            self._in_use[session] = self._in_use.get(session, 0) + 1
+            return session
+
+    def release(self, session):
+        """归还借出的会话；已被摘下的会话在最后一个使用方归还时关闭"""
+        with self._lock:
+            count = self._in_use.pop(session, 0) - 1
+            if count > 0:
+                self._in_use[session] = count
+                return
+            if session not in self._retired:
+                return
+            self._retired.discard(session)
+        session.close()
+
+    @contextmanager
+    def session(self, proxy_url=None):
+        """借出会话的上下文管理器，退出时归还"""
+        session = self.acquire(proxy_url)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def _retire_locked(self, key):
+        """从池中摘下会话：没有借出时立即关闭，否则在归还时关闭"""
+        session = self._sessions.pop(key)
+        self._last_used.pop(key, None)
+        if session in self._in_use:
+            self._retired.add(session)
+        else:
+            session.close()
+
+    def _evict_idle_locked(self, now):
+        for key, last_used in list(self._last_used.items()):
+            if now - last_used > self.idle_timeout and self._sessions[key] not in self._in_use:
+                self._retire_locked(key)
+
+    def evict_idle(self):
+        """关闭所有空闲超时的会话"""
+        with self._lock:
+            self._evict_idle_locked(time.time())
+
+    def configure(self, pool_size=None, idle_timeout=None):
+        """
+        更新会话池参数，连接池大小变化时关闭现有会话以便按新参数重建
+        """
+        with self._lock:
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            if pool_size is not None and pool_size != self.pool_size:
+                self.pool_size = pool_size
+                self._close_all_locked()
+
+    def _close_all_locked(self):
+        for key in list(self._sessions):
+            self._retire_locked(key)
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            self._close_all_locked()
+
+    def get_stats(self):
+        """获取连接复用统计，按代理列出并给出合计"""
+        with self._lock:
+            per_proxy = {key: stats.snapshot() for key, stats in self._stats.items()}
+            active = len(self._sessions)
+            retiring = len(self._retired)
+        totals = {"requests": 0, "connections_opened": 0, "connections_reused": 0}
+        for stats in per_proxy.values():
+            for name in totals:
+                totals[name] += stats[name]
+        return {
+            "active_sessions": active,
+            "retiring_sessions": retiring,
+            "pool_size": self.pool_size,
+            "idle_timeout": self.idle_timeout,
+            **totals,
+            "per_proxy": per_proxy,
+        }
+
+
+# 创建全局会话池实例
+session_pool = SessionPool()
@@ -0,0 +1,121 @@
+"""
+进程间共享的库存快照
+生产部署时由一个查询进程（poller.py）负责所有上游请求，把完整状态写入本地快照文件；
+多个 Web 进程（gunicorn 工作进程）跟随该文件，从本地内存提供 /api/stock 等只读接口，
+Web 进程数量增加不会增加上游请求。
+
+写入: 先写临时文件再 os.replace，读取方看到的总是某个完整版本；
+      状态变化时唤醒写线程，短时间内的多次变化合并为一次写入
+读取: 定期 stat 文件，修改时间或 inode 变化时才重新读取
+"""
+
+import json
+import os
+import threading
+import time
+
+from structured_log import get_logger
+
+log = get_logger("shared_state")
+
+
+class SnapshotWriter:
+    """
+    把状态写入快照文件的后台线程
+
+    参数:
+        path: 快照文件路径
+        build: 返回可 JSON 序列化状态的函数
+        min_interval: 两次写入的最小间隔（秒），期间的变化合并到下一次写入
+    """
+    def __init__(self, path, build, min_interval=0.05):
+        self.path = path
+        self.build = build
+        self.min_interval = min_interval
+        self._dirty = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.writes = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, daemon=True)
+                self._thread.start()
+        self.notify()
+
+    def notify(self):
+        """标记状态已变化"""
+        self._dirty.set()
+
+    def write(self):
+        """立即写入一次"""
+        data = json.dumps(self.build(), ensure_ascii=False, separators=(",", ":"))
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+        self.writes += 1
+
+    def _write_loop(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                self.write()
+            except (OSError, TypeError, ValueError) as e:
+                log.error("写入共享快照失败", path=self.path, error=str(e))
+            time.sleep(self.min_interval)
+
+
+class SnapshotFollower:
+    """
+    跟随快照文件的后台线程，文件变化时以解析后的数据调用 apply
+
+    参数:
+        path: 快照文件路径
+        apply: 接收快照数据的函数
+        interval: 检查文件是否变化的间隔（秒）
+    """
+    def __init__(self, path, apply, interval=0.1):
+        self.path = path
+        self.apply = apply
+        self.interval = interval
+        self._signature = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.loads = 0
+
+    def start(self):
+        """启动跟随线程，可重复调用；首次调用时同步读取一次，保证返回后已有数据"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self.poll()
+                self._thread = threading.Thread(target=self._follow_loop, daemon=True)
+                self._thread.start()
+
+    def poll(self):
+        """检查一次文件，有变化时读取并应用，返回是否应用了新数据"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self._signature = signature
+        self.apply(data)
+        self.loads += 1
+        return True
+
+    def _follow_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning("读取共享快照失败", path=self.path, error=str(e))
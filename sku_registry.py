@@ -0,0 +1,155 @@
+"""
+SKU 注册表
+从配置文件加载地区（接口地址、语言、查询位置）与产品目录，
+加载时一次性建好按型号代码、按系列/颜色/容量、按地区的索引，运行中只读
+"""
+
+import json
+from collections import namedtuple
+
+# 一个地区的查询参数；endpoint 由站点与路径拼成，如 https://www.apple.com/hk/shop/...
+Region = namedtuple("Region", ["code", "name", "site", "path", "location", "accept_language", "part_suffix"])
+
+# 一个地区中的一个型号；key 是在库存状态、调度与历史中使用的型号名称
+Sku = namedtuple("Sku", ["key", "name", "region", "series", "color", "capacity", "code"])
+
+ATTRIBUTES = ("series", "color", "capacity")
+
+
+class SkuRegistry:
+    """
+    只读的型号目录与索引
+
+    参数:
+        catalog: 目录配置（见 catalog.json）
+        api_base: 覆盖所有地区站点地址，用于指向本地模拟接口
+        regions: 启用的地区代码列表，默认取目录中的 enabled_regions
+    """
+    def __init__(self, catalog, api_base=None, regions=None):
+        self.regions = {}
+        for entry in catalog["regions"]:
+            site = (api_base or entry["site"]).rstrip("/")
+            self.regions[entry["code"]] = Region(
+                entry["code"], entry["name"], site, entry.get("path", ""), entry["location"],
+                entry.get("accept_language", "zh-CN,zh;q=0.9,en;q=0.8"), entry.get("part_suffix", ""),
+            )
+        self.default_region = catalog.get("default_region") or next(iter(self.regions))
+
+        enabled = regions or catalog.get("enabled_regions") or [self.default_region]
+        unknown = [code for code in enabled if code not in self.regions]
+        if unknown:
+            raise ValueError(f"未知的地区代码: {', '.join(unknown)}")
+        self.enabled_regions = [code for code in self.regions if code in enabled]
+        if self.default_region not in self.enabled_regions:
+            self.default_region = self.enabled_regions[0]
+
+        self.series_capacities = {entry["name"]: list(entry["capacities"]) for entry in catalog["series"]}
+        self.colors = list(catalog["colors"])
+        self.capacities = []
+        for capacities in self.series_capacities.values():
+            self.capacities.extend(capacity for capacity in capacities if capacity not in self.capacities)
+
+        self.skus = []
+        self.by_key = {}
+        self.by_code = {}
+        self.by_region = {code: [] for code in self.enabled_regions}
+        self._by_attribute = {attribute: {} for attribute in ATTRIBUTES}
+        self.model_details = {code: {} for code in self.enabled_regions}
+
+        for code in self.enabled_regions:
+            region = self.regions[code]
+            for product in catalog["products"]:
+                part_code = product.get("codes", {}).get(code) or f"{product['part']}{region.part_suffix}"
+                sku = Sku(self.model_key(code, product["name"]), product["name"], code,
+                          product["series"], product["color"], product["capacity"], part_code)
+                if sku.key in self.by_key:
+                    raise ValueError(f"重复的型号: {sku.key}")
+                self.skus.append(sku)
+                self.by_key[sku.key] = sku
+                self.by_code[(code, part_code)] = sku
+                self.by_region[code].append(sku)
+                for attribute in ATTRIBUTES:
+                    self._by_attribute[attribute].setdefault(getattr(sku, attribute), []).append(sku.key)
+                (self.model_details[code].setdefault(sku.series, {})
+                 .setdefault(sku.color, {})[sku.capacity]) = sku.key
+
+        self._by_attribute = {
+            attribute: {value: frozenset(keys) for value, keys in index.items()}
+            for attribute, index in self._by_attribute.items()
+        }
+        # 型号名称 -> 型号代码，按地区、目录顺序排列
+        self.model_codes = {sku.key: sku.code for sku in self.skus}
+
+    @classmethod
+    def load(cls, path, api_base=None, regions=None):
+        """从 JSON 文件加载目录"""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), api_base=api_base, regions=regions)
+
+    def model_key(self, region, name):
+        """默认地区直接使用产品名称，其他地区加上地区前缀，如 [MO] iPhone 17 Pro 256GB - 宇宙橙"""
+        return name if region == self.default_region else f"[{region.upper()}] {name}"
+
+    def region_of(self, key):
+        """获取型号所属的地区"""
+        return self.regions[self.by_key[key].region]
+
+    def endpoint(self, region, batch=False):
+        """
+        获取地区的查询端点
+
+        参数:
+            region: 地区代码
+            batch: True 时返回支持多个型号的 fulfillment-messages 端点
+        """
+        region = self.regions[region]
+        name = "fulfillment-messages" if batch else "pickup-message-recommendations"
+        return f"{region.site}{region.path}/shop/{name}"
+
+    def find(self, series=None, color=None, capacity=None, region=None):
+        """
+        按属性查询型号，各条件取交集
+
+        返回:
+            按目录顺序排列的 Sku 列表
+        """
+        keys = None
+        for attribute, value in zip(ATTRIBUTES, (series, color, capacity)):
+            if value is None:
+                continue
+            matched = self._by_attribute[attribute].get(value, frozenset())
+            keys = matched if keys is None else keys & matched
+        candidates = self.by_region.get(region, []) if region is not None else self.skus
+        return [sku for sku in candidates if keys is None or sku.key in keys]
+
+    def region_list(self):
+        """启用的地区列表，供页面展示"""
+        return [{"code": code, "name": self.regions[code].name} for code in self.enabled_regions]
+
+
+def round_robin(groups):
+    """轮流从各组中取出一项，直到所有组取完"""
+    queues = [list(group) for group in groups if group]
+    result = []
+    index = 0
+    while queues:
+        result.append(queues[index].pop(0))
+        if queues[index]:
+            index += 1
+        else:
+            queues.pop(index)
+        if queues:
+            index %= len(queues)
+    return result
+
+
+if __name__ == "__main__":
+    import os
+
+    registry = SkuRegistry.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"),
+                                regions=["hk", "mo", "cn"])
+    print(f"地区: {registry.enabled_regions}，型号数: {len(registry.skus)}")
+    for code in registry.enabled_regions:
+        print(f"{code}: {registry.endpoint(code, batch=True)}")
+    print("2TB 宇宙橙:", [sku.key for sku in registry.find(color="宇宙橙", capacity="2TB")])
+    print("轮询顺序:", round_robin([["hk1", "hk2", "hk3"], ["mo1"], ["cn1", "cn2"]]))
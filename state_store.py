@@ -0,0 +1,198 @@
+"""
+库存状态容器
+写入方复制当前状态、修改副本后以一次引用赋值发布新的不可变快照（写时复制），
+读取方直接拿到当前快照的引用，无需加锁即可看到一致的状态。
+另提供 single-flight 守卫，把同一型号的并发查询合并为一次上游请求
+"""
+
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+_EMPTY = MappingProxyType({})
+
+# 不可变快照；门店库存列表在发布后不会再被修改
+StockSnapshot = namedtuple("StockSnapshot", ["version", "stock", "last_updated", "checking", "model_versions"])
+
+
+class StateStore:
+    """
+    写时复制的库存状态容器
+    读取: snapshot() 返回当前快照，不加锁
+    写入: 写入方之间用一把锁串行化，读取方不受影响
+    """
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        self._snapshot = StockSnapshot(0, _EMPTY, _EMPTY, _EMPTY, _EMPTY)
+
+    def snapshot(self):
+        """获取当前快照（引用读取是原子的）"""
+        return self._snapshot
+
+    def _swap_locked(self, models, stock=None, last_updated=None, checking=None):
+        current = self._snapshot
+        version = current.version + 1
+        model_versions = dict(current.model_versions)
+        for model in models:
+            model_versions[model] = version
+        self._snapshot = StockSnapshot(
+            version,
+            MappingProxyType(stock) if stock is not None else current.stock,
+            MappingProxyType(last_updated) if last_updated is not None else current.last_updated,
+            MappingProxyType(checking) if checking is not None else current.checking,
+            MappingProxyType(model_versions),
+        )
+        return self._snapshot
+
+    def set_checking(self, models, checking=True):
+        """标记若干型号的检查状态，返回新快照"""
+        with self._write_lock:
+            flags = dict(self._snapshot.checking)
+            for model in models:
+                flags[model] = checking
+            return self._swap_locked(models, checking=flags)
+
+    def publish(self, results, updated):
+        """
+        发布一批型号的查询结果并清除其检查状态，返回新快照
+
+        参数:
+            results: {型号: 门店库存列表 或 {"error": ...}}
+            updated: 更新时间文字
+        """
+        with self._write_lock:
+            current = self._snapshot
+            stock = dict(current.stock)
+            last_updated = dict(current.last_updated)
+            checking = dict(current.checking)
+            for model, result in results.items():
+                stock[model] = result
+                last_updated[model] = updated
+                checking[model] = False
+            return self._swap_locked(results, stock=stock, last_updated=last_updated, checking=checking)
+
+    def restore(self, entries):
+        """
+        恢复尚无数据的型号（用于启动预热），已有数据的型号保持不变
+
+        参数:
+            entries: {型号: (门店库存列表, 更新时间)}
+
+        返回:
+            实际恢复的型号列表
+        """
+        with self._write_lock:
+            current = self._snapshot
+            restored = [model for model in entries if model not in current.stock]
+            if not restored:
+                return []
+            stock = dict(current.stock)
+            last_updated = dict(current.last_updated)
+            for model in restored:
+                stock[model], last_updated[model] = entries[model]
+            self._swap_locked(restored, stock=stock, last_updated=last_updated)
+            return restored
+
+    def load(self, snapshot):
+        """
+        整体替换为给定快照，版本号沿用快照中的值
+        用于 Web 进程跟随查询进程写出的共享状态，各进程的版本号（ETag）因此保持一致
+        """
+        with self._write_lock:
+            self._snapshot = StockSnapshot(
+                snapshot.version,
+                MappingProxyType(dict(snapshot.stock)),
+                MappingProxyType(dict(snapshot.last_updated)),
+                MappingProxyType(dict(snapshot.checking)),
+                MappingProxyType(dict(snapshot.model_versions)),
+            )
+            return self._snapshot
+
+    def models_since(self, version):
+        """返回版本号大于 version 时发生过变化的型号"""
+        return [model for model, model_version in self._snapshot.model_versions.items() if model_version > version]
+
+
+class _Flight:
+    """一个进行中的操作；call() 发起的操作完成后保存结果或异常，交给等待者"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并同一键的并发操作
+    acquire 只返回当前没有在进行中的键；其余键已由别的调用方负责，调用方可选择等待。
+    call 把同一键上的并发调用合并为一次执行，所有调用方得到同一个结果或异常
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.merged = 0
+
+    def acquire(self, keys):
+        """尝试占用若干键，返回成功占用的键列表"""
+        acquired = []
+        with self._lock:
+            for key in keys:
+                if key in self._flights:
+                    self.merged += 1
+                    continue
+                self._flights[key] = _Flight()
+                acquired.append(key)
+        return acquired
+
+    def release(self, keys):
+        """释放键并唤醒等待者"""
+        with self._lock:
+            flights = [self._flights.pop(key) for key in keys if key in self._flights]
+        for flight in flights:
+            flight.done.set()
+
+    def wait(self, key, timeout=None):
+        """等待某个键上正在进行的操作完成，没有进行中的操作时立即返回 True"""
+        with self._lock:
+            flight = self._flights.get(key)
+        return flight.done.wait(timeout) if flight is not None else True
+
+    def call(self, key, function):
+        """
+        执行 function()；同一键已有调用在进行中时不再执行，等待其完成并返回同一个结果
+
+        异常:
+            执行中抛出的异常会原样抛给所有等待者
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.merged += 1
+        if leader:
+            try:
+                flight.result = function()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._flights)
+
+
+# 创建全局状态容器与 single-flight 守卫
+state_store = StateStore()
+model_flights = SingleFlight()
@@ -0,0 +1,448 @@
+// 型号目录与配置由页面内嵌的 JSON 提供；首屏库存快照同样内嵌在页面中，不必再请求 /api/stock
+const PAGE_DATA = JSON.parse(document.getElementById('page-data').textContent);
+const INITIAL_SNAPSHOT = JSON.parse(document.getElementById('initial-snapshot').textContent);
+
+// 修改Vue定界符，避免与Jinja2冲突
+new Vue({
+    el: '#app',
+    delimiters: ['${', '}$'],
+    data: {
+        stockData: {},
+        lastUpdated: {},
+        checkingStatus: {},
+        isLoading: true,
+        isRefreshing: false,
+        modelDetails: PAGE_DATA.modelDetails,
+        regions: PAGE_DATA.regions,
+        regionModelDetails: PAGE_DATA.regionModelDetails,
+        selectedRegion: PAGE_DATA.defaultRegion,
+        seriesCapacities: PAGE_DATA.seriesCapacities,
+        availableSeries: PAGE_DATA.seriesList,
+        availableColors: PAGE_DATA.colorsList,
+        availableCapacities: PAGE_DATA.capacitiesList,
+        selectedSeries: {},
+        selectedColors: {},
+        selectedCapacities: {},
+        config: PAGE_DATA.config,
+        configForm: {
+            refresh_interval: 10,
+            request_delay: 0.5,
+            rate_limit_tokens: 1,
+            batch_size: 5,
+            use_proxy: false,
+            proxy_list: []
+        },
+        proxyListText: '',
+        showConfigModal: false,
+        eventSource: null,
+    },
+    computed: {
+        filteredModelDetails() {
+            // 过滤出已选择的系列、颜色和容量
+            const filtered = {};
+            for (const series in this.modelDetails) {
+                if (this.selectedSeries[series]) {
+                    filtered[series] = {};
+                    for (const color in this.modelDetails[series]) {
+                        if (this.selectedColors[color]) {
+                            filtered[series][color] = {};
+                            for (const capacity in this.modelDetails[series][color]) {
+                                if (this.selectedCapacities[capacity]) {
+                                    filtered[series][color][capacity] = this.modelDetails[series][color][capacity];
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            return filtered;
+        }
+    },
+    methods: {
+        fetchStockData() {
+            // 不再设置isLoading标志，避免显示全局加载动画
+            axios.get('/api/stock')
+                .then(response => {
+                    this.stockData = response.data.stock;
+                    this.lastUpdated = response.data.lastUpdated;
+                    this.checkingStatus = response.data.checkingStatus || {};
+                })
+                .catch(error => {
+                    console.error('Error fetching stock data:', error);
+                });
+        },
+        connectStream(since) {
+            // since 为内嵌快照对应的推送序号，服务器只补发其后的变化；自动重连时浏览器改用 Last-Event-ID
+            const source = new EventSource(since === undefined ? '/api/stream' : '/api/stream?since=' + since);
+            this.eventSource = source;
+            source.addEventListener('snapshot', event => {
+                const data = JSON.parse(event.data);
+                this.stockData = data.stock;
+                this.lastUpdated = data.lastUpdated;
+                this.checkingStatus = data.checkingStatus || {};
+                this.isLoading = false;
+            });
+            source.addEventListener('checking', event => {
+                JSON.parse(event.data).models.forEach(model => {
+                    this.$set(this.checkingStatus, model, true);
+                });
+            });
+            source.addEventListener('update', event => {
+                this.applyUpdate(JSON.parse(event.data));
+            });
+            source.onerror = () => {
+                // 浏览器会自动重连；连接被彻底关闭时退回到定时轮询
+                if (source.readyState === EventSource.CLOSED) {
+                    this.eventSource = null;
+                    this.startPolling();
+                }
+            };
+        },
+        applyUpdate(update) {
+            // 应用单个型号的增量更新
+            const model = update.model;
+            this.$set(this.lastUpdated, model, update.lastUpdated);
+            this.$set(this.checkingStatus, model, false);
+            if (update.stock) {
+                this.$set(this.stockData, model, update.stock);
+                return;
+            }
+            const stores = this.stockData[model];
+            if (!Array.isArray(stores)) {
+                this.$set(this.stockData, model, update.changes);
+                return;
+            }
+            update.changes.forEach(change => {
+                const index = stores.findIndex(store => store.store === change.store);
+                if (index >= 0) {
+                    this.$set(stores, index, change);
+                } else {
+                    stores.push(change);
+                }
+            });
+        },
+        startPolling() {
+            // 不支持服务器推送时，定时获取完整数据 - 无动画
+            this.fetchStockData();
+            this.isLoading = false;
+            setInterval(() => {
+                if (!this.isRefreshing) {
+                    this.fetchStockData(); // 使用无动画的方法
+                }
+            }, 10000);
+        },
+        refreshStock() {
+            if (this.isRefreshing) return;
+
+            this.isRefreshing = true;
+            axios.post('/api/refresh')
+                .then(() => {
+                    // 等待几秒钟后获取新数据（推送模式下结果会自动到达）
+                    setTimeout(() => {
+                        if (!this.eventSource) {
+                            this.fetchStockData();
+                        }
+                        this.isRefreshing = false;
+                    }, 3000);
+                })
+                .catch(error => {
+                    console.error('Error refreshing stock:', error);
+                    this.isRefreshing = false;
+                });
+        },
+        refreshSingleModel(model) {
+            // 刷新单个型号
+            axios.post(`/api/refresh/${encodeURIComponent(model)}`)
+                .then(() => {
+                    // 立即更新该型号的检查状态
+                    this.$set(this.checkingStatus, model, true);
+                    // 2秒后获取新数据（推送模式下结果会自动到达）
+                    if (!this.eventSource) {
+                        setTimeout(() => {
+                            this.fetchStockData();
+                        }, 2000);
+                    }
+                })
+                .catch(error => {
+                    console.error('Error refreshing single model:', error);
+                });
+        },
+        getModelDisplayName(model) {
+            // 显示iPhone型号名称，不包括容量和颜色
+            return model.split('-')[0].trim().replace(/\s+\d+GB$/, '');
+        },
+        getModelCapacity(model) {
+            // 提取容量部分
+            const match = model.match(/\d+[GT]B/);
+            return match ? match[0] : '';
+        },
+        selectAllSeries() {
+            // 选择所有系列
+            this.availableSeries.forEach(series => {
+                this.$set(this.selectedSeries, series, true);
+            });
+            this.savePreferences();
+        },
+        unselectAllSeries() {
+            // 取消选择所有系列
+            this.availableSeries.forEach(series => {
+                this.$set(this.selectedSeries, series, false);
+            });
+            this.savePreferences();
+        },
+        selectAllColors() {
+            // 选择所有颜色
+            this.availableColors.forEach(color => {
+                this.$set(this.selectedColors, color, true);
+            });
+            this.savePreferences();
+        },
+        unselectAllColors() {
+            // 取消选择所有颜色
+            this.availableColors.forEach(color => {
+                this.$set(this.selectedColors, color, false);
+            });
+            this.savePreferences();
+        },
+        selectAllCapacities() {
+            // 选择所有容量
+            this.availableCapacities.forEach(capacity => {
+                this.$set(this.selectedCapacities, capacity, true);
+            });
+            this.savePreferences();
+        },
+        unselectAllCapacities() {
+            // 取消选择所有容量
+            this.availableCapacities.forEach(capacity => {
+                this.$set(this.selectedCapacities, capacity, false);
+            });
+            this.savePreferences();
+        },
+        selectRegion(region) {
+            // 切换显示的地区
+            if (!this.regionModelDetails[region]) {
+                return;
+            }
+            this.selectedRegion = region;
+            this.modelDetails = this.regionModelDetails[region];
+            this.savePreferences();
+        },
+        savePreferences() {
+            // 保存所有选择到localStorage
+            localStorage.setItem('selectedRegion', this.selectedRegion);
+            localStorage.setItem('selectedSeries', JSON.stringify(this.selectedSeries));
+            localStorage.setItem('selectedColors', JSON.stringify(this.selectedColors));
+            localStorage.setItem('selectedCapacities', JSON.stringify(this.selectedCapacities));
+            this.reportWatchedModels();
+        },
+        reportWatchedModels() {
+            // 只有用户收窄了筛选条件时才告诉后端关注的型号，默认全部显示不算关注；
+            // 页面在后台时不上报，避免一直打开的标签页让型号长期处于关注期
+            if (document.hidden) {
+                return;
+            }
+            const models = [];
+            let total = 0;
+            for (const series in this.modelDetails) {
+                for (const color in this.modelDetails[series]) {
+                    total += Object.keys(this.modelDetails[series][color]).length;
+                }
+            }
+            for (const series in this.filteredModelDetails) {
+                for (const color in this.filteredModelDetails[series]) {
+                    models.push(...Object.values(this.filteredModelDetails[series][color]));
+                }
+            }
+            if (models.length === 0 || models.length >= total) {
+                return;
+            }
+            axios.post('/api/watch', { models })
+                .catch(error => {
+                    console.error('Error reporting watched models:', error);
+                });
+        },
+        loadPreferences() {
+            // 加载地区选择
+            const savedRegion = localStorage.getItem('selectedRegion');
+            if (savedRegion && this.regionModelDetails[savedRegion]) {
+                this.selectedRegion = savedRegion;
+                this.modelDetails = this.regionModelDetails[savedRegion];
+            }
+
+            // 加载系列选择
+            this.loadSeriesSelection();
+
+            // 加载颜色选择
+            const savedColors = localStorage.getItem('selectedColors');
+            if (savedColors) {
+                try {
+                    const savedObj = JSON.parse(savedColors);
+                    this.availableColors.forEach(color => {
+                        if (typeof savedObj[color] === 'undefined') {
+                            this.$set(this.selectedColors, color, true);
+                        } else {
+                            this.$set(this.selectedColors, color, savedObj[color]);
+                        }
+                    });
+                } catch (e) {
+                    console.error('Error loading saved colors:', e);
+                    this.initDefaultColorSelection();
+                }
+            } else {
+                this.initDefaultColorSelection();
+            }
+
+            // 加载容量选择
+            const savedCapacities = localStorage.getItem('selectedCapacities');
+            if (savedCapacities) {
+                try {
+                    const savedObj = JSON.parse(savedCapacities);
+                    this.availableCapacities.forEach(capacity => {
+                        if (typeof savedObj[capacity] === 'undefined') {
+                            this.$set(this.selectedCapacities, capacity, true);
+                        } else {
+                            this.$set(this.selectedCapacities, capacity, savedObj[capacity]);
+                        }
+                    });
+                } catch (e) {
+                    console.error('Error loading saved capacities:', e);
+                    this.initDefaultCapacitySelection();
+                }
+            } else {
+                this.initDefaultCapacitySelection();
+            }
+        },
+        loadSeriesSelection() {
+            // 从localStorage加载系列选择
+            const saved = localStorage.getItem('selectedSeries');
+            if (saved) {
+                try {
+                    const savedObj = JSON.parse(saved);
+                    this.availableSeries.forEach(series => {
+                        if (typeof savedObj[series] === 'undefined') {
+                            this.$set(this.selectedSeries, series, true);
+                        } else {
+                            this.$set(this.selectedSeries, series, savedObj[series]);
+                        }
+                    });
+                } catch (e) {
+                    console.error('Error loading saved series selection:', e);
+                    this.initDefaultSeriesSelection();
+                }
+            } else {
+                this.initDefaultSeriesSelection();
+            }
+        },
+        initDefaultSeriesSelection() {
+            // 初始化系列默认全选
+            this.availableSeries.forEach(series => {
+                this.$set(this.selectedSeries, series, true);
+            });
+        },
+        initDefaultColorSelection() {
+            // 初始化颜色默认全选
+            this.availableColors.forEach(color => {
+                this.$set(this.selectedColors, color, true);
+            });
+        },
+        initDefaultCapacitySelection() {
+            // 初始化容量默认全选
+            this.availableCapacities.forEach(capacity => {
+                this.$set(this.selectedCapacities, capacity, true);
+            });
+        },
+        initConfigForm() {
+            // 从当前配置初始化表单
+            this.configForm.refresh_interval = this.config.refresh_interval;
+            this.configForm.request_delay = this.config.request_delay;
+            this.configForm.batch_size = this.config.batch_size;
+            this.configForm.rate_limit_tokens = this.config.rate_limit_tokens;
+            this.configForm.rate_limit_per_second = this.config.rate_limit_per_second;
+            this.configForm.use_proxy = this.config.use_proxy || false;
+            this.configForm.proxy_list = Array.isArray(this.config.proxy_list) ? [...this.config.proxy_list] : [];
+
+            // 将代理列表转换为文本格式
+            this.proxyListText = this.configForm.proxy_list.join('\n');
+        },
+        saveConfig() {
+            // 处理代理列表
+            if (this.configForm.use_proxy && this.proxyListText) {
+                // 将文本框内容按行拆分为代理列表
+                const lines = this.proxyListText.split('\n').filter(line => line.trim() !== '');
+                this.configForm.proxy_list = lines;
+            } else {
+                this.configForm.proxy_list = [];
+            }
+
+            // 保存配置到后端
+            axios.post('/api/config', this.configForm)
+                .then(response => {
+                    if (response.data && response.data.status === 'success') {
+                        // 更新本地配置
+                        this.config = response.data.config;
+                        // 关闭模态框
+                        const modalElement = document.getElementById('configModal');
+                        const modalInstance = bootstrap.Modal.getInstance(modalElement);
+                        if (modalInstance) {
+                            modalInstance.hide();
+                        }
+                        // 提示保存成功
+                        alert('设置已保存');
+                    } else {
+                        alert('保存失败: ' + JSON.stringify(response.data.error));
+                    }
+                })
+                .catch(error => {
+                    console.error('Error saving config:', error);
+                    alert('保存设置失败: ' + (error.response ? error.response.data.error : error.message));
+                });
+        }
+    },
+    created() {
+        // 加载用户之前的所有选择
+        this.loadPreferences();
+
+        // 初始化配置表单
+        this.initConfigForm();
+
+        // 登记关注的型号，并在关注期到期前续期
+        this.reportWatchedModels();
+        setInterval(() => {
+            this.reportWatchedModels();
+        }, 300000);
+
+        // 首屏直接使用页面内嵌的快照，不显示加载动画
+        this.stockData = INITIAL_SNAPSHOT.stock;
+        this.lastUpdated = INITIAL_SNAPSHOT.lastUpdated;
+        this.checkingStatus = INITIAL_SNAPSHOT.checkingStatus || {};
+        this.isLoading = false;
+        if (window.EventSource) {
+            // 服务器推送：从内嵌快照的序号开始，只收到之后的变化
+            this.connectStream(INITIAL_SNAPSHOT.seq);
+        } else {
+            this.startPolling();
+        }
+
+        // 初始化Bootstrap模态框
+        this.$nextTick(() => {
+            const modalElement = document.getElementById('configModal');
+            if (modalElement) {
+                // 确保DOM已加载完成
+                const modal = new bootstrap.Modal(modalElement);
+
+                // 模态框已通过HTML数据属性配置
+
+                // 监听模态框打开事件
+                modalElement.addEventListener('show.bs.modal', () => {
+                    this.initConfigForm();
+                    this.showConfigModal = true;
+                });
+
+                // 监听模态框关闭事件
+                modalElement.addEventListener('hidden.bs.modal', () => {
+                    this.showConfigModal = false;
+                });
+            }
+        });
+    }
+});
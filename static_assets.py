@@ -0,0 +1,111 @@
+"""
+静态资源
+启动时读取 static/ 下的文件，按内容哈希生成带指纹的地址（如 js/app.3f2a9c1e.js），
+并预先生成 gzip 与 brotli（安装了 brotli 包时）压缩版本。
+带指纹的地址内容不会变化，可长期缓存；文件修改后地址随之变化，页面引用新地址
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+# 小于该长度的文件不压缩
+COMPRESS_MIN_SIZE = 512
+
+# 一个静态文件：原始内容、gzip / brotli 压缩内容（不压缩时为 None）、内容类型与内容哈希
+Asset = namedtuple("Asset", ["body", "gzip_body", "brotli_body", "content_type", "digest"])
+
+
+class StaticAssets:
+    """
+    带内容指纹与预压缩版本的静态文件
+
+    参数:
+        root: 静态文件目录
+        prefix: 对外的地址前缀
+        digest_length: 文件名中内容哈希的长度
+    """
+    def __init__(self, root, prefix="/assets/", digest_length=10):
+        self.root = root
+        self.prefix = prefix
+        self.digest_length = digest_length
+        # 逻辑名称（如 js/app.js） -> 带指纹的名称（如 js/app.3f2a9c1e.js）
+        self._names = {}
+        # 带指纹的名称与逻辑名称 -> Asset
+        self._assets = {}
+        self.load()
+
+    def load(self):
+        """重新扫描静态文件目录，生成指纹与压缩版本"""
+        names, assets = {}, {}
+        for directory, _, files in os.walk(self.root):
+            for filename in sorted(files):
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                asset = self._build(name, body)
+                stem, extension = os.path.splitext(name)
+                fingerprinted = f"{stem}.{asset.digest}{extension}"
+                names[name] = fingerprinted
+                assets[name] = assets[fingerprinted] = asset
+        self._names, self._assets = names, assets
+
+    def _build(self, name, body):
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        compress = len(body) >= COMPRESS_MIN_SIZE
+        return Asset(
+            body,
+            # mtime=0 让同一内容每次生成相同的压缩结果
+            gzip.compress(body, 9, mtime=0) if compress else None,
+            brotli.compress(body, quality=11) if compress and brotli is not None else None,
+            content_type,
+            hashlib.sha256(body).hexdigest()[:self.digest_length],
+        )
+
+    def url(self, name):
+        """静态文件的带指纹地址，未知文件返回不带指纹的地址"""
+        return self.prefix + self._names.get(name, name)
+
+    def get(self, name):
+        """
+        按地址中的名称查找文件
+
+        返回:
+            (Asset, 是否为带指纹的名称)，找不到时返回 (None, False)
+        """
+        asset = self._assets.get(name)
+        if asset is None:
+            return None, False
+        return asset, name not in self._names
+
+    def get_stats(self):
+        return {
+            name: {
+                "url": self.url(name),
+                "size": len(asset.body),
+                "gzip": len(asset.gzip_body) if asset.gzip_body is not None else None,
+                "brotli": len(asset.brotli_body) if asset.brotli_body is not None else None,
+            }
+            for name, asset in ((name, self._assets[name]) for name in self._names)
+        }
+
+
+# 创建全局静态资源实例
+static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+
+
+if __name__ == "__main__":
+    import json
+
+    print("brotli:", "已安装" if brotli is not None else "未安装，只生成 gzip 版本")
+    print(json.dumps(static_assets.get_stats(), ensure_ascii=False, indent=2))
@@ -0,0 +1,158 @@
+"""
+有货索引
+在每次发布查询结果后按型号增量更新两张倒排表：
+- 门店 -> 有货型号及状态文字
+- 型号 -> 有货门店（按接口返回的顺序，即离查询位置由近到远）
+按门店、按属性筛选或查找某型号第一家有货门店时只读取索引，不扫描完整库存
+"""
+
+import threading
+
+
+class StockIndex:
+    """
+    按门店与按型号的有货倒排索引
+
+    读取返回的都是副本，写入方之间与读写之间用一把锁串行化
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 门店 -> {型号: 状态文字}，只含有货的型号
+        self._by_store = {}
+        # 型号 -> [(门店, 状态文字)]，只含有货的门店
+        self._by_model = {}
+        # 出现过的全部门店（含当前无货的门店），按首次出现的顺序
+        self._stores = {}
+        # 型号 -> 已索引数据的型号版本号，多个发布方乱序更新时不会用旧数据覆盖新数据
+        self._model_versions = {}
+        self.version = 0
+
+    def update(self, snapshot, models=None):
+        """
+        按快照更新若干型号的索引
+
+        参数:
+            snapshot: StockSnapshot
+            models: 需要更新的型号，None 表示按快照整体重建
+        """
+        with self._lock:
+            if models is None:
+                self._by_store = {}
+                self._by_model = {}
+                self._model_versions = {}
+                self.version = 0
+                models = snapshot.stock
+            for model in models:
+                model_version = snapshot.model_versions.get(model, 0)
+                if model_version and model_version <= self._model_versions.get(model, 0):
+                    continue
+                self._model_versions[model] = model_version
+                self._update_model_locked(model, snapshot.stock.get(model))
+            self.version = max(self.version, snapshot.version)
+
+    def _update_model_locked(self, model, result):
+        for store, _ in self._by_model.pop(model, ()):
+            models = self._by_store.get(store)
+            if models is not None:
+                models.pop(model, None)
+        if not isinstance(result, list):
+            # 查询失败或没有数据时不认为有货
+            return
+        available = []
+        for entry in result:
+            store = entry.get("store")
+            self._stores.setdefault(store, None)
+            if entry.get("available"):
+                available.append((store, entry.get("status")))
+                self._by_store.setdefault(store, {})[model] = entry.get("status")
+        if available:
+            self._by_model[model] = available
+
+    def stores(self):
+        """全部已知门店及各自的有货型号数"""
+        with self._lock:
+            return {store: len(self._by_store.get(store, ())) for store in self._stores}
+
+    def has_store(self, store):
+        return store in self._stores
+
+    def store_available(self, store):
+        """某门店当前有货的型号 {型号: 状态文字}"""
+        with self._lock:
+            return dict(self._by_store.get(store, {}))
+
+    def model_available(self, model):
+        """某型号当前有货的门店 [(门店, 状态文字)]，按接口返回的顺序"""
+        with self._lock:
+            return list(self._by_model.get(model, ()))
+
+    def first_available(self, model, stores=None):
+        """
+        某型号第一家有货的门店
+
+        参数:
+            model: 型号名称
+            stores: 门店的优先顺序，None 表示按接口返回的顺序
+
+        返回:
+            (门店, 状态文字)，没有有货门店时返回 None
+        """
+        with self._lock:
+            available = self._by_model.get(model)
+            if not available:
+                return None
+            if stores is None:
+                return available[0]
+            statuses = dict(available)
+            for store in stores:
+                if store in statuses:
+                    return store, statuses[store]
+            return None
+
+    def available_models(self, models=None):
+        """
+        有货的型号及其有货门店
+
+        参数:
+            models: 候选型号集合，None 表示全部型号
+
+        返回:
+            {型号: [(门店, 状态文字)]}
+        """
+        with self._lock:
+            if models is None:
+                return {model: list(stores) for model, stores in self._by_model.items()}
+            # 从较小的一边遍历
+            if len(models) < len(self._by_model):
+                return {model: list(self._by_model[model]) for model in models if model in self._by_model}
+            return {model: list(stores) for model, stores in self._by_model.items() if model in models}
+
+
+# 创建全局有货索引实例
+stock_index = StockIndex()
+
+
+if __name__ == "__main__":
+    from state_store import StateStore
+
+    store = StateStore()
+    index = StockIndex()
+    snapshot = store.publish({
+        "iPhone 17 Pro 256GB - 宇宙橙": [
+            {"store": "Apple Central", "status": "今天可取货", "available": True},
+            {"store": "Apple ifc mall", "status": "暂无供应", "available": False},
+        ],
+        "iPhone 17 Pro 512GB - 宇宙橙": [
+            {"store": "Apple Central", "status": "暂无供应", "available": False},
+            {"store": "Apple ifc mall", "status": "明天可取货", "available": True},
+        ],
+    }, "2025-09-19 08:00:00")
+    index.update(snapshot)
+    print("门店:", index.stores())
+    print("Apple Central 有货:", index.store_available("Apple Central"))
+
+    snapshot = store.publish({"iPhone 17 Pro 256GB - 宇宙橙": {"error": "超时"}}, "2025-09-19 08:01:00")
+    index.update(snapshot, ["iPhone 17 Pro 256GB - 宇宙橙"])
+    print("查询失败后 Apple Central 有货:", index.store_available("Apple Central"))
+    print("512GB 第一家有货门店:", index.first_available("iPhone 17 Pro 512GB - 宇宙橙"))
+    print("版本:", index.version)
@@ -0,0 +1,322 @@
+"""
+内存映射的库存矩阵文件
+查询进程把当前库存（型号 × 门店 × 状态编号，以及各型号的更新时间）写入固定布局的文件，
+其他进程（命令行工具、其他服务、额外的 Web 进程）用 mmap 直接读取，不经过 HTTP 与 JSON，
+读取方数量不影响查询进程。
+
+一致性采用 seqlock：写入方在修改前把序号加一（变为奇数），修改完成后再加一（变为偶数）；
+读取方在复制前后各读一次序号，两次相同且为偶数时复制的内容就是某个完整版本，否则重试。
+只允许一个写入方；在 x86 等保证写入顺序的平台上，跨进程读取不需要额外的内存屏障。
+
+文件布局（小端）:
+    头部 64 字节   魔数、布局版本、标志、序号、状态版本号、发布时间、三类容量与三类数量
+    型号名称       model_capacity 个 96 字节槽位（UTF-8，按 MODEL_DETAILS 的目录顺序）
+    门店名称       store_capacity 个 96 字节槽位，按首次出现顺序编号
+    状态表         status_capacity 个 64 字节槽位：1 字节是否有货 + 63 字节状态文字；编号 0 表示没有数据
+    型号行         每个型号 16 字节（更新时间 f64、标志 u8、填充）+ store_capacity 字节的门店状态编号
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+from structured_log import get_logger
+
+log = get_logger("stock_matrix")
+
+MAGIC = b"STKM"
+LAYOUT_VERSION = 1
+HEADER = struct.Struct("<4sHHQQdHHHHHH")
+HEADER_SIZE = 64
+SEQ_OFFSET = 8
+NAME_SIZE = 96
+STATUS_SIZE = 64
+ROW_HEADER = struct.Struct("<dB7x")
+
+# 头部标志：文件已被新布局的文件替换，读取方应重新打开
+FLAG_STALE = 1
+# 型号行标志
+ROW_CHECKING = 1
+ROW_ERROR = 2
+
+
+def _layout(model_capacity, store_capacity, status_capacity):
+    """返回 (门店名称偏移, 状态表偏移, 型号行偏移, 行大小, 文件大小)"""
+    stores_offset = HEADER_SIZE + model_capacity * NAME_SIZE
+    statuses_offset = stores_offset + store_capacity * NAME_SIZE
+    rows_offset = statuses_offset + status_capacity * STATUS_SIZE
+    row_size = ROW_HEADER.size + store_capacity
+    return stores_offset, statuses_offset, rows_offset, row_size, rows_offset + model_capacity * row_size
+
+
+def _encode_name(value, size):
+    data = value.encode("utf-8")[:size]
+    return data + b"\0" * (size - len(data))
+
+
+def _decode_name(data):
+    return bytes(data).split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def _parse_updated(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class StockMatrixWriter:
+    """
+    库存矩阵的写入方（只能有一个）
+
+    参数:
+        path: 文件路径
+        models: 型号名称列表，顺序即文件中的行顺序
+        store_capacity: 最多记录的门店数
+        status_capacity: 最多记录的状态文字数（不超过 255）
+    """
+    def __init__(self, path, models, store_capacity=256, status_capacity=255):
+        self.path = path
+        self.models = list(models)
+        self.store_capacity = store_capacity
+        self.status_capacity = min(status_capacity, 255)
+        self._model_index = {model: index for index, model in enumerate(self.models)}
+        self._stores = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._version = -1
+        self._overflow_logged = False
+        (self._stores_offset, self._statuses_offset, self._rows_offset,
+         self._row_size, self.size) = _layout(len(self.models), store_capacity, self.status_capacity)
+        self._mm = self._open()
+        self.publishes = 0
+
+    def _open(self):
+        """创建新文件并原子替换旧文件；旧文件若仍被读取方映射，先标记为已失效"""
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.truncate(self.size)
+        with open(temp_path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), self.size)
+        mm[:HEADER_SIZE] = HEADER.pack(MAGIC, LAYOUT_VERSION, 0, 0, 0, 0.0, len(self.models), self.store_capacity,
+                                      self.status_capacity, len(self.models), 0, 0).ljust(HEADER_SIZE, b"\0")
+        for index, model in enumerate(self.models):
+            offset = HEADER_SIZE + index * NAME_SIZE
+            mm[offset:offset + NAME_SIZE] = _encode_name(model, NAME_SIZE)
+        self._mark_stale(self.path)
+        os.replace(temp_path, self.path)
+        return mm
+
+    @staticmethod
+    def _mark_stale(path):
+        try:
+            with open(path, "r+b") as f:
+                if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+                    return
+                with mmap.mmap(f.fileno(), HEADER_SIZE) as old:
+                    if old[:4] != MAGIC:
+                        return
+                    seq = struct.unpack_from("<Q", old, SEQ_OFFSET)[0]
+                    struct.pack_into("<Q", old, SEQ_OFFSET, seq + 1)
+                    flags = struct.unpack_from("<H", old, 6)[0]
+                    struct.pack_into("<H", old, 6, flags | FLAG_STALE)
+                    struct.pack_into("<Q", old, SEQ_OFFSET, seq + 2)
+        except FileNotFoundError:
+            pass
+
+    def _intern_locked(self, table, value, capacity, offset, size, encode, first=0):
+        """返回 (编号, 需要写入的 (偏移, 槽位内容) 或 None)；容量不足时编号为 None"""
+        index = table.get(value)
+        if index is not None:
+            return index, None
+        slot = len(table)
+        if slot >= capacity:
+            if not self._overflow_logged:
+                log.warning("库存矩阵容量不足，超出的门店或状态不会写入", path=self.path)
+                self._overflow_logged = True
+            return None, None
+        index = table[value] = slot + first
+        return index, (offset + slot * size, encode(value))
+
+    def _encode_row_locked(self, stock, checking, updated, pending):
+        flags = ROW_CHECKING if checking else 0
+        codes = bytearray(self.store_capacity)
+        if isinstance(stock, list):
+            for record in stock:
+                store_index, store_slot = self._intern_locked(
+                    self._stores, record["store"], self.store_capacity, self._stores_offset, NAME_SIZE,
+                    lambda name: _encode_name(name, NAME_SIZE))
+                status_key = (record["status"], bool(record["available"]))
+                status_index, status_slot = self._intern_locked(
+                    self._statuses, status_key, self.status_capacity, self._statuses_offset, STATUS_SIZE,
+                    lambda key: bytes([key[1]]) + _encode_name(key[0], STATUS_SIZE - 1), first=1)
+                pending.extend(slot for slot in (store_slot, status_slot) if slot is not None)
+                if store_index is not None and status_index is not None:
+                    codes[store_index] = status_index
+        elif stock is not None:
+            flags |= ROW_ERROR
+        return ROW_HEADER.pack(_parse_updated(updated), flags) + bytes(codes)
+
+    def publish(self, snapshot):
+        """
+        把 state_store 快照中自上次发布以来变化过的型号写入文件
+
+        参数:
+            snapshot: StockSnapshot
+        """
+        with self._lock:
+            if snapshot.version <= self._version:
+                return False
+            changed = [model for model, version in snapshot.model_versions.items()
+                       if version > self._version and model in self._model_index]
+            slots = []
+            rows = [(self._rows_offset + self._model_index[model] * self._row_size,
+                     self._encode_row_locked(snapshot.stock.get(model), snapshot.checking.get(model),
+                                             snapshot.last_updated.get(model), slots))
+                    for model in changed]
+
+            mm = self._mm
+            seq = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+            struct.pack_into("<Q", mm, SEQ_OFFSET, seq + 1)
+            # 先写新出现的门店与状态，再写引用它们的型号行
+            for offset, data in slots + rows:
+                mm[offset:offset + len(data)] = data
+            struct.pack_into("<Qd", mm, 16, snapshot.version, time.time())
+            struct.pack_into("<HH", mm, 40, len(self._stores), len(self._statuses))
+            struct.pack_into("<Q", mm, SEQ_OFFSET, seq + 2)
+
+            self._version = snapshot.version
+            self.publishes += 1
+            return True
+
+    def close(self):
+        self._mm.close()
+
+
+class StockMatrixReader:
+    """
+    库存矩阵的读取方，可在任意进程中使用
+
+    参数:
+        path: 文件路径
+        max_spins: 遇到写入进行中时的最大重试次数
+    """
+    def __init__(self, path, max_spins=10000):
+        self.path = path
+        self.max_spins = max_spins
+        self._mm = None
+        self._layout = None
+        self._names = None
+        self.retries = 0
+        self._open()
+
+    def _open(self):
+        if self._mm is not None:
+            self._mm.close()
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout_version = struct.unpack_from("<4sH", self._mm, 0)
+        if magic != MAGIC or layout_version != LAYOUT_VERSION:
+            raise ValueError(f"不是库存矩阵文件或布局版本不兼容: {self.path}")
+        model_capacity, store_capacity, status_capacity = struct.unpack_from("<HHH", self._mm, 32)
+        self._layout = (model_capacity, store_capacity, status_capacity) + _layout(
+            model_capacity, store_capacity, status_capacity)
+        self._names = None
+        # 门店与状态表只会追加，已解码的部分跨读取复用
+        self._stores = []
+        self._statuses = [None]
+
+    def read_bytes(self):
+        """复制一份一致的文件内容"""
+        mm = self._mm
+        for spin in range(self.max_spins):
+            before = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+            if before & 1:
+                self.retries += 1
+                if spin > 100:
+                    time.sleep(0)
+                continue
+            data = mm[:]
+            if struct.unpack_from("<Q", mm, SEQ_OFFSET)[0] == before:
+                if struct.unpack_from("<H", data, 6)[0] & FLAG_STALE:
+                    # 写入方已换用新文件
+                    self._open()
+                    return self.read_bytes()
+                return data
+            self.retries += 1
+        raise TimeoutError("库存矩阵持续处于写入状态")
+
+    def _model_names(self, data):
+        if self._names is None:
+            model_capacity = self._layout[0]
+            self._names = [_decode_name(data[HEADER_SIZE + index * NAME_SIZE:HEADER_SIZE + (index + 1) * NAME_SIZE])
+                           for index in range(model_capacity)]
+        return self._names
+
+    def read(self):
+        """
+        读取并解码完整状态
+
+        返回:
+            {"version", "published_at", "models": {型号: {"last_updated", "checking", "error",
+                                                        "stores": {门店: (状态文字, 是否有货)}}}}
+        """
+        data = self.read_bytes()
+        (_, _, _, _, version, published_at, _, _, _, model_count, store_count,
+         status_count) = HEADER.unpack_from(data, 0)
+        (_, _, _, stores_offset, statuses_offset, rows_offset, row_size, _) = self._layout
+        stores, statuses = self._stores, self._statuses
+        for index in range(len(stores), store_count):
+            stores.append(_decode_name(data[stores_offset + index * NAME_SIZE:stores_offset + (index + 1) * NAME_SIZE]))
+        for index in range(len(statuses) - 1, status_count):
+            offset = statuses_offset + index * STATUS_SIZE
+            statuses.append((_decode_name(data[offset + 1:offset + STATUS_SIZE]), bool(data[offset])))
+        models = {}
+        for index, name in enumerate(self._model_names(data)[:model_count]):
+            offset = rows_offset + index * row_size
+            updated, flags = ROW_HEADER.unpack_from(data, offset)
+            codes = data[offset + ROW_HEADER.size:offset + ROW_HEADER.size + store_count]
+            models[name] = {
+                "last_updated": updated or None,
+                "checking": bool(flags & ROW_CHECKING),
+                "error": bool(flags & ROW_ERROR),
+                "stores": {stores[store]: statuses[code] for store, code in enumerate(codes) if code},
+            }
+        return {"version": version, "published_at": published_at, "models": models}
+
+    def available(self):
+        """当前有货的 {型号: [门店, ...]}"""
+        return {model: [store for store, (_, available) in entry["stores"].items() if available]
+                for model, entry in self.read()["models"].items()
+                if any(available for _, available in entry["stores"].values())}
+
+    def close(self):
+        self._mm.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="读取库存矩阵文件")
+    parser.add_argument("path", nargs="?", default=os.environ.get("STOCK_MATRIX_PATH", "stock_matrix.bin"))
+    parser.add_argument("--all", action="store_true", help="输出所有型号的完整状态，默认只输出有货门店")
+    parser.add_argument("--bench", type=int, default=0, help="测量读取耗时的次数")
+    args = parser.parse_args()
+
+    reader = StockMatrixReader(args.path)
+    if args.bench:
+        started = time.perf_counter()
+        for _ in range(args.bench):
+            reader.read_bytes()
+        copied = (time.perf_counter() - started) / args.bench
+        started = time.perf_counter()
+        for _ in range(args.bench):
+            reader.read()
+        decoded = (time.perf_counter() - started) / args.bench
+        print(f"一致复制 {copied * 1e6:.1f} µs，完整解码 {decoded * 1e6:.1f} µs，重试 {reader.retries} 次")
+    else:
+        print(json.dumps(reader.read() if args.all else reader.available(), ensure_ascii=False, indent=2))
@@ -0,0 +1,146 @@
+"""
+库存变化推送
+每条变化消息只序列化一次并放入共享的环形缓冲区，
+所有订阅者只持有一个序号游标，由同一个条件变量唤醒，
+因此推送开销与订阅者数量基本无关。
+subscribe() 是占用一个线程的生成器，只用于开发时的单进程服务；
+生产部署由 stream_server 在事件循环中按同样的序号游标推送，订阅者不占用处理线程
+"""
+
+import json
+import threading
+from collections import deque
+
+
+def format_sse(seq, event, data):
+    """按 Server-Sent Events 格式编码一条消息"""
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+
+
+class StockStream:
+    """
+    变化消息广播器
+
+    参数:
+        capacity: 保留的最近消息数，断线重连的客户端可以从中补发
+    """
+    def __init__(self, capacity=2000):
+        self._cond = threading.Condition()
+        self._messages = deque(maxlen=capacity)
+        self._seq = 0
+        self._listeners = []
+        self.subscribers = 0
+
+    @property
+    def latest_seq(self):
+        return self._seq
+
+    def publish(self, event, payload):
+        """发布一条消息，payload 在这里序列化一次，所有订阅者共用"""
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        with self._cond:
+            self._seq += 1
+            self._messages.append((self._seq, format_sse(self._seq, event, data)))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, callback):
+        """注册发布消息后调用的函数（在发布方线程中调用，须立即返回），如唤醒另一个线程中的事件循环"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            self._listeners.remove(callback)
+
+    def rebase(self, seq):
+        """
+        清空缓冲区并从 seq 开始编号
+        多个 Web 进程各自推送时使用不同的起点，客户端带着其他进程的 Last-Event-ID 重连时会收到完整快照
+        """
+        with self._cond:
+            self._messages.clear()
+            self._seq = seq
+
+    def _messages_since_locked(self, seq):
+        """返回序号大于 seq 的消息；缓冲区已丢弃所需消息，或序号不属于本进程时返回 None"""
+        if seq > self._seq or (self._messages and self._messages[0][0] > seq + 1):
+            return None
+        return [message for message_seq, message in self._messages if message_seq > seq]
+
+    def open(self, last_seq=None):
+        """
+        开始一个订阅，结束时调用 close()
+
+        参数:
+            last_seq: 客户端重连时携带的 Last-Event-ID
+
+        返回:
+            (需要补发的消息列表，无法补发、需要发送完整快照时为 None; 游标)
+        """
+        with self._cond:
+            self.subscribers += 1
+            backlog = self._messages_since_locked(last_seq) if last_seq is not None else None
+            return backlog, self._seq
+
+    def close(self):
+        """结束一个订阅"""
+        with self._cond:
+            self.subscribers -= 1
+
+    def poll(self, cursor, timeout=None):
+        """
+        取出游标之后的消息
+
+        参数:
+            cursor: 订阅者已收到的最新序号
+            timeout: 没有新消息时最多等待的秒数，None 表示不等待
+
+        返回:
+            (消息列表，所需消息已被淘汰时为 None; 新游标)
+        """
+        with self._cond:
+            if timeout is not None and self._seq == cursor:
+                self._cond.wait(timeout)
+            return self._messages_since_locked(cursor), self._seq
+
+    @staticmethod
+    def snapshot_message(snapshot_factory, cursor):
+        """完整快照消息，序号为取快照前的游标"""
+        snapshot = dict(snapshot_factory(), seq=cursor)
+        return format_sse(cursor, "snapshot", json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")))
+
+    def subscribe(self, snapshot_factory, last_seq=None, heartbeat=15.0):
+        """
+        生成一个订阅者的 SSE 输出流，迭代期间占用调用方线程
+
+        参数:
+            snapshot_factory: 返回当前完整状态的函数，用于首次连接或无法补发时
+            last_seq: 客户端重连时携带的 Last-Event-ID
+            heartbeat: 没有消息时发送心跳注释的间隔（秒），防止代理断开空闲连接
+        """
+        backlog, cursor = self.open(last_seq)
+        try:
+            if backlog is None:
+                # 先取序号再取快照：快照之后发布的消息都会再推送一次，重复应用是幂等的
+                yield self.snapshot_message(snapshot_factory, cursor)
+            else:
+                yield from backlog
+
+            while True:
+                messages, cursor = self.poll(cursor, heartbeat)
+                if messages is None:
+                    # 消费太慢，所需消息已被淘汰，重新发送完整快照
+                    yield self.snapshot_message(snapshot_factory, cursor)
+                elif messages:
+                    yield "".join(messages)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.close()
+
+
+# 创建全局推送实例
+stock_stream = StockStream()
@@ -0,0 +1,206 @@
+"""
+SSE 推送服务
+在后台线程中运行一个 asyncio 事件循环，直接在套接字上提供 /api/stream：
+每个订阅者只是一个协程加一个序号游标，不占用 WSGI 处理线程，
+打开再多的页面也不会挤占 /api/stock 等普通请求的处理线程。
+消息来自同一个 StockStream，发布时通过 call_soon_threadsafe 唤醒事件循环
+
+示例:
+    python stream_server.py --port 5002
+"""
+
+import asyncio
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from structured_log import get_logger
+
+log = get_logger("stream_server")
+
+# 请求头的长度上限与读取超时
+MAX_HEADER_BYTES = 8192
+HEADER_TIMEOUT = 10.0
+
+
+def _status_response(status, reason):
+    body = f"{reason}\n".encode("utf-8")
+    return (f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("ascii") + body
+
+
+class StreamServer:
+    """
+    基于 asyncio 的 SSE 推送服务
+
+    参数:
+        stream: StockStream 实例
+        snapshot_factory: 返回当前完整状态的函数，用于首次连接或无法补发时
+        host, port: 监听地址，port 为 0 时由系统分配
+        heartbeat: 没有消息时发送心跳注释的间隔（秒）
+        allow_origin: Access-Control-Allow-Origin 响应头，页面与推送服务不同源时浏览器需要它
+        reuse_port: 是否设置 SO_REUSEPORT，多个 Web 工作进程可监听同一端口分担连接
+    """
+    def __init__(self, stream, snapshot_factory, host="127.0.0.1", port=0, heartbeat=15.0, allow_origin="*",
+                 reuse_port=False):
+        self.stream = stream
+        self.snapshot_factory = snapshot_factory
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.allow_origin = allow_origin
+        self.reuse_port = reuse_port
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._wakeup = None
+        self._listener = None
+
+    def start(self):
+        """启动事件循环线程并开始监听，返回实际监听的端口"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._wakeup = asyncio.Event()
+            try:
+                self._server = self._loop.run_until_complete(asyncio.start_server(
+                    self._handle, self.host, self.port, limit=MAX_HEADER_BYTES, reuse_port=self.reuse_port or None))
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="stream-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        # 发布方线程只安排一次唤醒，推送在事件循环中完成
+        loop = self._loop
+        self._listener = lambda: loop.call_soon_threadsafe(self._notify)
+        self.stream.add_listener(self._listener)
+        log.info("推送服务已启动", host=self.host, port=self.port)
+        return self.port
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def _read_request(self, reader):
+        """读取请求头，返回 (方法, 路径, 查询参数, 请求头)；请求不完整时返回 None"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(parts[1])
+        return parts[0], url.path, parse_qs(url.query), headers
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, query, headers = request
+            if path != "/api/stream":
+                writer.write(_status_response(404, "Not Found"))
+                return
+            if method != "GET":
+                writer.write(_status_response(405, "Method Not Allowed"))
+                return
+            # 浏览器重连时带 Last-Event-ID；首次连接可用 since 参数指定页面内嵌快照的序号
+            last_event_id = headers.get("last-event-id") or (query.get("since") or [None])[0]
+            last_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+            response_headers = ("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                                "Cache-Control: no-cache\r\nX-Accel-Buffering: no\r\nConnection: close\r\n")
+            if self.allow_origin:
+                response_headers += f"Access-Control-Allow-Origin: {self.allow_origin}\r\n"
+            writer.write((response_headers + "\r\n").encode("ascii"))
+            await self._push(writer, last_seq)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _push(self, writer, last_seq):
+        """按序号游标推送消息，与 StockStream.subscribe() 的输出相同"""
+        backlog, cursor = self.stream.open(last_seq)
+        try:
+            if backlog is None:
+                # 先取序号再取快照：快照之后发布的消息都会再推送一次，重复应用是幂等的
+                writer.write(self.stream.snapshot_message(self.snapshot_factory, cursor).encode("utf-8"))
+            else:
+                writer.write("".join(backlog).encode("utf-8"))
+            await writer.drain()
+            while True:
+                # 先取唤醒事件再读消息，读完之后发布的消息一定会唤醒本协程
+                wakeup = self._wakeup
+                messages, cursor = self.stream.poll(cursor)
+                if messages is None:
+                    # 消费太慢，所需消息已被淘汰，重新发送完整快照
+                    writer.write(self.stream.snapshot_message(self.snapshot_factory, cursor).encode("utf-8"))
+                elif messages:
+                    writer.write("".join(messages).encode("utf-8"))
+                else:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.heartbeat)
+                        continue
+                    except asyncio.TimeoutError:
+                        writer.write(b": keep-alive\n\n")
+                await writer.drain()
+        finally:
+            self.stream.close()
+
+    def stop(self):
+        """停止监听并结束事件循环，已连接的订阅者被断开"""
+        if self._loop is None:
+            return
+        self.stream.remove_listener(self._listener)
+
+        async def shutdown():
+            self._server.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from stock_stream import StockStream
+
+    parser = argparse.ArgumentParser(description="SSE 推送服务演示")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5002)
+    args = parser.parse_args()
+
+    demo_stream = StockStream()
+    server = StreamServer(demo_stream, lambda: {"stock": {}}, args.host, args.port)
+    server.start()
+    print(f"curl -N http://{args.host}:{server.port}/api/stream")
+    counter = 0
+    while True:
+        time.sleep(2)
+        counter += 1
+        demo_stream.publish("update", {"model": "demo", "counter": counter})
@@ -0,0 +1,130 @@
+"""
+结构化日志
+在标准 logging 之上提供带字段的日志调用：log.info("消息", models=21, requests=1)。
+级别与格式由环境变量 STOCK_LOG_LEVEL（DEBUG/INFO/WARNING/ERROR/OFF）与
+STOCK_LOG_FORMAT（text/json）控制，也可以在运行时调用 configure_logging 修改；
+未达到级别的日志不会格式化字段，关闭后几乎没有开销
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+# 所有模块日志的根名称
+ROOT_LOGGER = "stock"
+
+# OFF 对应一个高于 CRITICAL 的级别
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "OFF": logging.CRITICAL + 10,
+}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    把日志记录格式化为一行
+
+    参数:
+        fmt: text 输出 "时间 级别 模块 消息 key=value ..."，json 每行一个 JSON 对象
+    """
+    def __init__(self, fmt="text"):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if self.fmt == "json":
+            entry = {
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{created} {record.levelname:<7} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """带字段的日志接口"""
+    def __init__(self, logger):
+        self._logger = logger
+
+    def _log(self, level, message, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, message, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message, exc_info=False, **fields):
+        self._log(logging.ERROR, message, fields, exc_info)
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(LEVELS[level])
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """
+    设置日志级别与输出格式
+
+    参数:
+        level: DEBUG/INFO/WARNING/ERROR/OFF，默认取环境变量 STOCK_LOG_LEVEL 或 INFO
+        fmt: text 或 json，默认取环境变量 STOCK_LOG_FORMAT 或 text
+        stream: 输出流，默认 stderr
+    """
+    level = (level or os.environ.get("STOCK_LOG_LEVEL") or "INFO").upper()
+    fmt = (fmt or os.environ.get("STOCK_LOG_FORMAT") or "text").lower()
+    if level not in LEVELS:
+        raise ValueError(f"未知的日志级别: {level}")
+    if fmt not in ("text", "json"):
+        raise ValueError(f"未知的日志格式: {fmt}")
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(LEVELS[level])
+    root.propagate = False
+    handler = root.handlers[0] if root.handlers else None
+    if handler is None or stream is not None:
+        if handler is not None:
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(stream or sys.stderr)
+        root.addHandler(handler)
+    handler.setFormatter(StructuredFormatter(fmt))
+    return level
+
+
+def get_logger(name):
+    """获取某个模块的日志接口，名称会挂在 stock 之下，如 stock.app"""
+    if not logging.getLogger(ROOT_LOGGER).handlers:
+        configure_logging()
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+if __name__ == "__main__":
+    log = get_logger("demo")
+    log.info("正在检查库存", models=21, requests=1, concurrency=5)
+    log.debug("不会输出")
+    configure_logging("DEBUG", "json")
+    log.debug("启动查询", index=1, total=3, label="hk 21 个型号")
+    configure_logging("OFF")
+    log.error("已关闭，不会输出")
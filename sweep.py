@@ -0,0 +1,252 @@
+"""
+查询轮次
+每一轮查询是一个 Sweep 对象：有编号、截止时间、进度计数与协作式取消。
+查询任务在每次发送或重试前检查 should_stop()，取消或超过截止时间后不再发出新请求；
+SweepManager 记录进行中与最近结束的轮次，默认不允许两轮查询重叠
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+
+# 轮次状态
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+
+
+class Sweep:
+    """
+    一轮查询
+
+    参数:
+        sweep_id: 轮次编号
+        engine: 检查引擎（thread / async）
+        models: 本轮要查询的型号名称列表
+        tasks: 本轮的请求任务数
+        deadline_seconds: 本轮的时限（秒），None 表示不限
+        reason: 发起原因，如 scheduled、manual
+    """
+    def __init__(self, sweep_id, engine, models, tasks, deadline_seconds=None, reason="scheduled"):
+        self.id = sweep_id
+        self.engine = engine
+        self.reason = reason
+        self.started_at = time.time()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+        self.finished_at = None
+        self.state = RUNNING
+        self.models_total = len(models)
+        self.tasks_total = tasks
+        self.tasks_done = 0
+        self.published = 0
+        self.errors = 0
+        self._pending = set(models)
+        self._lock = threading.Lock()
+        self._cancel_reason = None
+        self._cancel_callbacks = []
+        self._stopped = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def remaining(self, now=None):
+        """距截止时间的秒数，不限时返回 None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - (now or time.time())
+
+    def should_stop(self):
+        """是否应停止发出新请求：已取消，或已超过截止时间"""
+        if self._cancel_reason is not None:
+            return True
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.cancel(EXPIRED)
+            return True
+        return False
+
+    def sleep(self, seconds):
+        """
+        等待 seconds 秒，但不超过截止时间，取消时立即返回
+
+        返回:
+            等待结束后是否仍可发出请求
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(remaining, 0.0))
+        if seconds > 0:
+            self._stopped.wait(seconds)
+        return not self.should_stop()
+
+    def request_timeout(self, default):
+        """单个请求的超时：不超过到截止时间的剩余秒数"""
+        remaining = self.remaining()
+        return default if remaining is None else max(min(default, remaining), 0.1)
+
+    def cancel(self, reason=CANCELLED):
+        """请求取消本轮查询，已发出的请求完成后不再继续；重复调用无副作用"""
+        with self._lock:
+            if self._cancel_reason is not None or self.done:
+                return False
+            self._cancel_reason = reason
+            callbacks = list(self._cancel_callbacks)
+        self._stopped.set()
+        for callback in callbacks:
+            callback()
+        return True
+
+    def on_cancel(self, callback):
+        """注册取消时调用的函数（如取消异步引擎中的任务）"""
+        with self._lock:
+            if self._cancel_reason is None:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def record(self, results):
+        """记录已发布的结果 {型号: 门店库存列表 或 {"error": ...}}"""
+        with self._lock:
+            for model, result in results.items():
+                if model in self._pending:
+                    self._pending.discard(model)
+                    self.published += 1
+                    if not isinstance(result, list):
+                        self.errors += 1
+
+    def merge(self, models):
+        """这些型号已有别处的查询在进行中，结果由那次查询发布，不再计入本轮未完成的型号"""
+        with self._lock:
+            self._pending.difference_update(models)
+
+    def task_done(self):
+        with self._lock:
+            self.tasks_done += 1
+
+    def finish(self):
+        """
+        结束本轮查询
+
+        返回:
+            未能发布结果的型号列表（任务未启动或被取消）
+        """
+        with self._lock:
+            pending = list(self._pending)
+            self.finished_at = time.time()
+            if self._cancel_reason is not None:
+                self.state = self._cancel_reason
+            elif pending and self.deadline is not None and self.finished_at >= self.deadline:
+                self.state = EXPIRED
+            else:
+                self.state = COMPLETED
+        self._done.set()
+        return pending
+
+    def wait(self, timeout=None):
+        """等待本轮查询结束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "engine": self.engine,
+                "reason": self.reason,
+                "state": self.state,
+                "startedAt": self.started_at,
+                "deadline": self.deadline,
+                "finishedAt": self.finished_at,
+                "elapsed": round((self.finished_at or time.time()) - self.started_at, 3),
+                "models": self.models_total,
+                "published": self.published,
+                "errors": self.errors,
+                "tasks": self.tasks_total,
+                "tasksDone": self.tasks_done,
+            }
+
+
+class SweepManager:
+    """
+    查询轮次登记
+
+    参数:
+        history: 保留最近结束的轮次数
+    """
+    def __init__(self, history=20):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._running = {}
+        self._recent = deque(maxlen=history)
+        self.overlaps_refused = 0
+
+    def begin(self, engine, models, tasks, deadline_seconds=None, reason="scheduled", allow_overlap=False):
+        """
+        开始一轮查询
+
+        返回:
+            Sweep；已有未结束的轮次且不允许重叠时返回 None
+        """
+        with self._lock:
+            if self._running and not allow_overlap:
+                self.overlaps_refused += 1
+                return None
+            sweep = Sweep(next(self._ids), engine, models, tasks, deadline_seconds, reason)
+            self._running[sweep.id] = sweep
+            return sweep
+
+    def end(self, sweep):
+        """登记本轮已结束（在 sweep.finish() 之后调用）"""
+        with self._lock:
+            if self._running.pop(sweep.id, None) is not None:
+                self._recent.append(sweep)
+
+    def running(self):
+        """进行中的轮次"""
+        with self._lock:
+            return list(self._running.values())
+
+    def get(self, sweep_id):
+        with self._lock:
+            sweep = self._running.get(sweep_id)
+            if sweep is not None:
+                return sweep
+            return next((sweep for sweep in self._recent if sweep.id == sweep_id), None)
+
+    def cancel(self, sweep_id):
+        """取消进行中的轮次，返回是否找到该轮次"""
+        with self._lock:
+            sweep = self._running.get(sweep_id)
+        if sweep is None:
+            return False
+        sweep.cancel()
+        return True
+
+    def get_status(self):
+        with self._lock:
+            running = list(self._running.values())
+            recent = list(self._recent)
+        return {
+            "running": [sweep.to_dict() for sweep in running],
+            "recent": [sweep.to_dict() for sweep in reversed(recent)],
+            "overlapsRefused": self.overlaps_refused,
+        }
+
+
+# 创建全局查询轮次登记实例
+sweep_manager = SweepManager()
+
+
+if __name__ == "__main__":
+    manager = SweepManager()
+    sweep = manager.begin("thread", ["A", "B", "C"], 2, deadline_seconds=0.2)
+    print("重叠的轮次:", manager.begin("thread", ["D"], 1))
+    sweep.record({"A": [], "B": {"error": "超时"}})
+    time.sleep(0.25)
+    print("超过截止时间后停止:", sweep.should_stop())
+    print("未发布的型号:", sweep.finish())
+    manager.end(sweep)
+    print(manager.get_status())
@@ -0,0 +1,35 @@
+"""
+测试公共设置
+app 模块在导入时读取环境变量并创建全局实例，测试进程中只导入一次：
+先在后台线程启动模拟接口，再把 APPLE_API_BASE 指向它后导入 app
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("STOCK_HISTORY_ENABLED", "0")
+os.environ.setdefault("STOCK_LOG_LEVEL", "WARNING")
+
+from mock_apple_api import start_mock_server
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    """(server, api, base_url)：库存状态固定的模拟接口，测试可直接修改 api 的属性"""
+    server, api, base_url = start_mock_server(seed=1, sticky=True, available_ratio=0.3)
+    yield server, api, base_url
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def stock_app(mock_server):
+    """指向模拟接口的 app 模块，速率限制放宽到不影响测试耗时"""
+    os.environ["APPLE_API_BASE"] = mock_server[2]
+    import app
+    app.rate_limiter.configure(rate_per_second=1000.0, burst=100)
+    return app
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from async_checker import AsyncStockChecker, QueryJob
+from mock_apple_api import start_mock_proxies
+from proxy_manager import ProxyManager, HALF_OPEN
+from rate_limiter import RateLimiter
+
+
+class AlwaysHedge:
+    """固定阈值、不限对冲比例的对冲策略"""
+    def threshold(self):
+        return 0.1
+
+    def try_hedge(self):
+        return True
+
+
+@pytest.fixture
+def proxies(mock_server):
+    """(慢代理, 快代理)：慢代理处于半开状态，下一次选择时作为探测放行"""
+    servers = start_mock_proxies(mock_server[1], [2.0, 0.0])
+    slow, fast = (url for _, url in servers)
+    manager = ProxyManager(failure_threshold=1, open_seconds=0.0)
+    manager.set_proxies([slow, fast])
+    manager.enable()
+    manager.record_result(slow, error_kind="timeout")
+    yield manager, slow, fast
+    for server, _ in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def engine():
+    checker = AsyncStockChecker(timeout=5.0, http2=False)
+    yield checker
+    checker.close()
+
+
+def run_sweep(engine, base_url, manager, **options):
+    job = QueryJob(f"{base_url}/hk/shop/pickup-message-recommendations",
+                   {"product": "MG8H4ZA/A", "location": "Hong Kong"}, [("model", "MG8H4ZA/A")])
+    results = []
+    future = engine.submit_sweep(
+        [job], lambda job, data, error, final: results.append((data, error)),
+        headers_factory=lambda job: {}, rate_limiter=RateLimiter(1000.0, 100),
+        proxy_getter=manager.get_random_proxy,
+        cancel_reporter=lambda proxies: manager.release_probe(proxies["https"]),
+        batch_mode=False, **options)
+    future.result(timeout=10)
+    return results
+
+
+def test_cancelled_hedge_loser_releases_probe(engine, mock_server, proxies):
+    manager, slow, fast = proxies
+    results = run_sweep(engine, mock_server[2], manager, hedge_policy=AlwaysHedge(),
+                        hedge_proxy_getter=lambda exclude: manager.get_random_proxy(exclude=exclude))
+
+    assert results[0][1] is None
+    # 半开探测经慢代理发出，对冲请求经快代理先返回，探测被取消后代理仍可再次被选中探测
+    health = manager._health[slow]
+    assert health.state == HALF_OPEN and not health.probing
+    assert manager.get_random_proxy()["https"] == slow
+
+
+def test_sweep_deadline_releases_probe(engine, mock_server, proxies):
+    manager, slow, _ = proxies
+    started = time.time()
+    results = run_sweep(engine, mock_server[2], manager, deadline=time.time() + 0.3)
+
+    assert results == []
+    assert time.time() - started < 1.5
+    assert not manager._health[slow].probing
+    assert manager.get_random_proxy()["https"] == slow
+
+
+def test_cancel_sweep_completes_after_tasks_unwind(engine, mock_server, proxies):
+    manager, slow, _ = proxies
+    job = QueryJob(f"{mock_server[2]}/hk/shop/pickup-message-recommendations",
+                   {"product": "MG8H4ZA/A", "location": "Hong Kong"}, [("model", "MG8H4ZA/A")])
+    released = []
+
+    def release(proxies):
+        released.append(proxies["https"])
+        manager.release_probe(proxies["https"])
+
+    future = engine.submit_sweep([job], lambda *args: None, headers_factory=lambda job: {},
+                                 rate_limiter=RateLimiter(1000.0, 100), proxy_getter=manager.get_random_proxy,
+                                 cancel_reporter=release, batch_mode=False)
+    time.sleep(0.3)
+    engine.cancel_sweep(future)
+    # future 在请求处理完取消之后才完成，且不是以取消结束
+    assert future.result(timeout=2) is None
+    assert released == [slow]
+    assert not manager._health[slow].probing
@@ -0,0 +1,73 @@
+from urllib.parse import urlencode
+
+import pytest
+
+from retry_policy import RetryRule
+
+
+@pytest.fixture
+def fast_retries(stock_app, monkeypatch):
+    """缺失型号的重试几乎不等待"""
+    stock_app.retry_policy.reset()
+    monkeypatch.setitem(stock_app.retry_policy.rules, "missing_parts", RetryRule(True, 0.01, 0.01, False, False))
+
+
+def test_batches_cover_every_model_within_url_limit(stock_app):
+    items = list(stock_app.IPHONE_17_PRO_MAX_MODELS.items())
+    for limit in (300, 2000):
+        batches = stock_app.build_query_batches(items, max_url_length=limit)
+        assert sorted(model for batch in batches for model in batch) == sorted(items)
+        for batch in batches:
+            region = stock_app.registry.by_key[batch[0][0]].region
+            params = stock_app.build_batch_params([code for _, code in batch], region)
+            url = f"{stock_app.registry.endpoint(region, batch=True)}?{urlencode(params)}"
+            assert len(batch) == 1 or len(url) <= limit
+    assert len(stock_app.build_query_batches(items, max_url_length=2000)) < len(items)
+    assert len(stock_app.build_query_batches(items, max_url_length=300)) > \
+        len(stock_app.build_query_batches(items, max_url_length=2000))
+
+
+def test_one_request_fans_out_to_every_model(stock_app, mock_server):
+    _, api, _ = mock_server
+    items = list(stock_app.IPHONE_17_PRO_MAX_MODELS.items())[:5]
+    before = len(api.requested_parts)
+
+    results = stock_app.check_stock_for_models(items)
+
+    assert api.requested_parts[before:] == [[code for _, code in items]]
+    for model_name, _ in items:
+        assert [entry["store"] for entry in results[model_name]] == api.stores
+
+
+def test_missing_part_is_retried_alone_and_backfilled(stock_app, mock_server, fast_retries, monkeypatch):
+    _, api, _ = mock_server
+    items = list(stock_app.IPHONE_17_PRO_MAX_MODELS.items())[:4]
+    dropped = items[2][1]
+    build_payload = api.build_payload
+    calls = []
+
+    def drop_once(parts, nested=False):
+        # 只有第一次响应缺少该型号
+        calls.append(list(parts))
+        monkeypatch.setattr(api, "drop_parts", {dropped} if len(calls) == 1 else set())
+        return build_payload(parts, nested)
+
+    monkeypatch.setattr(api, "build_payload", drop_once)
+    results = stock_app.check_stock_for_models(items, batch_mode=True)
+
+    assert calls == [[code for _, code in items], [dropped]]
+    assert all(isinstance(results[model_name], list) for model_name, _ in items)
+
+
+def test_part_missing_from_every_response_is_reported_as_error(stock_app, mock_server, fast_retries, monkeypatch):
+    _, api, _ = mock_server
+    items = list(stock_app.IPHONE_17_PRO_MAX_MODELS.items())[:3]
+    dropped_name, dropped = items[0]
+    monkeypatch.setattr(api, "drop_parts", {dropped})
+    before = len(api.requested_parts)
+
+    results = stock_app.check_stock_for_models(items, batch_mode=True, max_retries=2)
+
+    assert api.requested_parts[before:] == [[code for _, code in items], [dropped], [dropped]]
+    assert "error" in results[dropped_name]
+    assert all(isinstance(results[model_name], list) for model_name, _ in items[1:])
@@ -0,0 +1,39 @@
+from change_tracker import ChangeTracker
+
+MODEL = "iPhone 17 Pro 256GB - 宇宙橙"
+
+
+def stores(status, available):
+    return [{"store": "Apple Central", "status": status, "available": available}]
+
+
+def test_availability_change_with_same_text_emits_event():
+    tracker = ChangeTracker()
+    assert len(tracker.apply(MODEL, stores("可预约", False))) == 1
+
+    events = tracker.apply(MODEL, stores("可预约", True))
+    assert [(event.old_status, event.new_status, event.available) for event in events] == [("可预约", "可预约", True)]
+    assert tracker.available_stores(MODEL) == ["Apple Central"]
+
+    # 状态与有货标记都不变时没有事件
+    assert tracker.apply(MODEL, stores("可预约", True)) == []
+
+
+def test_unchanged_status_emits_nothing():
+    tracker = ChangeTracker()
+    tracker.apply(MODEL, stores("暂无供应", False))
+    assert tracker.apply(MODEL, stores("暂无供应", False)) == []
+    events = tracker.apply(MODEL, stores("今天可取货", True))
+    assert [(event.old_status, event.available) for event in events] == [("暂无供应", True)]
+    assert tracker.latest_seq == 2
+
+
+def test_events_carry_previous_availability():
+    tracker = ChangeTracker()
+    # 型号首次出现，之前状态未知
+    assert [event.was_available for event in tracker.apply(MODEL, stores("今天可取货", True))] == [None]
+    assert [event.was_available for event in tracker.apply(MODEL, stores("明天可取货", True))] == [True]
+    assert [event.was_available for event in tracker.apply(MODEL, stores("暂无供应", False))] == [True]
+    # 已有数据的型号出现新门店，之前视为无货
+    events = tracker.apply(MODEL, [{"store": "Apple ifc mall", "status": "今天可取货", "available": True}])
+    assert [(event.old_status, event.was_available) for event in events] == [(None, False)]
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from sweep import Sweep
+
+URL = "https://www.apple.com/hk-zh/shop/retail/pickup-message-recommendations"
+
+
+class FakeResponse:
+    def __init__(self, proxies):
+        self.proxies = proxies
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def hedging(stock_app, monkeypatch):
+    """开启对冲、主请求超过 0.1 秒即对冲；send_request 被替换为阻塞到 release 之后才返回的假请求"""
+    monkeypatch.setitem(stock_app.CONFIG, "hedge_requests", True)
+    monkeypatch.setattr(stock_app.hedge_policy, "threshold", lambda: 0.1)
+    monkeypatch.setattr(stock_app.hedge_policy, "try_hedge", lambda: True)
+    monkeypatch.setattr(stock_app, "hedge_executor", None)
+    release = threading.Event()
+    calls = []
+
+    def send_request(url, params, headers, proxies, timeout=10):
+        calls.append(proxies)
+        release.wait(5)
+        return FakeResponse(proxies)
+
+    monkeypatch.setattr(stock_app, "send_request", send_request)
+    stock_app.retry_policy.reset()
+    yield release, calls
+    release.set()
+    stock_app.retry_policy.reset()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_batch_size_change_keeps_in_flight_hedges_working(stock_app, hedging, monkeypatch):
+    release, calls = hedging
+    monkeypatch.setitem(stock_app.CONFIG, "batch_size", 2)
+    client = stock_app.app.test_client()
+    outcomes = []
+
+    def request():
+        try:
+            outcomes.append(stock_app.send_hedged_request(URL, {}, {}, None))
+        except Exception as e:
+            outcomes.append(e)
+
+    def start(count):
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    threads = start(2)
+    wait_for(lambda: len(calls) >= 2)
+    executor = stock_app.hedge_executor
+    # 主请求已发出、对冲尚未发出时调大并发上限，再发起更多请求
+    assert client.post("/api/config", json={"batch_size": 20}).status_code == 200
+    threads += start(6)
+    # 每个请求都发出了主请求与对冲请求
+    wait_for(lambda: len(calls) == 16)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert stock_app.hedge_executor is executor
+    assert len(outcomes) == 8
+    assert all(isinstance(outcome, FakeResponse) for outcome in outcomes)
+
+
+def test_no_hedge_through_paused_identity(stock_app, hedging):
+    release, calls = hedging
+    # 暂停在主请求返回之前结束，等待暂停结束再对冲也会多发一个请求
+    stock_app.retry_policy.observe(stock_app.DIRECT, "http_429", retry_after=0.2)
+    threading.Timer(0.5, release.set).start()
+    response = stock_app.send_hedged_request(URL, {}, {}, None)
+    assert isinstance(response, FakeResponse)
+    assert calls == [None]
+
+
+def test_no_hedge_after_sweep_stops(stock_app, hedging):
+    release, calls = hedging
+    sweep = Sweep(1, "thread", ["A"], 1)
+    sweep.cancel()
+    threading.Timer(0.3, release.set).start()
+    response = stock_app.send_hedged_request(URL, {}, {}, None, sweep=sweep)
+    assert isinstance(response, FakeResponse)
+    # 对冲请求在速率限制等待之后发现轮次已停止，不再发送
+    assert calls == [None]
@@ -0,0 +1,26 @@
+from history_store import HistoryStore
+
+MODEL = "iPhone 17 Pro 256GB - 宇宙橙"
+STOCK = [{"store": "Apple Central", "status": "今天可取货", "available": True}]
+
+
+def test_failed_flush_does_not_cache_rolled_back_ids(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), record_all=True, flush_interval=0.05)
+    connection = store._connect()
+    # 时间戳为负的观测写入失败，整个批次（包括新插入的名称）回滚
+    connection.execute("CREATE TRIGGER fail BEFORE INSERT ON observations WHEN NEW.ts < 0 "
+                       "BEGIN SELECT RAISE(ABORT, 'forced failure'); END")
+    connection.commit()
+
+    store.record(MODEL, STOCK, "2026-10-17 10:00:00", timestamp=-1.0)
+    store.flush()
+    assert store.written == 0
+    assert connection.execute("SELECT COUNT(*) FROM models").fetchone()[0] == 0
+
+    store.record(MODEL, STOCK, "2026-10-17 10:00:03", timestamp=1000.0)
+    store.flush()
+    assert store.written == 1
+    assert store.timeline(MODEL, "Apple Central", 0, 2000) == [
+        {"ts": 1000.0, "status": "今天可取货", "available": True}]
+    assert store.load_latest() == {MODEL: (STOCK, "2026-10-17 10:00:03")}
+    connection.close()
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from change_tracker import ChangeEvent
+from mock_notify_servers import start_notify_servers
+from notifier import RestockNotifier, TelegramChannel, WebhookChannel
+
+MODEL = "iPhone 17 Pro 256GB - 宇宙橙"
+STORE = "Apple Central"
+
+
+@pytest.fixture
+def servers():
+    inbox, http_base, smtp, stop = start_notify_servers(fail_first=2)
+    yield inbox, http_base, smtp
+    stop()
+
+
+def restock(sequence, model=MODEL, store=STORE, timestamp=None):
+    return ChangeEvent(sequence, model, store, "暂无供应", "今天可取货", True, timestamp or time.time(), False)
+
+
+def test_delivers_to_every_channel_with_retries(servers):
+    inbox, http_base, (smtp_host, smtp_port) = servers
+    notifier = RestockNotifier(retry_backoff=0.05)
+    notifier.load_config({
+        "channels": {
+            "webhook": {"allowed_hosts": ["127.0.0.1"]},
+            "telegram": {"token": "TEST", "api_base": http_base},
+            "email": {"host": smtp_host, "port": smtp_port, "rate_per_second": 10, "burst": 10},
+        },
+        "subscriptions": [
+            {"channel": "webhook", "target": f"{http_base}/hook", "models": [MODEL]},
+            {"channel": "telegram", "target": "42", "stores": [STORE]},
+            {"channel": "email", "target": "me@example.com", "models": ["其他型号"]},
+        ],
+    })
+
+    assert notifier.notify([restock(1)]) == 2
+    assert notifier.flush(timeout=10)
+    # 前两个 HTTP 请求返回 503，重试后仍然送达
+    assert [hook["payload"]["model"] for hook in inbox.webhooks] == [MODEL]
+    assert [message["payload"]["chat_id"] for message in inbox.telegram] == ["42"]
+    assert inbox.emails == []
+    status = notifier.get_status()
+    assert (status["sent"], status["retried"], status["failed"]) == (2, 2, 0)
+
+    # 去抖窗口内再次有货不重复通知
+    assert notifier.notify([restock(2)]) == 0
+    assert notifier.get_status()["suppressed"] == 2
+
+
+def test_only_transitions_to_available_are_notified(monkeypatch):
+    notifier = RestockNotifier(debounce_seconds=0)
+    notifier.register_channel(WebhookChannel(allowed_hosts=["hooks.example.com"]))
+    notifier.subscribe("webhook", "https://hooks.example.com/restock")
+    sent = []
+    monkeypatch.setattr(notifier, "_enqueue", lambda notification, attempt: sent.append(notification.status) or True)
+
+    now = time.time()
+    events = [
+        # 有货状态之间的文字变化
+        ChangeEvent(1, MODEL, STORE, "今天可取货", "明天可取货", True, now, True),
+        # 型号首次出现，之前状态未知
+        ChangeEvent(2, MODEL, "Apple ifc mall", None, "今天可取货", True, now, None),
+        # 已有数据的型号出现新门店，视为从无货变为有货
+        ChangeEvent(3, MODEL, "Apple Canton Road", None, "今天可取货", True, now, False),
+        ChangeEvent(4, MODEL, STORE, "明天可取货", "暂无供应", False, now, True),
+        ChangeEvent(5, MODEL, STORE, "暂无供应", "今天可取货", True, now + 1, False),
+    ]
+    assert notifier.notify(events) == 2
+    assert sent == ["今天可取货", "今天可取货"]
+
+
+def test_expired_debounce_entries_are_removed(monkeypatch):
+    notifier = RestockNotifier(debounce_seconds=10)
+    notifier.register_channel(WebhookChannel(allowed_hosts=["hooks.example.com"]))
+    notifier.subscribe("webhook", "https://hooks.example.com/restock")
+    monkeypatch.setattr(notifier, "_enqueue", lambda notification, attempt: True)
+
+    now = time.time()
+    notifier.notify([restock(index, store=f"Apple Store {index}", timestamp=now) for index in range(100)])
+    assert len(notifier._last_sent) == 100
+    notifier.notify([restock(100, timestamp=now + 11)])
+    assert list(notifier._last_sent) == [(1, MODEL, STORE)]
+
+
+def test_rate_limited_channel_does_not_block_other_channels(servers):
+    inbox, http_base, (smtp_host, smtp_port) = servers
+    inbox.fail_first = 0
+    notifier = RestockNotifier()
+    notifier.register_channel(TelegramChannel("TEST", api_base=http_base, rate_per_second=0.5, burst=1))
+    notifier.load_config({"channels": {"email": {"host": smtp_host, "port": smtp_port,
+                                                 "rate_per_second": 100, "burst": 100}}})
+    for index in range(4):
+        notifier.subscribe("telegram", str(index))
+    notifier.subscribe("email", "me@example.com")
+
+    started = time.time()
+    notifier.notify([restock(1)])
+    assert inbox.wait_for(2, timeout=5)
+    # Telegram 每 2 秒只能发一条，邮件不排在它后面
+    assert len(inbox.emails) == 1
+    assert inbox.emails[0]["received_at"] - started < 1.0
+    assert len(inbox.telegram) == 1
+    assert notifier.get_status()["pending"] >= 2
+
+
+def test_webhook_channel_is_off_unless_configured():
+    notifier = RestockNotifier()
+    with pytest.raises(ValueError):
+        notifier.subscribe("webhook", "https://example.com/hook")
+
+
+@pytest.mark.parametrize("target", [
+    "http://127.0.0.1:8080/hook",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.1/hook",
+    "http://[::1]/hook",
+    "file:///etc/passwd",
+])
+def test_webhook_rejects_internal_targets(target):
+    notifier = RestockNotifier()
+    notifier.register_channel(WebhookChannel())
+    with pytest.raises(ValueError):
+        notifier.subscribe("webhook", target)
+    assert notifier.subscriptions() == []
+
+
+def test_webhook_allow_list():
+    channel = WebhookChannel(allowed_hosts=["hooks.example.com"])
+    channel.validate("https://hooks.example.com/restock")
+    with pytest.raises(ValueError):
+        channel.validate("https://other.example.com/restock")
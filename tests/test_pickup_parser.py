@@ -0,0 +1,90 @@
+import copy
+import json
+
+import pytest
+
+from mock_apple_api import MockAppleAPI
+from pickup_parser import DEFAULT_STATUS, UNKNOWN_STATUS, PickupParser, StoreRecord
+
+PRESENT = "MFYN4ZA/A"
+ABSENT = "MFYT4ZA/A"
+STORES = ["Apple Central", "Apple ifc mall"]
+
+
+def recorded_payload(nested=False):
+    api = MockAppleAPI(stores=STORES, seed=1, sticky=True)
+    api.set_availability(PRESENT, "Apple Central", True)
+    api.set_availability(PRESENT, "Apple ifc mall", False)
+    return api.build_payload([PRESENT], nested=nested)
+
+
+def without_quote(payload):
+    for store in payload["body"]["PickupMessage"]["stores"]:
+        del store["partsAvailability"][PRESENT]["pickupSearchQuote"]
+    return payload
+
+
+def without_parts(payload):
+    del payload["body"]["PickupMessage"]["stores"][1]["partsAvailability"]
+    return payload
+
+
+def empty_part(payload):
+    payload["body"]["PickupMessage"]["stores"][0]["partsAvailability"][PRESENT] = {}
+    return payload
+
+
+CASES = [
+    ("flat", recorded_payload(), [PRESENT],
+     {PRESENT: [("Apple Central", "今天可取货", True), ("Apple ifc mall", "暂无供应", False)]}, []),
+    ("nested", recorded_payload(nested=True), [PRESENT],
+     {PRESENT: [("Apple Central", "今天可取货", True), ("Apple ifc mall", "暂无供应", False)]}, []),
+    ("missing part", recorded_payload(), [PRESENT, ABSENT],
+     {PRESENT: [("Apple Central", "今天可取货", True), ("Apple ifc mall", "暂无供应", False)]}, [ABSENT]),
+    ("missing pickupSearchQuote", without_quote(recorded_payload()), [PRESENT],
+     {PRESENT: [("Apple Central", DEFAULT_STATUS, True), ("Apple ifc mall", DEFAULT_STATUS, False)]}, []),
+    ("missing partsAvailability", without_parts(recorded_payload()), [PRESENT],
+     {PRESENT: [("Apple Central", "今天可取货", True), ("Apple ifc mall", UNKNOWN_STATUS, False)]}, []),
+    ("empty part", empty_part(recorded_payload()), [PRESENT],
+     {PRESENT: [("Apple Central", UNKNOWN_STATUS, False), ("Apple ifc mall", "暂无供应", False)]}, []),
+    ("no stores", {"head": {"status": "200"}, "body": {"PickupMessage": {}}}, [PRESENT], {}, [PRESENT]),
+    ("no body", {"head": {"status": "200"}}, [PRESENT], {}, [PRESENT]),
+]
+
+
+@pytest.mark.parametrize("name, payload, codes, expected, missing", CASES, ids=[case[0] for case in CASES])
+def test_parse_recorded_payloads(name, payload, codes, expected, missing):
+    parser = PickupParser()
+    for data in (payload, json.dumps(payload, ensure_ascii=False).encode("utf-8")):
+        results, missing_codes = parser.parse(data, codes)
+        assert {code: [(record["store"], record["status"], record["available"]) for record in records]
+                for code, records in results.items()} == expected
+        assert missing_codes == missing
+
+
+def test_parse_single_marks_missing_part_unknown():
+    records = PickupParser().parse_single(recorded_payload(), ABSENT)
+    assert [(record["store"], record["status"], record["available"]) for record in records] == [
+        ("Apple Central", UNKNOWN_STATUS, False), ("Apple ifc mall", UNKNOWN_STATUS, False)]
+
+
+def test_records_are_interned_and_read_only():
+    parser = PickupParser()
+    first = parser.parse_single(recorded_payload(), PRESENT)
+    second = parser.parse_single(recorded_payload(), PRESENT)
+    assert all(a is b for a, b in zip(first, second))
+    assert parser.get_stats()["records_created"] == 2
+
+    record = first[0]
+    assert isinstance(record, StoreRecord)
+    for mutate in (lambda: record.__setitem__("available", False), lambda: record.__delitem__("status"),
+                   lambda: record.update(status="x"), lambda: record.pop("store"), record.clear,
+                   lambda: record.setdefault("extra", 1), record.popitem):
+        with pytest.raises(TypeError):
+            mutate()
+    assert record == {"store": "Apple Central", "status": "今天可取货", "available": True}
+
+    # 复制得到可以修改的普通字典
+    duplicate = copy.deepcopy(record)
+    duplicate["available"] = False
+    assert type(duplicate) is dict and record["available"] is True
@@ -0,0 +1,29 @@
+from poll_scheduler import PollScheduler
+
+
+def test_rewatch_does_not_reset_backoff():
+    scheduler = PollScheduler(base_interval=10.0, watch_seconds=600.0)
+    scheduler.register(["A"])
+    schedule = scheduler._models["A"]
+
+    assert scheduler.watch(["A"], now=1000.0) == ["A"]
+    schedule.backoff = 8.0
+    # 关注期内重复登记只延长关注期
+    assert scheduler.watch(["A"], now=1100.0) == ["A"]
+    assert schedule.backoff == 8.0
+    assert schedule.watched_until == 1700.0
+
+    # 关注期结束后重新关注才清零退避
+    assert scheduler.watch(["A"], now=2000.0) == ["A"]
+    assert schedule.backoff == 1.0
+
+
+def test_watch_is_capped():
+    scheduler = PollScheduler(max_watched=2)
+    scheduler.register(["A", "B", "C", "D"])
+
+    assert scheduler.watch(["A", "B", "C"], now=1000.0) == ["A", "B"]
+    # 已关注的型号仍可续期，新型号在名额释放前被忽略
+    assert scheduler.watch(["D", "A"], now=1001.0) == ["A"]
+    status = scheduler.get_status()["models"]
+    assert not status["C"]["watched"] and not status["D"]["watched"]
@@ -0,0 +1,40 @@
+from proxy_manager import ProxyManager, CLOSED
+
+PROXY = "http://proxy1.example.com:8080"
+
+
+def make_manager(**options):
+    manager = ProxyManager(**options)
+    manager.add_proxy(PROXY)
+    manager.enable()
+    return manager
+
+
+def test_timeout_penalty_is_capped():
+    manager = make_manager(failure_threshold=100, max_latency=10.0)
+    for _ in range(20):
+        manager.record_result(PROXY, error_kind="timeout")
+    assert manager.get_status()["health"][PROXY]["latency"] == 10.0
+
+    # 恢复后延迟按滑动平均回落，不会被之前的超时长期压低权重
+    for _ in range(30):
+        manager.record_result(PROXY, latency=0.1)
+    assert manager.get_status()["health"][PROXY]["latency"] < 0.15
+
+
+def test_request_specific_4xx_does_not_hurt_proxy_health():
+    manager = make_manager(failure_threshold=3)
+    for _ in range(5):
+        manager.record_result(PROXY, latency=0.1, error_kind="http_400")
+    health = manager.get_status()["health"][PROXY]
+    assert health["state"] == CLOSED
+    assert health["success_rate"] == 1.0
+    assert health["consecutive_failures"] == 0
+    assert health["errors"] == {"http_400": 5}
+
+
+def test_throttling_4xx_still_opens_circuit():
+    manager = make_manager(failure_threshold=3)
+    for _ in range(3):
+        manager.record_result(PROXY, latency=0.1, error_kind="http_403")
+    assert manager.get_status()["health"][PROXY]["state"] != CLOSED
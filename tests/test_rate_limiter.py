@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+import rate_limiter as rate_limiter_module
+from rate_limiter import RateLimiter
+
+RATE = 20.0
+
+
+def measure_throughput(identity_count, duration=1.0, workers=16):
+    """workers 个线程轮流使用 identity_count 个出口，返回每秒完成的请求数"""
+    limiter = RateLimiter(rate_per_second=RATE, burst=1)
+    identities = [f"http://proxy{index}.example.com:8080" for index in range(identity_count)]
+    counts = [0] * workers
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        identity = identities[index % identity_count]
+        while True:
+            limiter.acquire(identity)
+            if time.monotonic() >= deadline:
+                return
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration
+
+
+def test_aggregate_throughput_scales_linearly_with_identities():
+    for identity_count in (1, 2, 4, 8):
+        expected = RATE * identity_count
+        assert measure_throughput(identity_count) == pytest.approx(expected, rel=0.25)
+
+
+def test_reservations_queue_per_identity(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate_per_second=10.0, burst=1)
+
+    # 同一时刻的 8 个请求：一个出口时依次排开，8 个出口时全部立即发送
+    assert [limiter.reserve("a") for _ in range(4)] == pytest.approx([0.0, 0.1, 0.2, 0.3])
+    assert [limiter.reserve(f"p{index}") for index in range(8)] == [0.0] * 8
+
+    now[0] += 0.4
+    assert limiter.reserve("a") == pytest.approx(0.0)
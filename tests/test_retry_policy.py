@@ -0,0 +1,151 @@
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+import requests
+
+from retry_policy import RetryPolicy, classify_failure, retry_after_seconds
+
+NOW = 1_800_000_000.0
+
+
+def http_error(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status_code}", response=response)
+
+
+def httpx_error(status_code, headers=None):
+    request = httpx.Request("GET", "https://www.apple.com/hk-zh/shop/retail/pickup-message-recommendations")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+
+
+@pytest.mark.parametrize("error, kind, retry, throttle", [
+    (http_error(429), "http_429", True, True),
+    (httpx_error(429), "http_429", True, True),
+    (http_error(503), "http_503", True, False),
+    (httpx_error(500), "http_500", True, False),
+    (http_error(403), "http_403", True, True),
+    (http_error(404), "http_404", False, False),
+    (requests.ConnectionError("connection reset"), "error", True, False),
+    (httpx.ConnectError("connection refused"), "error", True, False),
+    (requests.Timeout("read timed out"), "timeout", True, False),
+    (httpx.ReadTimeout("read timed out"), "timeout", True, False),
+    (json.JSONDecodeError("Expecting value", "", 0), "decode_error", True, False),
+])
+def test_classification(error, kind, retry, throttle):
+    policy = RetryPolicy()
+    assert classify_failure(error) == kind
+    rule = policy.rule_for(kind)
+    assert (rule.retry, rule.throttle) == (retry, throttle)
+
+
+def test_forbidden_is_retried_only_through_another_identity():
+    policy = RetryPolicy()
+    assert policy.decide("http_403", ["A"], 0, 3, fleet_size=1, now=NOW) == (False, 0.0, "no_other_identity")
+    assert policy.decide("http_403", ["A"], 0, 3, fleet_size=2, now=NOW).retry
+    assert policy.decide("http_404", ["A"], 0, 3, fleet_size=2, now=NOW) == (False, 0.0, "not_retryable")
+
+
+def test_server_errors_do_not_pause_the_identity():
+    policy = RetryPolicy()
+    policy.observe("proxy-1", "http_503", fleet_size=2, now=NOW)
+    policy.observe("proxy-1", "timeout", fleet_size=2, now=NOW)
+    assert policy.identity_wait("proxy-1", now=NOW) == 0.0
+    assert policy.stats["throttled"] == 0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("7", 7.0),
+    ("1.5", 1.5),
+    ("-3", 0.0),
+    (format_datetime(datetime.fromtimestamp(NOW + 30, timezone.utc), usegmt=True), 30.0),
+    (format_datetime(datetime.fromtimestamp(NOW - 30, timezone.utc), usegmt=True), 0.0),
+    ("soon", None),
+])
+def test_retry_after_seconds_and_http_date(value, expected):
+    assert retry_after_seconds(http_error(429, {"Retry-After": value}), now=NOW) == expected
+    assert retry_after_seconds(httpx_error(429, {"Retry-After": value}), now=NOW) == expected
+
+
+def test_retry_after_missing():
+    assert retry_after_seconds(http_error(429), now=NOW) is None
+    assert retry_after_seconds(requests.ConnectionError("reset"), now=NOW) is None
+
+
+def test_throttled_identity_honors_retry_after():
+    policy = RetryPolicy(seed=1)
+    policy.observe("proxy-1", "http_429", retry_after=7, fleet_size=4, now=NOW)
+    assert policy.identity_wait("proxy-1", now=NOW) == 7.0
+    assert policy.identity_wait("proxy-2", now=NOW) == 0.0
+
+    # 恢复之前再次被限流：按退避增长，且不短于 Retry-After
+    policy.observe("proxy-1", "http_429", retry_after=7, fleet_size=4, now=NOW + 1)
+    assert policy.identity_wait("proxy-1", now=NOW + 1) >= 7.0
+
+    # 暂停结束后的成功请求清除出口状态
+    policy.observe("proxy-1", None, fleet_size=4, now=NOW + 200)
+    policy.observe("proxy-1", "http_429", retry_after=2, fleet_size=4, now=NOW + 201)
+    assert policy.identity_wait("proxy-1", now=NOW + 201) == 2.0
+
+
+@pytest.mark.parametrize("kind", ["timeout", "http_5xx", "http_429"])
+def test_decorrelated_jitter_bounds(kind):
+    policy = RetryPolicy(min_retries_per_minute=10000, seed=7)
+    rule = policy.rule_for(kind)
+    previous = rule.base
+    delays = []
+    for attempt in range(200):
+        delay = policy.decide(kind, ["A"], 0, 1, fleet_size=2, now=NOW).delay
+        assert rule.base <= delay <= min(rule.cap, previous * 3)
+        delays.append(delay)
+        previous = delay
+    # 随机取值，且能增长到上限附近
+    assert len(set(delays)) > 100
+    assert max(delays) > rule.cap * 0.8
+
+    # 成功后重新从 base 开始
+    policy.model_succeeded(["A"])
+    assert policy.decide(kind, ["A"], 0, 1, fleet_size=2, now=NOW).delay <= rule.base * 3
+
+
+def test_global_cooldown_is_triggered_and_cleared():
+    policy = RetryPolicy(cooldown_threshold=3, fleet_fraction=0.5, base_cooldown=10.0, max_cooldown=300.0, seed=3)
+    for index in range(4):
+        policy.observe(f"proxy-{index}", None, fleet_size=4, now=NOW)
+
+    # 只有一个出口被限流：暂停该出口，不进入全局冷却
+    for offset in range(3):
+        policy.observe("proxy-0", "http_429", fleet_size=4, now=NOW + offset)
+    assert policy.cooldown_remaining(now=NOW + 2) == 0.0
+    assert policy.identity_wait("proxy-1", now=NOW + 2) == 0.0
+
+    # 一半出口被限流：进入全局冷却，所有出口暂停，重试被拒绝
+    policy.observe("proxy-1", "http_429", fleet_size=4, now=NOW + 3)
+    remaining = policy.cooldown_remaining(now=NOW + 3)
+    assert 10.0 <= remaining <= 30.0
+    assert policy.stats["cooldowns"] == 1
+    assert policy.identity_wait("proxy-3", now=NOW + 3) == pytest.approx(remaining)
+    assert policy.decide("http_503", ["A"], 0, 3, fleet_size=4, now=NOW + 3) == (False, 0.0, "cooldown")
+
+    # 冷却结束后的成功请求清除冷却状态
+    end = NOW + 3 + remaining
+    policy.observe("proxy-3", None, fleet_size=4, now=end + 1)
+    assert policy.cooldown_remaining(now=end + 1) == 0.0
+    assert policy.identity_wait("proxy-3", now=end + 1) == 0.0
+    assert policy.decide("http_503", ["A"], 0, 3, fleet_size=4, now=end + 1).retry
+    assert policy.get_status()["cooldown_remaining"] == 0.0
+
+
+def test_sporadic_throttling_does_not_trigger_cooldown():
+    policy = RetryPolicy(cooldown_threshold=3, throttle_ratio=0.3, seed=3)
+    # 大量成功请求中夹杂的少量 429 只暂停对应出口
+    for index in range(100):
+        policy.observe(f"proxy-{index % 4}", None, fleet_size=4, now=NOW + index * 0.1)
+    for index in range(4):
+        policy.observe(f"proxy-{index}", "http_429", fleet_size=4, now=NOW + 10)
+    assert policy.cooldown_remaining(now=NOW + 10) == 0.0
@@ -0,0 +1,46 @@
+import threading
+
+from session_pool import SessionPool
+
+
+def test_reuse_counts_come_from_connection_pool(mock_server):
+    _, _, base_url = mock_server
+    pool = SessionPool()
+    for _ in range(3):
+        with pool.session() as session:
+            session.get(base_url + "/_mock/stats", timeout=5)
+    stats = pool.get_stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+
+
+def test_retired_session_closes_after_release(mock_server):
+    _, _, base_url = mock_server
+    pool = SessionPool()
+    session = pool.acquire()
+    closed = threading.Event()
+    original_close = session.close
+    session.close = lambda: (closed.set(), original_close())
+
+    # 连接池参数变化时借出中的会话只从池中摘下，不关闭
+    pool.configure(pool_size=3)
+    assert not closed.is_set()
+    assert pool.get_stats()["retiring_sessions"] == 1
+    assert session.get(base_url + "/_mock/stats", timeout=5).status_code == 200
+    assert pool.acquire() is not session
+
+    pool.release(session)
+    assert closed.is_set()
+    assert pool.get_stats()["retiring_sessions"] == 0
+
+
+def test_idle_eviction_skips_sessions_in_use():
+    pool = SessionPool(idle_timeout=0)
+    session = pool.acquire()
+    pool.evict_idle()
+    assert pool.acquire() is session
+    pool.release(session)
+    pool.release(session)
+    pool.evict_idle()
+    assert pool.get_stats()["active_sessions"] == 0
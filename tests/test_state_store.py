@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from state_store import SingleFlight, StateStore
+
+STOCK = [{"store": "Apple Central", "status": "今天可取货", "available": True}]
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    outcomes = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            outcomes[index] = ("ok", target())
+        except Exception as e:
+            outcomes[index] = ("error", e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_run_once():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    outcomes = run_concurrently(8, lambda: flights.call("A", fetch))
+    assert calls == [1]
+    assert outcomes == [("ok", "result")] * 8
+    assert flights.merged == 7
+    assert flights.in_flight() == []
+
+
+def test_exception_is_passed_to_every_waiter():
+    flights = SingleFlight()
+    calls = []
+    error = RuntimeError("upstream failed")
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        raise error
+
+    outcomes = run_concurrently(8, lambda: flights.call("A", fetch))
+    assert calls == [1]
+    assert outcomes == [("error", error)] * 8
+    # 失败后键被释放，下一次调用重新执行
+    assert flights.call("A", lambda: "retried") == "retried"
+
+
+def test_acquire_merges_busy_keys_and_wait_returns_after_release():
+    flights = SingleFlight()
+    assert flights.acquire(["A", "B"]) == ["A", "B"]
+    assert flights.acquire(["A", "C"]) == ["C"]
+    assert not flights.wait("A", timeout=0.05)
+    threading.Timer(0.05, flights.release, args=(["A"],)).start()
+    assert flights.wait("A", timeout=2)
+
+
+def test_reader_keeps_unchanged_snapshot_across_writes():
+    store = StateStore()
+    first = store.publish({"A": []}, "2026-10-17 10:00:00")
+    reader = store.snapshot()
+
+    second = store.publish({"A": STOCK}, "2026-10-17 10:00:03")
+    assert second.version == first.version + 1
+    # 读取方持有的旧快照不受写入影响，也不能被修改
+    assert reader is first
+    assert reader.stock["A"] == [] and reader.last_updated["A"] == "2026-10-17 10:00:00"
+    with pytest.raises(TypeError):
+        reader.stock["A"] = STOCK
+    assert store.snapshot().stock["A"] == STOCK
+    assert store.models_since(first.version) == ["A"]
+    assert store.models_since(second.version) == []
@@ -0,0 +1,85 @@
+import time
+
+
+def test_version_is_seeded_from_boot_time(stock_app):
+    # 非查询进程角色的版本号同样从启动时的毫秒时间开始，重启后不会与之前的 ETag 重复
+    client = stock_app.app.test_client()
+    response = client.get("/api/stock")
+    version = response.get_json()["version"]
+    assert version > 1_000_000_000_000
+    assert version <= time.time() * 1000
+    assert response.headers["ETag"] == f'"{version}"'
+
+    assert client.get("/api/stock", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+ORANGE_256 = "iPhone 17 Pro Max 256GB - 宇宙橙"
+ORANGE_512 = "iPhone 17 Pro Max 512GB - 宇宙橙"
+BLUE_256 = "iPhone 17 Pro Max 256GB - 深墨蓝"
+NEAR = "测试门店 近"
+FAR = "测试门店 远"
+
+
+def stores(near, far):
+    return [
+        {"store": NEAR, "status": "今天可取货" if near else "暂无供应", "available": near},
+        {"store": FAR, "status": "明天可取货" if far else "暂无供应", "available": far},
+    ]
+
+
+def test_index_routes_follow_change_and_revert(stock_app):
+    client = stock_app.app.test_client()
+    stock_app.publish_results({ORANGE_256: stores(False, False), ORANGE_512: stores(True, False),
+                               BLUE_256: stores(False, True)}, remote=True)
+    blue = stock_app.stock_index._by_model[BLUE_256]
+
+    def store_models(store):
+        response = client.get(f"/api/stores/{store}/available")
+        return [(entry["model"], entry["status"]) for entry in response.get_json()["models"]]
+
+    def available(**filters):
+        response = client.get("/api/available", query_string=filters)
+        assert response.status_code == 200
+        return {entry["model"]: [item["store"] for item in entry["stores"]] for entry in response.get_json()["models"]}
+
+    def first(model, **query):
+        body = client.get(f"/api/models/{model}/first-available", query_string=query).get_json()
+        return body["store"], body["status"]
+
+    assert store_models(NEAR) == [(ORANGE_512, "今天可取货")]
+    assert available(color="宇宙橙", capacity="256GB") == {}
+    assert first(ORANGE_256) == (None, None)
+
+    # 256GB 宇宙橙在两家门店补货
+    stock_app.publish_results({ORANGE_256: stores(True, True)}, remote=True)
+    assert store_models(NEAR) == [(ORANGE_256, "今天可取货"), (ORANGE_512, "今天可取货")]
+    assert store_models(FAR) == [(ORANGE_256, "明天可取货"), (BLUE_256, "明天可取货")]
+    assert available(color="宇宙橙", capacity="256GB") == {ORANGE_256: [NEAR, FAR]}
+    assert available(series="iPhone 17 Pro Max", capacity="256GB") == {ORANGE_256: [NEAR, FAR], BLUE_256: [FAR]}
+    assert first(ORANGE_256) == (NEAR, "今天可取货")
+    assert first(ORANGE_256, stores=f"{FAR},{NEAR}") == (FAR, "明天可取货")
+    # 未变化的型号不重建
+    assert stock_app.stock_index._by_model[BLUE_256] is blue
+
+    # 恢复原状
+    stock_app.publish_results({ORANGE_256: stores(False, False)}, remote=True)
+    assert store_models(NEAR) == [(ORANGE_512, "今天可取货")]
+    assert store_models(FAR) == [(BLUE_256, "明天可取货")]
+    assert available(color="宇宙橙", capacity="256GB") == {}
+    assert available(series="iPhone 17 Pro Max", capacity="256GB") == {BLUE_256: [FAR]}
+    assert first(ORANGE_256) == (None, None)
+    assert stock_app.stock_index._by_model[BLUE_256] is blue
+
+
+def test_index_routes_with_unknown_values(stock_app):
+    client = stock_app.app.test_client()
+    assert client.get("/api/stores/Apple Nowhere/available").status_code == 404
+    assert client.get("/api/models/iPhone 99/first-available").status_code == 404
+    assert client.get("/api/available", query_string={"region": "zz"}).status_code == 404
+    for filters in ({"color": "不存在的颜色"}, {"capacity": "3TB"}, {"series": "iPhone 1"}):
+        response = client.get("/api/available", query_string=filters)
+        assert response.status_code == 200
+        assert response.get_json()["models"] == []
+    response = client.get(f"/api/models/{ORANGE_256}/first-available", query_string={"stores": "Apple Nowhere"})
+    assert response.status_code == 200
+    assert (response.get_json()["store"], response.get_json()["status"]) == (None, None)
@@ -0,0 +1,66 @@
+from state_store import StateStore
+from stock_index import StockIndex
+
+CENTRAL = "Apple Central"
+IFC = "Apple ifc mall"
+
+
+def stores(central, ifc):
+    return [
+        {"store": CENTRAL, "status": "今天可取货" if central else "暂无供应", "available": central},
+        {"store": IFC, "status": "明天可取货" if ifc else "暂无供应", "available": ifc},
+    ]
+
+
+def test_change_and_revert_update_only_the_changed_model():
+    state = StateStore()
+    index = StockIndex()
+    index.update(state.publish({"A": stores(True, False), "B": stores(False, True)}, "2026-10-17 10:00:00"))
+    by_model_b = index._by_model["B"]
+    assert index.store_available(CENTRAL) == {"A": "今天可取货"}
+    assert index.store_available(IFC) == {"B": "明天可取货"}
+
+    # A 在 ifc mall 补货
+    snapshot = state.publish({"A": stores(True, True)}, "2026-10-17 10:00:03")
+    index.update(snapshot, ["A"])
+    assert index.store_available(IFC) == {"B": "明天可取货", "A": "明天可取货"}
+    assert index.model_available("A") == [(CENTRAL, "今天可取货"), (IFC, "明天可取货")]
+    assert index._by_model["B"] is by_model_b
+    assert index.version == snapshot.version
+
+    # 恢复原状：门店与型号两张表都回到变化前
+    snapshot = state.publish({"A": stores(True, False)}, "2026-10-17 10:00:06")
+    index.update(snapshot, ["A"])
+    assert index.store_available(CENTRAL) == {"A": "今天可取货"}
+    assert index.store_available(IFC) == {"B": "明天可取货"}
+    assert index.available_models() == {"A": [(CENTRAL, "今天可取货")], "B": [(IFC, "明天可取货")]}
+    assert index._by_model["B"] is by_model_b
+    assert index.first_available("A") == (CENTRAL, "今天可取货")
+    assert index.first_available("A", [IFC]) is None
+
+
+def test_failed_query_and_stale_snapshot():
+    state = StateStore()
+    index = StockIndex()
+    old = state.publish({"A": stores(True, False)}, "2026-10-17 10:00:00")
+    index.update(old, ["A"])
+    failed = state.publish({"A": {"error": "超时"}}, "2026-10-17 10:00:03")
+    index.update(failed, ["A"])
+    # 查询失败不认为有货，但门店仍然已知
+    assert index.store_available(CENTRAL) == {}
+    assert index.stores() == {CENTRAL: 0, IFC: 0}
+    # 晚到的旧快照不会覆盖较新的数据
+    index.update(old, ["A"])
+    assert index.model_available("A") == []
+    assert index.version == failed.version
+
+
+def test_unknown_values_return_empty_results():
+    index = StockIndex()
+    index.update(StateStore().publish({"A": stores(True, False)}, "2026-10-17 10:00:00"))
+    assert not index.has_store("Apple Nowhere")
+    assert index.store_available("Apple Nowhere") == {}
+    assert index.model_available("Z") == []
+    assert index.first_available("Z") is None
+    assert index.first_available("A", ["Apple Nowhere"]) is None
+    assert index.available_models({"Z"}) == {}
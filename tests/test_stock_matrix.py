@@ -0,0 +1,23 @@
+from state_store import StateStore
+from stock_matrix import StockMatrixReader, StockMatrixWriter
+
+MODELS = ["A", "B"]
+STOCK = [{"store": "Apple Central", "status": "今天可取货", "available": True}]
+
+
+def test_older_snapshot_is_not_published(tmp_path):
+    path = str(tmp_path / "matrix.bin")
+    writer = StockMatrixWriter(path, MODELS)
+    store = StateStore()
+    old = store.publish({"A": []}, "2026-10-17 10:00:00")
+    new = store.publish({"A": STOCK}, "2026-10-17 10:00:03")
+
+    assert writer.publish(new)
+    # 较早的快照（如并发写入时晚到的一方）不会覆盖较新的状态
+    assert not writer.publish(old)
+    assert not writer.publish(new)
+    reader = StockMatrixReader(path)
+    assert reader.read()["version"] == new.version
+    assert reader.available() == {"A": ["Apple Central"]}
+    reader.close()
+    writer.close()
@@ -0,0 +1,113 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from stock_stream import StockStream
+from stream_server import StreamServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def open_stream(port, path="/api/stream"):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode("ascii"))
+    return sock
+
+
+def read_until(sock, marker):
+    data = b""
+    while marker not in data:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_many_subscribers_share_one_thread():
+    stream = StockStream()
+    server = StreamServer(stream, lambda: {"stock": {}})
+    port = server.start()
+    threads = threading.active_count()
+    sockets = [open_stream(port) for _ in range(200)]
+    try:
+        for sock in sockets:
+            assert b"event: snapshot" in read_until(sock, b"\n\n")
+        assert stream.subscribers == 200
+        # 订阅者不占用线程
+        assert threading.active_count() == threads
+
+        stream.publish("update", {"model": "A"})
+        for sock in sockets:
+            assert b'event: update\ndata: {"model":"A"}' in read_until(sock, b'"A"}\n\n')
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.stop()
+
+
+def test_resumes_from_last_event_id_and_rejects_other_paths():
+    stream = StockStream()
+    stream.publish("update", {"model": "A"})
+    stream.publish("update", {"model": "B"})
+    server = StreamServer(stream, lambda: {"stock": {}})
+    port = server.start()
+    try:
+        sock = open_stream(port, "/api/stream?since=1")
+        data = read_until(sock, b'"B"}\n\n')
+        assert b"snapshot" not in data and b'"A"' not in data
+        sock.close()
+
+        sock = open_stream(port, "/api/stock")
+        assert read_until(sock, b"\r\n").startswith(b"HTTP/1.1 404")
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_open_streams_do_not_block_web_worker(tmp_path):
+    # 与生产部署相同：gunicorn gthread 工作进程，处理线程数远少于打开的推送连接数
+    port, stream_port = free_port(), free_port()
+    env = dict(os.environ, STOCK_BIND=f"127.0.0.1:{port}", STOCK_STREAM_BIND=f"127.0.0.1:{stream_port}",
+               STOCK_WEB_WORKERS="1", STOCK_POLLER_EXTERNAL="1",
+               STOCK_SHARED_STATE=str(tmp_path / "state.json"), STOCK_HISTORY_ENABLED="0")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    sockets = []
+    try:
+        deadline = time.time() + 20
+        while True:
+            try:
+                requests.get(f"{base}/api/stock", timeout=1)
+                break
+            except requests.RequestException:
+                assert time.time() < deadline, "gunicorn 未能启动"
+                time.sleep(0.2)
+
+        redirect = requests.get(f"{base}/api/stream?since=5", allow_redirects=False, timeout=5)
+        assert redirect.status_code == 307
+        assert redirect.headers["Location"] == f"http://127.0.0.1:{stream_port}/api/stream?since=5"
+
+        for _ in range(50):
+            sockets.append(open_stream(stream_port))
+        for sock in sockets:
+            assert b"event: snapshot" in read_until(sock, b"\n\n")
+        for path in ("/api/stock", "/api/config", "/"):
+            assert requests.get(base + path, timeout=5).status_code == 200
+    finally:
+        for sock in sockets:
+            sock.close()
+        process.terminate()
+        process.wait(10)
@@ -0,0 +1,32 @@
+import threading
+import time
+
+from sweep import Sweep, CANCELLED, EXPIRED
+
+
+def test_sleep_is_capped_by_deadline():
+    sweep = Sweep(1, "thread", ["A"], 1, deadline_seconds=0.2)
+    started = time.time()
+    assert not sweep.sleep(300)
+    assert time.time() - started < 1.0
+    assert sweep.finish() == ["A"]
+    assert sweep.state == EXPIRED
+
+
+def test_sleep_returns_when_cancelled():
+    sweep = Sweep(1, "thread", ["A"], 1)
+    threading.Timer(0.1, sweep.cancel).start()
+    started = time.time()
+    assert not sweep.sleep(300)
+    assert time.time() - started < 1.0
+    sweep.finish()
+    assert sweep.state == CANCELLED
+
+
+def test_delay_request_respects_sweep_deadline(stock_app, monkeypatch):
+    # 全局冷却可达数分钟，属于某一轮查询时等待不超过截止时间，到期后不再发送
+    monkeypatch.setattr(stock_app.retry_policy, "identity_wait", lambda identity: 300.0)
+    sweep = Sweep(1, "thread", ["A"], 1, deadline_seconds=0.2)
+    started = time.time()
+    assert not stock_app.delay_request(None, sweep)
+    assert time.time() - started < 1.0
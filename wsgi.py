@@ -0,0 +1,13 @@
+"""
+生产部署的 WSGI 入口
+web 进程只从共享快照提供数据，不向上游发请求；需要查询进程处理的请求会被转发到 STOCK_POLLER_URL
+
+示例:
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+import os
+
+os.environ.setdefault("STOCK_ROLE", "web")
+
+from app import app as application